@@ -0,0 +1,42 @@
+"""
+Время рендеринга виджета пагинатора в зависимости от числа страниц.
+
+Запуск из корня репозитория: python benchmarks/paginator_widget.py
+Время и размер ответа должны оставаться постоянными при росте ленты.
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'yatube'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.core.paginator import Paginator  # noqa: E402
+from django.template.loader import get_template  # noqa: E402
+
+PER_PAGE = 10
+REPEAT = 200
+
+
+def main():
+    template = get_template('posts/includes/paginator.html')
+    print(f'{"страниц":>12} {"мс на рендер":>14} {"байт":>8}')
+    for num_pages in [10, 10 ** 3, 10 ** 5, 2 * 10 ** 5, 10 ** 7]:
+        # range() даёт len() и срезы без материализации объектов.
+        paginator = Paginator(range(num_pages * PER_PAGE), PER_PAGE)
+        page = paginator.page(num_pages // 2)
+        context = {'page_obj': page}
+        html = template.render(context)
+        seconds = timeit.timeit(
+            lambda: template.render(context), number=REPEAT
+        )
+        print(f'{num_pages:>12} {seconds / REPEAT * 1000:>14.3f} '
+              f'{len(html):>8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Поиск по обратному индексу против перебора LIKE '%слово%' в SQLite.
+
+Запуск из корня репозитория: python benchmarks/search_index.py
+Время запроса к индексу растёт с числом найденных постов, а не со всей
+базой, как у LIKE. При открытии читается только словарь: списки id
+остаются в mmap до запроса.
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'yatube'))
+
+from posts.inverted_index import InvertedIndex  # noqa: E402
+
+WORDS_PER_POST = 30
+VOCABULARY = 20000
+QUERIES = ['кошка', 'кош мол', 'слово1234', 'редк']
+REPEAT = 20
+
+
+def make_words(count):
+    random.seed(1)
+    syllables = 'ка ло ми ру та не по ша до ре вы жи ко ну за бе'.split()
+    words = {
+        ''.join(random.choices(syllables, k=random.randint(2, 4)))
+        for _ in range(count)
+    }
+    return sorted(words) + ['кошка', 'молоко', 'редкость', 'слово1234']
+
+
+def make_posts(count, words):
+    # Частота слов по Ципфу: несколько частых, длинный хвост редких.
+    weights = [1 / rank for rank in range(1, len(words) + 1)]
+    for pk in range(1, count + 1):
+        yield pk, ' '.join(
+            random.choices(words, weights, k=WORDS_PER_POST)
+        )
+
+
+def like_search(connection, query):
+    terms = query.split()
+    return connection.execute(
+        'SELECT id FROM post WHERE '
+        + ' AND '.join(['text LIKE ?'] * len(terms))
+        + ' ORDER BY id DESC', [f'%{term}%' for term in terms]
+    ).fetchall()
+
+
+def per_query(function):
+    return timeit.timeit(function, number=REPEAT) / REPEAT * 1000
+
+
+def main():
+    words = make_words(VOCABULARY)
+    print(f'{"постов":>8} {"сборка, с":>10} {"открытие, мс":>13} '
+          f'{"индекс, мс":>11} {"LIKE, мс":>9} {"файл, КБ":>9}')
+    for count in [10 ** 3, 10 ** 4, 10 ** 5]:
+        posts = list(make_posts(count, words))
+        connection = sqlite3.connect(':memory:')
+        connection.execute('CREATE TABLE post (id INTEGER PRIMARY KEY, '
+                           'text TEXT)')
+        connection.executemany('INSERT INTO post VALUES (?, ?)', posts)
+        with tempfile.TemporaryDirectory() as directory:
+            started = time.perf_counter()
+            InvertedIndex(directory).rebuild(posts)
+            built = time.perf_counter() - started
+            opened = per_query(lambda: InvertedIndex(directory))
+            index = InvertedIndex(directory)
+            indexed = sum(
+                per_query(lambda: index.search(query)) for query in QUERIES
+            ) / len(QUERIES)
+            size = os.path.getsize(os.path.join(directory, 'index'))
+        scanned = sum(
+            per_query(lambda: like_search(connection, query))
+            for query in QUERIES
+        ) / len(QUERIES)
+        print(f'{count:>8} {built:>10.2f} {opened:>13.2f} '
+              f'{indexed:>11.3f} {scanned:>9.3f} {size // 1024:>9}')
+
+
+if __name__ == '__main__':
+    main()
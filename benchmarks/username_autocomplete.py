@@ -0,0 +1,66 @@
+"""
+Подсказки имён пользователей: время запроса и память индекса.
+
+Запуск из корня репозитория: python benchmarks/username_autocomplete.py
+Запрос должен укладываться в доли миллисекунды и для миллиона имён, даже
+по одной букве, под которую подходит каждое двадцатое имя.
+"""
+import os
+import random
+import string
+import sys
+import time
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'yatube'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from users.autocomplete import Snapshot  # noqa: E402
+
+PREFIXES = ['a', 'ro', 'rom', 'roman_1', 'zzzz']
+LIMIT = 10
+REPEAT = 1000
+
+
+def make_users(count):
+    random.seed(1)
+    alphabet = string.ascii_lowercase + string.digits + '_'
+    for pk in range(1, count + 1):
+        username = random.choice(string.ascii_letters) + ''.join(
+            random.choices(alphabet, k=random.randint(3, 14))
+        )
+        # Подписчиков мало у всех, кроме редких популярных авторов.
+        yield pk, username, int(random.paretovariate(1.2)) - 1
+
+
+def main():
+    print(f'{"имён":>9} {"сборка, с":>10} {"память, МБ":>11} '
+          f'{"запрос, мс":>11} {"худший, мс":>11}')
+    for count in [10 ** 4, 10 ** 5, 10 ** 6]:
+        users = list(make_users(count))
+        started = time.perf_counter()
+        snapshot = Snapshot(users)
+        built = time.perf_counter() - started
+        # Память — отдельной сборкой: tracemalloc замедляет её в разы.
+        tracemalloc.start()
+        retained = Snapshot(users)
+        memory = tracemalloc.get_traced_memory()[0] / 2 ** 20
+        tracemalloc.stop()
+        del retained
+        timings = [
+            timeit.timeit(
+                lambda: snapshot.top(prefix, LIMIT), number=REPEAT
+            ) / REPEAT * 1000
+            for prefix in PREFIXES
+        ]
+        print(f'{count:>9} {built:>10.2f} {memory:>11.1f} '
+              f'{sum(timings) / len(timings):>11.3f} {max(timings):>11.3f}')
+
+
+if __name__ == '__main__':
+    main()
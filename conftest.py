@@ -0,0 +1,22 @@
+import pytest
+
+from core.test_runner import temporary_cache
+
+
+@pytest.fixture(autouse=True, scope='session')
+def isolated_cache(django_test_environment):
+    """Кеш тестов во временном файле, как у manage.py test."""
+    with temporary_cache():
+        yield
+
+
+@pytest.fixture(autouse=True)
+def synchronous_thumbnails(settings):
+    """
+    Миниатюры создаются сразу после коммита, в потоке теста.
+
+    Тесты с transaction=True выполняют on_commit, а фикстура mock_media
+    удаляет временный MEDIA_ROOT раньше, чем возвращает настройку, так
+    что posts.thumbnails не успевает остановить пул при её смене.
+    """
+    settings.THUMBNAIL_WORKERS = 0
@@ -0,0 +1,305 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# Ограничение SQLite на число параметров в одном запросе.
+MAX_VARIABLES = 999
+# Лишние записи вычищаются раз в столько записей процесса.
+CULL_EVERY = 100
+INTEGER_RANGE = range(-2 ** 63, 2 ** 63)
+# UPSERT есть в SQLite с 3.24, RETURNING — с 3.35. На более старых add и
+# incr читают и пишут в одной транзакции BEGIN IMMEDIATE.
+RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+INCR_SQL = (
+    'UPDATE cache SET value = value + ? WHERE key = ? '
+    "AND typeof(value) = 'integer' "
+    'AND (expires IS NULL OR expires > ?)'
+)
+
+
+class LocalTier:
+    """
+    Маленький LRU-кеш в памяти процесса перед общим хранилищем.
+
+    Записи живут не дольше local_timeout секунд: столько другой процесс
+    может видеть старое значение после записи через соседний процесс.
+    """
+
+    def __init__(self, max_entries, local_timeout):
+        self.max_entries = max_entries
+        self.local_timeout = local_timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, stored, expires):
+        if not self.max_entries:
+            return
+        local_expires = time.time() + self.local_timeout
+        if expires is not None:
+            local_expires = min(local_expires, expires)
+        with self._lock:
+            self._data[key] = (stored, local_expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class SQLiteCache(BaseCache):
+    """
+    Общий для всех процессов кеш в файле SQLite.
+
+    LOCATION — путь к файлу. Целые числа хранятся как INTEGER, так что
+    incr выполняется одним UPDATE и атомарен между процессами; остальное
+    хранится в pickle. get_many читает все ключи одним запросом. Перед
+    файлом стоит LRU-кеш процесса (OPTIONS LOCAL_MAX_ENTRIES и
+    LOCAL_TIMEOUT; LOCAL_MAX_ENTRIES=0 его отключает).
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.path = location
+        self.local = LocalTier(
+            options.get('LOCAL_MAX_ENTRIES', 1000),
+            options.get('LOCAL_TIMEOUT', 1),
+        )
+        self._connections = threading.local()
+        self._writes = 0
+
+    @property
+    def connection(self):
+        # Соединение своё у каждого потока и у каждого процесса после fork.
+        connection = getattr(self._connections, 'connection', None)
+        if (connection is None
+                or self._connections.pid != os.getpid()):
+            connection = sqlite3.connect(
+                self.path, timeout=30, isolation_level=None,
+                check_same_thread=False,
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'key TEXT PRIMARY KEY, value BLOB, expires REAL)'
+            )
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)'
+            )
+            self._connections.connection = connection
+            self._connections.pid = os.getpid()
+        return connection
+
+    @staticmethod
+    def _encode(value):
+        if type(value) is int and value in INTEGER_RANGE:
+            return value
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _decode(stored):
+        if type(stored) is int:
+            return stored
+        return pickle.loads(stored)
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        stored = self.local.get(key)
+        if stored is not None:
+            return self._decode(stored)
+        row = self.connection.execute(
+            'SELECT value, expires FROM cache WHERE key = ?', [key]
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return default
+        self.local.set(key, row[0], row[1])
+        return self._decode(row[0])
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        found = {}
+        missing = []
+        for key in keys:
+            stored = self.local.get(key)
+            if stored is None:
+                missing.append(key)
+            else:
+                found[keys[key]] = self._decode(stored)
+        now = time.time()
+        for start in range(0, len(missing), MAX_VARIABLES):
+            chunk = missing[start:start + MAX_VARIABLES]
+            rows = self.connection.execute(
+                'SELECT key, value, expires FROM cache WHERE key IN '
+                f'({", ".join("?" * len(chunk))})', chunk
+            )
+            for key, stored, expires in rows:
+                if expires is not None and expires <= now:
+                    continue
+                self.local.set(key, stored, expires)
+                found[keys[key]] = self._decode(stored)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        rows = [
+            (self._key(key, version), self._encode(value), expires)
+            for key, value in data.items()
+        ]
+        connection = self.connection
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.executemany(
+                'INSERT OR REPLACE INTO cache (key, value, expires) '
+                'VALUES (?, ?, ?)', rows
+            )
+        for key, stored, _ in rows:
+            self.local.set(key, stored, expires)
+        self._wrote(len(rows))
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        stored = self._encode(value)
+        expires = self.get_backend_timeout(timeout)
+        if RETURNING:
+            added = self.connection.execute(
+                'INSERT INTO cache (key, value, expires) VALUES (?, ?, ?) '
+                'ON CONFLICT (key) DO UPDATE SET '
+                'value = excluded.value, expires = excluded.expires '
+                'WHERE cache.expires IS NOT NULL AND cache.expires <= ?',
+                [key, stored, expires, time.time()]
+            ).rowcount == 1
+        else:
+            added = self._add_in_transaction(key, stored, expires)
+        if added:
+            self.local.set(key, stored, expires)
+            self._wrote(1)
+        return added
+
+    def _add_in_transaction(self, key, stored, expires):
+        connection = self.connection
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            row = connection.execute(
+                'SELECT expires FROM cache WHERE key = ?', [key]
+            ).fetchone()
+            if row is not None and (row[0] is None or row[0] > time.time()):
+                return False
+            connection.execute(
+                'INSERT OR REPLACE INTO cache (key, value, expires) '
+                'VALUES (?, ?, ?)', [key, stored, expires]
+            )
+        return True
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        self.local.delete(key)
+        return self.connection.execute(
+            'UPDATE cache SET expires = ? WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            [self.get_backend_timeout(timeout), key, time.time()]
+        ).rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        if RETURNING:
+            row = self.connection.execute(
+                f'{INCR_SQL} RETURNING value, expires',
+                [delta, key, time.time()]
+            ).fetchone()
+        else:
+            row = self._incr_in_transaction(key, delta)
+        if row is None:
+            self.local.delete(key)
+            raise ValueError(f"Key '{key}' not found")
+        self.local.set(key, row[0], row[1])
+        return row[0]
+
+    def _incr_in_transaction(self, key, delta):
+        connection = self.connection
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            if not connection.execute(
+                    INCR_SQL, [delta, key, time.time()]).rowcount:
+                return None
+            return connection.execute(
+                'SELECT value, expires FROM cache WHERE key = ?', [key]
+            ).fetchone()
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version)
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        for key in keys:
+            self.local.delete(key)
+        connection = self.connection
+        for start in range(0, len(keys), MAX_VARIABLES):
+            chunk = keys[start:start + MAX_VARIABLES]
+            connection.execute(
+                'DELETE FROM cache WHERE key IN '
+                f'({", ".join("?" * len(chunk))})', chunk
+            )
+
+    def has_key(self, key, version=None):
+        return self.get(key, self, version) is not self
+
+    def clear(self):
+        self.local.clear()
+        self.connection.execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        """Соединения живут весь поток: открывать их на запрос дорого."""
+
+    def _wrote(self, count):
+        # Чистим не на каждую запись: COUNT(*) по таблице не бесплатен.
+        self._writes += count
+        if self._writes >= CULL_EVERY:
+            self._writes = 0
+            self._cull()
+
+    def _cull(self):
+        connection = self.connection
+        connection.execute(
+            'DELETE FROM cache WHERE expires <= ?', [time.time()]
+        )
+        count = connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count > self._max_entries:
+            # Первыми уходят записи, которые и так истекут раньше других.
+            connection.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+                'ORDER BY expires IS NULL, expires LIMIT ?)',
+                [count // self._cull_frequency if self._cull_frequency
+                 else count]
+            )
@@ -0,0 +1,41 @@
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+SQLITE_CACHE = 'core.cache.SQLiteCache'
+
+
+@contextmanager
+def temporary_cache():
+    """Кеши SQLiteCache на время тестов переезжают во временный каталог."""
+    directory = tempfile.mkdtemp(prefix='yatube-cache-')
+    caches = {
+        alias: {
+            **config,
+            'LOCATION': os.path.join(directory, f'{alias}.sqlite3'),
+        } if config['BACKEND'] == SQLITE_CACHE else config
+        for alias, config in settings.CACHES.items()
+    }
+    try:
+        with override_settings(CACHES=caches):
+            yield
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+class TestRunner(DiscoverRunner):
+    """Тесты не трогают общий cache.sqlite3 запущенного сайта."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._temporary_cache = temporary_cache()
+        self._temporary_cache.__enter__()
+
+    def teardown_test_environment(self, **kwargs):
+        self._temporary_cache.__exit__(None, None, None)
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,108 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from .cache import SQLiteCache
+
+INCREMENTS = 200
+
+
+def make_cache(path, **options):
+    return SQLiteCache(path, {'OPTIONS': options})
+
+
+def increment(path):
+    cache = make_cache(path)
+    for _ in range(INCREMENTS):
+        cache.incr('hits')
+
+
+class SQLiteCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cache.sqlite3')
+        self.cache = make_cache(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_set_get_and_expiry(self):
+        self.cache.set('post', {'text': 'Пост'})
+        self.cache.set('short', 1, 0.05)
+        self.assertEqual(self.cache.get('post'), {'text': 'Пост'})
+        time.sleep(0.1)
+        self.assertIsNone(self.cache.get('short'))
+
+    def test_add_keeps_live_value(self):
+        self.assertTrue(self.cache.add('key', 1))
+        self.assertFalse(self.cache.add('key', 2))
+        self.assertEqual(self.cache.get('key'), 1)
+
+    def test_add_replaces_expired_value(self):
+        self.cache.set('key', 1, 0.05)
+        time.sleep(0.1)
+        self.assertTrue(self.cache.add('key', 2))
+        self.assertEqual(self.cache.get('key'), 2)
+
+    def test_get_many(self):
+        self.cache.set_many({'a': 1, 'b': 'два'})
+        self.assertEqual(
+            self.cache.get_many(['a', 'b', 'c']), {'a': 1, 'b': 'два'}
+        )
+
+    def test_incr_requires_existing_integer(self):
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+        self.cache.set('count', 10)
+        self.assertEqual(self.cache.incr('count', -3), 7)
+
+    def test_processes_share_entries(self):
+        """Запись, удаление и clear одного процесса видны другому."""
+        other = make_cache(self.path, LOCAL_MAX_ENTRIES=0)
+        self.cache.set('key', 'value')
+        self.assertEqual(other.get('key'), 'value')
+        other.delete('key')
+        self.cache.local.clear()
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_incr_is_atomic_across_processes(self):
+        self.cache.set('hits', 0)
+        context = multiprocessing.get_context('fork')
+        workers = [
+            context.Process(target=increment, args=[self.path])
+            for _ in range(4)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.cache.local.clear()
+        self.assertEqual(self.cache.get('hits'), 4 * INCREMENTS)
+
+    def test_local_tier_is_lru(self):
+        cache = make_cache(self.path, LOCAL_MAX_ENTRIES=2)
+        cache.set_many({'a': 1, 'b': 2})
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(list(cache.local._data), [
+            cache.make_key('a'), cache.make_key('c')
+        ])
+
+    def test_cull_keeps_max_entries(self):
+        cache = SQLiteCache(self.path, {'OPTIONS': {'MAX_ENTRIES': 50}})
+        for i in range(300):
+            cache.set(f'key{i}', i)
+        count = cache.connection.execute(
+            'SELECT COUNT(*) FROM cache'
+        ).fetchone()[0]
+        self.assertLess(count, 300)
+
+
+@mock.patch('core.cache.RETURNING', False)
+class OldSQLiteCacheTest(SQLiteCacheTest):
+    """add и incr без UPSERT и RETURNING, как на SQLite старше 3.35."""
@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from .models import Post, Group, Comment, Follow
+from . import search
+from .models import Post, Group, Comment, Follow, Tag
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -16,8 +17,23 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        # Тот же индекс, что и у поиска на сайте, вместо LIKE '%...%'.
+        ids = search.matching_ids(search_term)
+        if ids is None:
+            return super().get_search_results(
+                request, queryset, search_term
+            )
+        return queryset.filter(pk__in=ids), False
+
 
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group)
 admin.site.register(Comment)
 admin.site.register(Follow)
+
+
+@admin.register(Tag)
+class TagAdmin(admin.ModelAdmin):
+    list_display = ('name', 'posts_count')
+    search_fields = ('name',)
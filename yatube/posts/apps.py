@@ -1,5 +1,26 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models.signals import post_migrate
+
+SEARCH_MIGRATION = ('posts', '0022_post_search')
+
+
+def install_search(using, **kwargs):
+    # SQLite пересоздаёт таблицу при изменении её колонок, и триггеры
+    # индекса поиска пропадают вместе со старой таблицей. После отката
+    # миграции поиска индекс ставить не нужно.
+    from . import search
+
+    connection = connections[using]
+    if SEARCH_MIGRATION in MigrationRecorder(connection).applied_migrations():
+        search.install(connection)
 
 
 class PostsConfig(AppConfig):
     name = 'posts'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        post_migrate.connect(install_search, sender=self)
@@ -0,0 +1,254 @@
+import hashlib
+import math
+import random
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_vary_headers
+
+from . import hashtags
+
+VERSION_KEY = 'posts:version:{}'
+PAGE_CACHE_KEY = 'posts:page:{}'
+LOCK_KEY = 'posts:lock:{}'
+STATS_KEY = 'posts:stampede:{}'
+PAGE_PARAMS = ('page', 'after', 'before')
+
+FEED_INDEX = 'index'
+
+# Теги страниц: версия тега сдвигается при каждом изменении, от которого
+# зависит страница, и все страницы с этим тегом разом устаревают.
+TAG_INDEX = 'index'
+TAG_GROUP = 'group'
+TAG_PROFILE = 'profile'
+TAG_AUTHOR = 'author'
+TAG_POST = 'post'
+TAG_HASHTAG = 'hashtag'
+
+
+# Защита от набегов: устаревшую запись пересчитывает один процесс, прочие
+# тем временем отдают старое значение. Запись хранится на STALE_TTL дольше
+# своего срока, чтобы было что отдавать.
+STALE_TTL = 60 * 10
+LOCK_TIMEOUT = 30
+WAIT_TIMEOUT = 2
+POLL_INTERVAL = 0.05
+# Параметр XFetch: чем больше, тем раньше срока начинается пересчёт.
+BETA = 1.0
+STATS_FLUSH_EVERY = 100
+
+HITS = 'hits'
+STALE = 'stale'
+RECOMPUTES = 'recomputes'
+STAMPEDE_EVENTS = (HITS, STALE, RECOMPUTES)
+
+_events = Counter()
+_events_lock = threading.Lock()
+
+
+def page_tag(kind, pk=None):
+    return kind if pk is None else f'{kind}:{pk}'
+
+
+def post_tags(post, profile=True):
+    """Теги страниц, на которых виден пост."""
+    tags = [
+        page_tag(TAG_POST, post.pk), page_tag(TAG_AUTHOR, post.author_id)
+    ]
+    if profile:
+        tags += [TAG_INDEX, page_tag(TAG_PROFILE, post.author_id)]
+        tags += hashtag_tags(hashtags.extract(post.text))
+    if post.group_id is not None:
+        tags.append(page_tag(TAG_GROUP, post.group_id))
+    return tags
+
+
+def hashtag_tags(names):
+    return [page_tag(TAG_HASHTAG, name) for name in names]
+
+
+def _initial_version():
+    # Версия после вытеснения ключа не должна совпасть со старой.
+    return int(time.time() * 1000)
+
+
+def tag_versions(tags):
+    """Текущие версии тегов; недостающие заводятся заново."""
+    keys = {VERSION_KEY.format(tag): tag for tag in tags}
+    found = cache.get_many(keys)
+    missing = {key: _initial_version() for key in keys if key not in found}
+    if missing:
+        for key, version in missing.items():
+            cache.add(key, version, None)
+        found.update(cache.get_many(missing))
+    return {keys[key]: version for key, version in found.items()}
+
+
+def feed_version(feed):
+    """Текущая версия ленты: входит в ключи её закешированных фрагментов."""
+    return tag_versions([feed])[feed]
+
+
+def bump_tags(*tags):
+    """Сдвигает версии тегов; теги без версии и так получат новую."""
+    for tag in set(tags):
+        try:
+            cache.incr(VERSION_KEY.format(tag))
+        except ValueError:
+            pass
+
+
+def bump_feed_version(feed):
+    """Сдвигает версию: все фрагменты ленты разом становятся устаревшими."""
+    bump_tags(feed)
+
+
+def page_key(request):
+    """Часть ключа кеша, задающая страницу ленты."""
+    return '|'.join(request.GET.get(param, '') for param in PAGE_PARAMS)
+
+
+def tag_page(request, *tags):
+    """
+    Отмечает, от каких данных зависит кешируемая страница.
+
+    Версии читаются сразу, до выборки данных: правка, случившаяся во время
+    отрисовки, сдвинет версию, и запись в кеше окажется устаревшей.
+    """
+    if getattr(request, 'page_tags', None) is not None:
+        request.page_tags.update(tag_versions(tags))
+
+
+def cache_anonymous_page(view):
+    """
+    Кеширует ответ целиком для гостей, ключ — путь со строкой запроса.
+
+    Вместе с ответом хранятся версии тегов страницы (см. tag_page), при
+    чтении они сверяются с текущими одним get_many; устаревший ответ
+    пересчитывается через fetch_entry. Авторизованным пользователям общий
+    ответ не отдаётся никогда.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method != 'GET' or request.user.is_authenticated:
+            return view(request, *args, **kwargs)
+
+        def render():
+            request.page_tags = {}
+            response = view(request, *args, **kwargs)
+            patch_vary_headers(response, ['Cookie'])
+            return response, request.page_tags
+
+        def cacheable(response):
+            return (response.status_code == 200 and request.page_tags
+                    and not response.cookies
+                    and not request.META.get('CSRF_COOKIE_USED'))
+
+        return fetch_entry(
+            PAGE_CACHE_KEY.format(hashlib.md5(
+                request.get_full_path().encode()
+            ).hexdigest()),
+            render, settings.PAGE_CACHE_TIMEOUT,
+            lambda tags: tag_versions(tags) == tags, cacheable,
+        )
+    return wrapper
+
+
+def count_event(event):
+    """Копит события в процессе и раз в STATS_FLUSH_EVERY сбрасывает в кеш."""
+    with _events_lock:
+        _events[event] += 1
+        if sum(_events.values()) < STATS_FLUSH_EVERY:
+            return
+        pending = dict(_events)
+        _events.clear()
+    _flush_events(pending)
+
+
+def _flush_events(pending):
+    for event, count in pending.items():
+        key = STATS_KEY.format(event)
+        try:
+            cache.incr(key, count)
+        except ValueError:
+            if not cache.add(key, count, None):
+                cache.incr(key, count)
+
+
+def stampede_stats():
+    """Счётчики попаданий, отдач устаревшего и пересчётов всех процессов."""
+    with _events_lock:
+        pending = dict(_events)
+        _events.clear()
+    _flush_events(pending)
+    found = cache.get_many([STATS_KEY.format(event)
+                            for event in STAMPEDE_EVENTS])
+    return {
+        event: found.get(STATS_KEY.format(event), 0)
+        for event in STAMPEDE_EVENTS
+    }
+
+
+def _expired_early(delta, expires):
+    # XFetch: пересчитываем чуть раньше срока с вероятностью, растущей к
+    # его концу и со временем пересчёта, — чтобы процессы не сошлись разом.
+    return time.time() - delta * BETA * math.log(1 - random.random()) >= (
+        expires
+    )
+
+
+def fetch_entry(key, compute, timeout, is_current,
+                cacheable=lambda value: True):
+    """
+    Достаёт значение из кеша, пересчитывая его не больше чем в одном месте.
+
+    compute() возвращает (значение, версия); is_current(версия) говорит,
+    свежа ли сохранённая запись. Устаревшую запись пересчитывает тот, кто
+    взял блокировку, остальные отдают её как есть. Если отдать нечего,
+    ждём чужого пересчёта до WAIT_TIMEOUT секунд, затем считаем сами.
+    """
+    entry = cache.get(key)
+    if entry is not None:
+        value, version, delta, expires = entry
+        if is_current(version) and not _expired_early(delta, expires):
+            count_event(HITS)
+            return value
+    lock = LOCK_KEY.format(key)
+    locked = cache.add(lock, 1, LOCK_TIMEOUT)
+    if not locked:
+        if entry is not None:
+            count_event(STALE)
+            return entry[0]
+        deadline = time.time() + WAIT_TIMEOUT
+        while time.time() < deadline:
+            time.sleep(POLL_INTERVAL)
+            entry = cache.get(key)
+            if entry is not None and is_current(entry[1]):
+                count_event(HITS)
+                return entry[0]
+    try:
+        started = time.time()
+        value, version = compute()
+        delta = time.time() - started
+        if cacheable(value):
+            cache.set(
+                key, (value, version, delta, time.time() + timeout),
+                timeout + STALE_TTL
+            )
+    finally:
+        if locked:
+            cache.delete(lock)
+    count_event(RECOMPUTES)
+    return value
+
+
+def fetch(key, compute, timeout, version=None):
+    """fetch_entry для значения с одной версией, например версией ленты."""
+    return fetch_entry(
+        key, lambda: (compute(), version), timeout,
+        lambda stored: stored == version,
+    )
@@ -0,0 +1,126 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from .feeds import ENGINE_FANOUT
+from .models import Follow, Post, Tag
+
+COUNT_KEY = 'posts:count:{}'
+
+FEED_INDEX = 'index'
+FEED_GROUP = 'group'
+FEED_PROFILE = 'profile'
+FEED_FOLLOW = 'follow'
+FEED_TAG = 'tag'
+
+
+def count_key(feed, pk=None):
+    return COUNT_KEY.format(feed if pk is None else f'{feed}:{pk}')
+
+
+def post_count_keys(post):
+    """Ключи счётчиков всех лент, в которые попадает пост."""
+    keys = [count_key(FEED_INDEX), count_key(FEED_PROFILE, post.author_id)]
+    if post.group_id is not None:
+        keys.append(count_key(FEED_GROUP, post.group_id))
+    return keys
+
+
+def shift_counts(keys, delta):
+    """Сдвигает закешированные счётчики; отсутствующие не создаются."""
+    for key in keys:
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            pass
+
+
+def is_exact(feed):
+    exact = settings.PAGINATOR_EXACT_COUNTS
+    return exact is True or feed in exact
+
+
+class FeedCounter:
+    """
+    Число постов ленты из кеша.
+
+    При промахе считается COUNT(*) один раз; дальше значение сдвигается
+    сигналами публикации и удаления, а пагинатор поправляет его, когда
+    видит, что лента короче или длиннее.
+    """
+
+    def __init__(self, feed, queryset, pk=None):
+        self.feed = feed
+        self.queryset = queryset
+        self.key = count_key(feed, pk)
+
+    def get(self):
+        if is_exact(self.feed):
+            return self.queryset.count()
+        value = cache.get(self.key)
+        if value is None:
+            value = self.queryset.count()
+            cache.set(self.key, value, settings.FEED_COUNT_TIMEOUT)
+        return value
+
+    def set(self, value):
+        if not is_exact(self.feed):
+            cache.set(self.key, value, settings.FEED_COUNT_TIMEOUT)
+
+
+class FollowFeedCounter:
+    """Длина ленты подписок как сумма закешированных счётчиков авторов."""
+    feed = FEED_FOLLOW
+
+    def __init__(self, user, queryset):
+        self.user = user
+        self.queryset = queryset
+
+    def get(self):
+        if is_exact(self.feed):
+            return self.queryset.count()
+        author_ids = list(
+            Follow.objects.filter(user=self.user).values_list(
+                'author_id', flat=True
+            )
+        )
+        keys = {count_key(FEED_PROFILE, pk): pk for pk in author_ids}
+        counts = cache.get_many(keys)
+        missing = [keys[key] for key in keys if key not in counts]
+        if missing:
+            found = dict.fromkeys(missing, 0)
+            found.update(
+                Post.objects.filter(author_id__in=missing).order_by(
+                ).values_list('author_id').annotate(Count('pk'))
+            )
+            fresh = {
+                count_key(FEED_PROFILE, pk): value
+                for pk, value in found.items()
+            }
+            cache.set_many(fresh, settings.FEED_COUNT_TIMEOUT)
+            counts.update(fresh)
+        total = sum(counts.values())
+        if settings.FOLLOW_FEED_ENGINE == ENGINE_FANOUT:
+            return min(total, settings.TIMELINE_LENGTH)
+        return total
+
+    def set(self, value):
+        """Сумма по авторам не раскладывается обратно — не сохраняем."""
+
+
+class TagCounter:
+    """Число постов хештега: Tag.posts_count, его сдвигают сигналы."""
+    feed = FEED_TAG
+
+    def __init__(self, tag, queryset):
+        self.tag = tag
+        self.queryset = queryset
+
+    def get(self):
+        if is_exact(self.feed):
+            return self.queryset.count()
+        return self.tag.posts_count
+
+    def set(self, value):
+        if not is_exact(self.feed):
+            Tag.objects.filter(pk=self.tag.pk).update(posts_count=value)
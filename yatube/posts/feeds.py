@@ -0,0 +1,221 @@
+import heapq
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, F, Window
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
+
+from .models import Follow, Post, TimelineEntry
+
+BATCH_SIZE = 1000
+AUTHOR_TIMELINE_KEY = 'posts:author_timeline:{}'
+
+ENGINE_JOIN = 'join'
+ENGINE_FANOUT = 'fanout'
+ENGINE_MERGE = 'merge'
+
+# Колонки, которые выводит карточка поста posts/includes/post.html.
+CARD_FIELDS = (
+    'id', 'text', 'pub_date', 'image', 'image_width', 'image_height',
+    'image_hash', 'image_blurhash',
+    'author', 'author__username', 'author__first_name', 'author__last_name',
+    'group', 'group__slug', 'group__title',
+)
+
+
+def feed_posts(queryset=None):
+    """
+    Посты для карточек ленты.
+
+    Автор и группа присоединяются тем же запросом, а выбираются только
+    колонки, которые рисует карточка, — без N+1 на каждой странице.
+    """
+    if queryset is None:
+        queryset = Post.objects.all()
+    return queryset.select_related('author', 'group').only(*CARD_FIELDS)
+
+
+def fan_out_post(post):
+    """Раскладывает новый пост в ленты всех подписчиков автора."""
+    followers = list(
+        Follow.objects.filter(
+            author_id=post.author_id
+        ).values_list('user_id', flat=True)
+    )
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+            for user_id in followers
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    trim_timelines(followers)
+
+
+def backfill_timeline(user_id, author_id):
+    """Добавляет в ленту свежие посты автора, на которого подписались."""
+    posts = Post.objects.filter(author_id=author_id).values_list(
+        'id', 'pub_date'
+    )[:settings.TIMELINE_LENGTH]
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+            for post_id, pub_date in posts
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    trim_timelines([user_id])
+
+
+def remove_from_timeline(user_id, author_id):
+    """Убирает из ленты посты автора, от которого отписались."""
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id
+    ).delete()
+
+
+def trim_timelines(user_ids):
+    """Обрезает ленты, выросшие больше TIMELINE_LENGTH записей."""
+    length = settings.TIMELINE_LENGTH
+    overflown = TimelineEntry.objects.filter(
+        user_id__in=user_ids
+    ).order_by().values('user_id').annotate(
+        size=Count('id')
+    ).filter(size__gt=length)
+    for row in overflown:
+        timeline = TimelineEntry.objects.filter(user_id=row['user_id'])
+        oldest_kept = timeline.values_list('pub_date', flat=True)[length - 1]
+        timeline.filter(pub_date__lt=oldest_kept).delete()
+
+
+def rebuild_timeline(user_id):
+    """Пересобирает ленту пользователя с нуля по его подпискам."""
+    TimelineEntry.objects.filter(user_id=user_id).delete()
+    posts = Post.objects.filter(
+        author__following__user_id=user_id
+    ).values_list('id', 'pub_date')[:settings.TIMELINE_LENGTH]
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+            for post_id, pub_date in posts
+        ),
+        batch_size=BATCH_SIZE,
+    )
+
+
+def recent_posts(author_ids):
+    """
+    (время, id) последних AUTHOR_TIMELINE_LENGTH постов каждого автора.
+
+    Один запрос на всех авторов: ROW_NUMBER нумерует посты внутри автора
+    по индексу (author, -pub_date, -id), и выбираются только первые.
+    """
+    length = settings.AUTHOR_TIMELINE_LENGTH
+    timelines = {author_id: [] for author_id in author_ids}
+    if not timelines:
+        return timelines
+    posts = Post.objects.filter(author_id__in=timelines)
+    if connection.features.supports_over_clause:
+        ranked = posts.annotate(position=Window(
+            RowNumber(), partition_by=[F('author_id')],
+            order_by=[F('pub_date').desc(), F('id').desc()],
+        )).order_by().values('id', 'position')
+        sql, params = ranked.query.sql_with_params()
+        posts = posts.filter(id__in=RawSQL(
+            f'SELECT id FROM ({sql}) WHERE position <= %s',
+            (*params, length),
+        ))
+    # Без оконных функций лишние посты отбрасываются здесь.
+    for author_id, pub_date, post_id in sorted(
+        posts.order_by().values_list('author_id', 'pub_date', 'id'),
+        reverse=True,
+    ):
+        timeline = timelines[author_id]
+        if len(timeline) < length:
+            timeline.append((pub_date.timestamp(), post_id))
+    return timelines
+
+
+def author_timelines(author_ids):
+    """Короткие списки (время, id) свежих постов авторов из кеша."""
+    keys = {AUTHOR_TIMELINE_KEY.format(pk): pk for pk in author_ids}
+    timelines = {
+        keys[key]: value for key, value in cache.get_many(keys).items()
+    }
+    missing = recent_posts(set(author_ids) - set(timelines))
+    if missing:
+        timelines.update(missing)
+        cache.set_many({
+            AUTHOR_TIMELINE_KEY.format(author_id): timeline
+            for author_id, timeline in missing.items()
+        }, None)
+    return timelines
+
+
+def invalidate_author_timeline(author_id):
+    cache.delete(AUTHOR_TIMELINE_KEY.format(author_id))
+
+
+class MergedFeed:
+    """
+    Лента подписок, собранная при чтении.
+
+    Списки авторов сливаются k-путевым слиянием на куче, а из базы одним
+    запросом id__in достаются только посты запрошенной страницы.
+    Поддерживает len() и срезы, поэтому подходит для Paginator.
+    """
+
+    def __init__(self, timelines):
+        self.timelines = timelines
+
+    def __len__(self):
+        return sum(map(len, self.timelines))
+
+    def count(self):
+        return len(self)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        merged = heapq.merge(*self.timelines, reverse=True)
+        ids = [
+            post_id for _, post_id in islice(
+                merged, index.start or 0, index.stop
+            )
+        ]
+        posts = feed_posts().in_bulk(ids)
+        return [posts[post_id] for post_id in ids if post_id in posts]
+
+
+def follow_feed(user):
+    """Посты ленты подписок в движке из settings.FOLLOW_FEED_ENGINE."""
+    engine = settings.FOLLOW_FEED_ENGINE
+    if engine == ENGINE_MERGE:
+        author_ids = list(
+            Follow.objects.filter(user=user).values_list(
+                'author_id', flat=True
+            )
+        )
+        return MergedFeed(list(author_timelines(author_ids).values()))
+    if engine == ENGINE_JOIN:
+        return feed_posts(Post.objects.filter(author__following__user=user))
+    # Диапазон по индексу (user, -pub_date, -post) материализованной ленты.
+    return feed_posts(
+        Post.objects.filter(timeline_entries__user=user)
+    ).annotate(
+        feed_date=F('timeline_entries__pub_date'),
+        feed_id=F('timeline_entries__post_id'),
+    ).order_by('-feed_date', '-feed_id')
+
+
+def tag_feed(tag):
+    """Посты хештега: диапазон по индексу (tag, -pub_date, -post)."""
+    return feed_posts(Post.objects.filter(post_tags__tag=tag)).annotate(
+        feed_date=F('post_tags__pub_date'),
+        feed_id=F('post_tags__post_id'),
+    ).order_by('-feed_date', '-feed_id')
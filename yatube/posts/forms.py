@@ -1,5 +1,8 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image
 
+from .images import find_duplicate, normalize_upload
 from .models import Post, Comment
 
 
@@ -17,6 +20,23 @@ class PostForm(forms.ModelForm):
             'group': 'Группа, к которой будет относиться пост',
         }
 
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        # Уже сохранённая картинка при правке поста приходит как FieldFile.
+        if isinstance(image, UploadedFile):
+            try:
+                image = normalize_upload(image)
+            except (OSError, Image.DecompressionBombError):
+                # Заголовок цел, а данные обрезаны или слишком велики:
+                # проверка ImageField такого не замечает.
+                raise forms.ValidationError(
+                    self.fields['image'].error_messages['invalid_image'],
+                    code='invalid_image',
+                )
+            # Почти такая же картинка уже есть — берём её с миниатюрами.
+            return find_duplicate(image) or image
+        return image
+
 
 class CommentForm(forms.ModelForm):
 
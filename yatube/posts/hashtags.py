@@ -0,0 +1,118 @@
+import re
+
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import PostTag, Tag
+
+MAX_LENGTH = Tag._meta.get_field('name').max_length
+# «#» в начале слова; в тег входит хотя бы одна буква, так что «#1» —
+# не тег, а «&#39;» и «a#b» — не начало тега.
+HASHTAG = re.compile(r'(?<![\w&#])#(\w*[^\W\d_]\w*)')
+
+
+def normalize(name):
+    return name.casefold().replace('ё', 'е')
+
+
+def extract(text):
+    """Имена хештегов текста: без «#» и регистра, каждое по разу."""
+    return {
+        normalize(name) for name in HASHTAG.findall(text)
+        if len(name) <= MAX_LENGTH
+    }
+
+
+def tag_ids(names):
+    """id тегов по именам; недостающие теги создаются."""
+    Tag.objects.bulk_create(
+        [Tag(name=name) for name in names], ignore_conflicts=True
+    )
+    return dict(
+        Tag.objects.filter(name__in=names).values_list('name', 'pk')
+    )
+
+
+def shift_counts(ids, delta):
+    if ids:
+        Tag.objects.filter(pk__in=ids).update(
+            posts_count=F('posts_count') + delta
+        )
+
+
+def update_post_tags(post, old_text):
+    """
+    Переносит пост с хештегов old_text на хештеги его текста.
+
+    Трогаются только появившиеся и пропавшие теги, их счётчики
+    сдвигаются на единицу. Возвращает имена пропавших тегов.
+    """
+    old, new = extract(old_text), extract(post.text)
+    added, removed = new - old, old - new
+    with transaction.atomic():
+        if removed:
+            links = PostTag.objects.filter(post=post, tag__name__in=removed)
+            removed_ids = list(links.values_list('tag_id', flat=True))
+            links.delete()
+            shift_counts(removed_ids, -1)
+        if added:
+            ids = set(tag_ids(added).values())
+            # Связь уже может быть, например, после backfill_hashtags:
+            # счётчик сдвигаем только для действительно новых.
+            ids -= set(
+                PostTag.objects.filter(post=post, tag_id__in=ids)
+                .values_list('tag_id', flat=True)
+            )
+            PostTag.objects.bulk_create(
+                [PostTag(tag_id=pk, post=post, pub_date=post.pub_date)
+                 for pk in ids],
+                ignore_conflicts=True,
+            )
+            shift_counts(list(ids), 1)
+    return removed
+
+
+def linked_tag_ids(post):
+    """id тегов, с которыми пост связан в базе."""
+    return list(post.post_tags.values_list('tag_id', flat=True))
+
+
+def post_removed(post, ids):
+    """
+    Связи удаляются каскадом, остаётся сдвинуть счётчики тегов.
+
+    ids собирает linked_tag_ids до удаления: по тексту поста нельзя
+    судить, какие связи были, а лишний минус нарушит CHECK счётчика.
+    """
+    shift_counts(ids, -1)
+
+
+def backfill(posts):
+    """
+    Заново раскладывает по тегам посты из (id, текст, дата).
+
+    Счётчики не трогает: после всех пачек их пересчитывает recount_tags.
+    """
+    posts = list(posts)
+    names = {pk: extract(text) for pk, text, _ in posts}
+    with transaction.atomic():
+        ids = tag_ids(set().union(*names.values()))
+        PostTag.objects.filter(post_id__in=names).delete()
+        PostTag.objects.bulk_create([
+            PostTag(tag_id=ids[name], post_id=pk, pub_date=pub_date)
+            for pk, _, pub_date in posts for name in names[pk]
+        ])
+    return sum(map(len, names.values()))
+
+
+def recount_tags():
+    """Точные счётчики всех тегов одним UPDATE."""
+    Tag.objects.update(posts_count=Coalesce(
+        Subquery(
+            PostTag.objects.filter(tag=OuterRef('pk')).order_by().values(
+                'tag'
+            ).annotate(count=Count('pk')).values('count')
+        ),
+        Value(0),
+    ))
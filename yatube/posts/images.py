@@ -0,0 +1,328 @@
+import hashlib
+import logging
+import os
+import shutil
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.db import transaction
+from django.db.models import Case, Count, F, Value, When
+from django.utils import timezone
+from PIL import Image, ImageOps
+from sorl import thumbnail
+
+from . import phash, placeholders
+from .models import Post, StoredImage
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+# Поля Post со сведениями о картинке и значения для поста без неё.
+METADATA_FIELDS = {
+    'image_width': None,
+    'image_height': None,
+    'image_size': None,
+    'image_format': '',
+    'image_hash': '',
+    'image_original_size': None,
+    'image_blurhash': '',
+    'image_phash': None,
+}
+# Сколько похожих по хешу картинок проверять поточечно при загрузке.
+DUPLICATE_CANDIDATES = 3
+# Форматы, которые не перекодируются: GIF может быть анимированным.
+KEEP_FORMATS = {'GIF'}
+# Сведения, которые Pillow переносит в файл при сохранении.
+METADATA_KEYS = {'exif', 'icc_profile', 'xmp', 'photoshop', 'comment'}
+
+
+def read_metadata(file):
+    """
+    Размеры, формат, размер в байтах, SHA-256, BlurHash и dHash картинки.
+
+    Файл читается один раз кусками; для BlurHash Pillow декодирует
+    уменьшенную копию. Если файла нет или это не картинка, возвращает None.
+    Хеш только что загруженного файла остаётся на нём в sha256: по нему
+    хранилище назовёт файл, не читая его ещё раз.
+    """
+    upload = getattr(file, '_file', None)
+    # Размер загрузки до normalize_upload, если файл только что загружен.
+    original_size = getattr(upload, 'original_size', None)
+    closed = file.closed
+    try:
+        file.open('rb')
+        try:
+            file.seek(0)
+            digest = hashlib.sha256()
+            size = 0
+            for chunk in file.chunks(CHUNK_SIZE):
+                digest.update(chunk)
+                size += len(chunk)
+            file.seek(0)
+            with Image.open(file) as image:
+                width, height = image.size
+                image_format = image.format or ''
+                image.draft('RGB', (placeholders.SOURCE_SIDE,) * 2)
+                blurhash = placeholders.encode(image)
+                perceptual = phash.dhash(image)
+        finally:
+            # Закрываем только то, что открыли сами: загруженный файл ещё
+            # предстоит сохранить в хранилище.
+            if closed:
+                file.close()
+            else:
+                file.seek(0)
+    except (OSError, ValueError, SuspiciousFileOperation):
+        logger.warning('Не удалось прочитать картинку %s', file.name)
+        return None
+    if upload is not None and not file._committed:
+        upload.sha256 = digest.hexdigest()
+    return {
+        'image_width': width,
+        'image_height': height,
+        'image_size': size,
+        'image_format': image_format,
+        'image_hash': digest.hexdigest(),
+        'image_original_size': original_size or size,
+        'image_blurhash': blurhash,
+        'image_phash': phash.to_db(perceptual),
+    }
+
+
+def read_blurhash(name):
+    """BlurHash файла из хранилища картинок постов; '' — не прочитать."""
+    storage = Post._meta.get_field('image').storage
+    try:
+        with storage.open(name) as file, Image.open(file) as image:
+            image.draft('RGB', (placeholders.SOURCE_SIDE,) * 2)
+            return placeholders.encode(image)
+    except (OSError, ValueError, SuspiciousFileOperation):
+        logger.warning('Не удалось прочитать картинку %s', name)
+        return ''
+
+
+def read_phash(name):
+    """dHash файла из хранилища картинок постов; None — не прочитать."""
+    storage = Post._meta.get_field('image').storage
+    try:
+        with storage.open(name) as file, Image.open(file) as image:
+            image.draft('RGB', (placeholders.SOURCE_SIDE,) * 2)
+            return phash.dhash(image)
+    except (OSError, ValueError, SuspiciousFileOperation):
+        logger.warning('Не удалось прочитать картинку %s', name)
+        return None
+
+
+def find_duplicate(upload):
+    """
+    Имя сохранённой картинки, почти неотличимой от загрузки, или None.
+
+    Кандидатов подбирает индекс перцептивных хешей, затем каждый
+    сверяется поточечно. Подходит только картинка не меньше загрузки:
+    её файл, миниатюры и варианты переиспользуются как есть. GIF не
+    сравниваем: анимацию первый кадр не описывает.
+    """
+    upload.seek(0)
+    try:
+        with Image.open(upload) as image:
+            if image.format in KEEP_FORMATS:
+                return None
+            candidates = phash.index.search(phash.dhash(image))
+            storage = Post._meta.get_field('image').storage
+            for _, _, name in candidates[:DUPLICATE_CANDIDATES]:
+                size = Post.objects.filter(image=name).values_list(
+                    'image_width', 'image_height'
+                ).first()
+                if size is None or None in size or (
+                        size[0] < image.width or size[1] < image.height):
+                    continue
+                with storage.open(name) as file, Image.open(file) as stored:
+                    if phash.looks_same(image, stored):
+                        return name
+    except (OSError, ValueError, SuspiciousFileOperation):
+        logger.warning('Не удалось сравнить картинку %s', upload.name)
+    finally:
+        upload.seek(0)
+    return None
+
+
+def update_metadata(post):
+    """Переносит в пост сведения о его картинке; True, если они изменились."""
+    metadata = METADATA_FIELDS
+    if post.image:
+        metadata = read_metadata(post.image) or METADATA_FIELDS
+    changed = False
+    for field, value in metadata.items():
+        if getattr(post, field) != value:
+            setattr(post, field, value)
+            changed = True
+    return changed
+
+
+def _encode_jpeg(image):
+    """
+    JPEG с наибольшим качеством, который влезает в IMAGE_BYTES_BUDGET.
+
+    Качество подбирается двоичным поиском; если бюджет недостижим даже
+    при IMAGE_MIN_QUALITY, остаётся этот, самый маленький вариант.
+    """
+    def encode(quality):
+        buffer = BytesIO()
+        image.save(buffer, 'JPEG', quality=quality, optimize=True,
+                   progressive=True)
+        return buffer
+
+    budget = settings.IMAGE_BYTES_BUDGET
+    low, high = settings.IMAGE_MIN_QUALITY, settings.IMAGE_MAX_QUALITY
+    best = encode(high)
+    if best.tell() <= budget:
+        return best
+    best = None
+    high -= 1
+    while low <= high:
+        quality = (low + high) // 2
+        buffer = encode(quality)
+        if buffer.tell() <= budget:
+            best, low = buffer, quality + 1
+        else:
+            high = quality - 1
+    return best or encode(settings.IMAGE_MIN_QUALITY)
+
+
+def _has_alpha(image):
+    if image.mode in ('RGBA', 'LA') or 'transparency' in image.info:
+        alpha = image.convert('RGBA').getchannel('A')
+        return alpha.getextrema()[0] < 255
+    return False
+
+
+def normalize_upload(upload):
+    """
+    Готовит загруженную картинку к хранению.
+
+    Поворачивает по EXIF, убирает метаданные, ограничивает длинную сторону
+    IMAGE_MAX_SIDE и перекодирует: непрозрачные — в JPEG под бюджет байт,
+    прозрачные — в сжатый PNG. GIF не трогаем. Результат пишется во
+    временный файл на диске; у него есть original_size — размер загрузки.
+    Если перекодировать было незачем и вышло не меньше, остаётся исходник.
+    """
+    original_size = upload.size
+    upload.seek(0)
+    with Image.open(upload) as image:
+        if image.format in KEEP_FORMATS:
+            upload.seek(0)
+            upload.original_size = original_size
+            return upload
+        max_side = settings.IMAGE_MAX_SIDE
+        # JPEG можно декодировать сразу в уменьшенном масштабе.
+        image.draft('RGB', (max_side, max_side))
+        rewrite = bool(METADATA_KEYS & set(image.info))
+        orientation = image.getexif().get(0x0112, 1)
+        transposed = ImageOps.exif_transpose(image)
+        rewrite = rewrite or orientation != 1
+        if max(transposed.size) > max_side:
+            transposed.thumbnail((max_side, max_side), Image.LANCZOS)
+            rewrite = True
+        if _has_alpha(transposed):
+            encoded = BytesIO()
+            transposed.convert('RGBA').save(encoded, 'PNG', optimize=True)
+            extension, content_type = '.png', 'image/png'
+        else:
+            encoded = _encode_jpeg(transposed.convert('RGB'))
+            extension, content_type = '.jpg', 'image/jpeg'
+    if not rewrite and encoded.tell() >= original_size:
+        upload.seek(0)
+        upload.original_size = original_size
+        return upload
+    name = os.path.splitext(os.path.basename(upload.name))[0] + extension
+    normalized = TemporaryUploadedFile(
+        name, content_type, encoded.tell(), None
+    )
+    encoded.seek(0)
+    shutil.copyfileobj(encoded, normalized)
+    normalized.seek(0)
+    normalized.original_size = original_size
+    logger.info(
+        'Картинка %s: %d → %d байт, сэкономлено %d',
+        name, original_size, normalized.size,
+        original_size - normalized.size,
+    )
+    return normalized
+
+
+def retain_image(name):
+    """Ещё один пост ссылается на файл."""
+    stored, created = StoredImage.objects.get_or_create(
+        name=name, defaults={'refs': 1}
+    )
+    if not created:
+        StoredImage.objects.filter(name=name).update(
+            refs=F('refs') + 1, released=None
+        )
+
+
+def release_image(name):
+    """Пост больше не ссылается на файл; последняя ссылка — засекаем время."""
+    StoredImage.objects.filter(name=name, refs__gt=0).update(
+        refs=F('refs') - 1,
+        released=Case(
+            When(refs=1, then=Value(timezone.now())), default=F('released')
+        ),
+    )
+
+
+def delete_image(name):
+    """Удаляет файл вместе с его миниатюрами."""
+    try:
+        thumbnail.delete(name)
+    except (OSError, SuspiciousFileOperation):
+        logger.warning('Не удалось удалить картинку %s', name)
+
+
+def collect_images(grace):
+    """
+    Удаляет файлы, на которые никто не ссылается дольше grace.
+
+    Запас по времени нужен, чтобы не удалить файл, который как раз сейчас
+    загружают заново: такая загрузка продлевает его и возвращает ссылку.
+    """
+    expired = StoredImage.objects.filter(
+        refs=0, released__lte=timezone.now() - grace
+    )
+    deleted = 0
+    for name in list(expired.values_list('name', flat=True)):
+        with transaction.atomic():
+            # Строка заблокирована, пока удаляется файл: загрузка того же
+            # файла ждёт и, не найдя строки, записывает его заново.
+            stored = expired.select_for_update().filter(name=name).first()
+            if stored is None:
+                # Ссылка появилась или загрузка продлила файл.
+                continue
+            stored.delete()
+            delete_image(name)
+            deleted += 1
+    return deleted
+
+
+def reconcile_images():
+    """Пересчитывает ссылки по постам; возвращает число исправлений."""
+    counts = dict(
+        Post.objects.exclude(image='').order_by().values_list(
+            'image'
+        ).annotate(Count('pk'))
+    )
+    fixed = 0
+    for stored in StoredImage.objects.all().iterator():
+        refs = counts.pop(stored.name, 0)
+        if stored.refs != refs:
+            stored.refs = refs
+            stored.released = None if refs else timezone.now()
+            stored.save(update_fields=['refs', 'released'])
+            fixed += 1
+    StoredImage.objects.bulk_create(
+        StoredImage(name=name, refs=refs) for name, refs in counts.items()
+    )
+    return fixed + len(counts)
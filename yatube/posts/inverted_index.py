@@ -0,0 +1,339 @@
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import tempfile
+import threading
+from array import array
+from bisect import bisect_left, insort
+from itertools import accumulate
+
+logger = logging.getLogger(__name__)
+
+# Поиск по тексту постов без FTS5: обратный индекс «слово → id постов».
+#
+# На диске два файла. В index — словарь и списки id, отсортированные по
+# возрастанию и записанные первым id и разностями соседних: разности малы,
+# так что они хранятся массивом самого узкого подходящего типа (B, H, I).
+# Файл открывается через mmap, список читается с диска, только когда его
+# спросили. В journal дописываются правки (по строке JSON): их видят и
+# другие процессы, а rebuild() собирает index заново.
+INDEX_FILE = 'index'
+JOURNAL_FILE = 'journal'
+MAGIC = b'YTIX'
+VERSION = 1
+HEADER = struct.Struct('<4sHI')
+ENTRY = struct.Struct('<cIIQ')
+TERM_LENGTH = struct.Struct('<H')
+
+WORD = re.compile(r'\w+')
+# Частые служебные слова: в каждом втором посте, а искать по ним незачем.
+STOP_WORDS = frozenset(
+    'а без бы в во вот вы да для до его ее её же за и из или им их к как '
+    'ли мне мы на не нет но о об он она они оно от по с со так то ты у '
+    'уже что это я'.split()
+)
+TYPECODES = ((2 ** 8, 'B'), (2 ** 16, 'H'), (2 ** 32, 'I'))
+
+
+def normalize(word):
+    return word.casefold().replace('ё', 'е')
+
+
+def tokenize(text):
+    """Слова текста для индекса: без регистра, «ё» как «е», без служебных."""
+    return {
+        word for word in map(normalize, WORD.findall(text))
+        if word not in STOP_WORDS
+    }
+
+
+def query_terms(query):
+    """Слова запроса; служебные тоже ищем — как префиксы других слов."""
+    return [normalize(word) for word in WORD.findall(query)]
+
+
+def encode(ids):
+    """
+    Непустой список id: (тип, первый id, байты разностей соседних id
+    в массиве самого узкого типа).
+    """
+    deltas = [b - a for a, b in zip(ids, ids[1:])]
+    largest = max(deltas, default=0)
+    typecode = next(code for limit, code in TYPECODES if largest < limit)
+    return typecode, ids[0], array(typecode, deltas).tobytes()
+
+
+def decode(typecode, first, data):
+    deltas = array(typecode)
+    deltas.frombytes(data)
+    return array('I', accumulate(deltas, initial=first))
+
+
+class InvertedIndex:
+    """
+    Обратный индекс текстов постов в памяти процесса.
+
+    directory — каталог с index и journal; без него индекс живёт только
+    в памяти. Правки add/remove/update идемпотентны: процесс спокойно
+    переигрывает из журнала и собственные строки.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._lock = threading.RLock()
+        self._reset()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self._load()
+
+    def _reset(self):
+        self._mmap = None
+        self._blob = 0
+        self._base = {}
+        self._lists = {}
+        self._terms = []
+        self._journal_offset = 0
+        self._journal_inode = None
+        self._index_stat = None
+
+    def __len__(self):
+        """Число слов в словаре."""
+        with self._lock:
+            self._refresh()
+            return len(self._terms)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _load(self):
+        path = self._path(INDEX_FILE)
+        if os.path.exists(path) and os.path.getsize(path):
+            with open(path, 'rb') as file:
+                self._mmap = mmap.mmap(
+                    file.fileno(), 0, access=mmap.ACCESS_READ
+                )
+            self._index_stat = os.stat(path)
+            self._read_directory()
+        self._terms = sorted(self._base)
+        self._replay()
+
+    def _read_directory(self):
+        data = self._mmap
+        magic, version, count = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{self._path(INDEX_FILE)}: не индекс постов')
+        position = HEADER.size
+        for _ in range(count):
+            length, = TERM_LENGTH.unpack_from(data, position)
+            position += TERM_LENGTH.size
+            term = data[position:position + length].decode()
+            position += length
+            self._base[term] = ENTRY.unpack_from(data, position)
+            position += ENTRY.size
+        self._blob = position
+
+    def postings(self, term):
+        """id постов со словом term по возрастанию: array('I')."""
+        with self._lock:
+            ids = self._lists.get(term)
+            if ids is not None:
+                return ids
+            entry = self._base.get(term)
+            if entry is None:
+                return array('I')
+            typecode, size, first, offset = entry
+            typecode = typecode.decode()
+            start = self._blob + offset
+            end = start + (size - 1) * array(typecode).itemsize
+            return decode(typecode, first, self._mmap[start:end])
+
+    def _editable(self, term):
+        # В памяти держим только изменённые списки, остальные — в mmap.
+        ids = self._lists.get(term)
+        if ids is None:
+            if term not in self._base:
+                insort(self._terms, term)
+            ids = self._lists[term] = self.postings(term)
+        return ids
+
+    def _add(self, doc_id, terms):
+        for term in terms:
+            ids = self._editable(term)
+            if not ids or ids[-1] < doc_id:
+                # Новые посты — с наибольшим id: обычно просто дописываем.
+                ids.append(doc_id)
+            else:
+                position = bisect_left(ids, doc_id)
+                if position == len(ids) or ids[position] != doc_id:
+                    ids.insert(position, doc_id)
+
+    def _remove(self, doc_id, terms):
+        for term in terms:
+            ids = self._editable(term)
+            position = bisect_left(ids, doc_id)
+            if position < len(ids) and ids[position] == doc_id:
+                del ids[position]
+
+    def add(self, doc_id, text):
+        self.update(doc_id, '', text)
+
+    def remove(self, doc_id, text):
+        self.update(doc_id, text, '')
+
+    def update(self, doc_id, old_text, new_text):
+        """Переносит пост со старого текста на новый и пишет это в журнал."""
+        old, new = tokenize(old_text), tokenize(new_text)
+        added, removed = sorted(new - old), sorted(old - new)
+        if not added and not removed:
+            return
+        with self._lock:
+            self._refresh()
+            self._remove(doc_id, removed)
+            self._add(doc_id, added)
+            if self.directory is not None:
+                self._append_journal(
+                    {'id': doc_id, 'add': added, 'remove': removed}
+                )
+
+    def _append_journal(self, record):
+        line = (json.dumps(record, ensure_ascii=False) + '\n').encode()
+        # O_APPEND: строки разных процессов не перемешиваются.
+        descriptor = os.open(
+            self._path(JOURNAL_FILE), os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+            0o644,
+        )
+        try:
+            os.write(descriptor, line)
+        finally:
+            os.close(descriptor)
+        # Смещение не двигаем: перед нашей строкой мог дописать другой
+        # процесс. Свою строку _replay прочитает ещё раз — правки
+        # идемпотентны.
+
+    def _replay(self):
+        path = self._path(JOURNAL_FILE)
+        try:
+            with open(path, 'rb') as file:
+                inode = os.fstat(file.fileno()).st_ino
+                if inode != self._journal_inode:
+                    # Журнал начат заново после rebuild.
+                    self._journal_inode, self._journal_offset = inode, 0
+                file.seek(self._journal_offset)
+                data = file.read()
+        except FileNotFoundError:
+            return
+        # Недописанную последнюю строку оставим до следующего раза.
+        complete = data[:data.rfind(b'\n') + 1]
+        for line in complete.splitlines():
+            try:
+                record = json.loads(line)
+                doc_id, added = record['id'], record['add']
+                removed = record['remove']
+            except (ValueError, KeyError, TypeError):
+                # Испорченная строка не должна ломать поиск: следующая
+                # начинается после перевода строки.
+                logger.warning('Пропущена строка журнала %s: %r', path, line)
+                continue
+            self._remove(doc_id, removed)
+            self._add(doc_id, added)
+        self._journal_offset += len(complete)
+
+    def _refresh(self):
+        """Подхватывает правки других процессов и новый index после rebuild."""
+        if self.directory is None:
+            return
+        try:
+            index_stat = os.stat(self._path(INDEX_FILE))
+        except FileNotFoundError:
+            index_stat = None
+        if (index_stat is not None and (
+                self._index_stat is None
+                or index_stat.st_ino != self._index_stat.st_ino
+                or index_stat.st_mtime_ns != self._index_stat.st_mtime_ns)):
+            self._reset()
+            self._load()
+        else:
+            self._replay()
+
+    def search(self, query):
+        """
+        id постов, где есть все слова запроса (как префиксы), от новых.
+
+        Каждое слово раскрывается в слова словаря с таким началом
+        (двоичный поиск по отсортированному словарю), их списки
+        объединяются, а списки разных слов пересекаются, начиная с
+        самого короткого.
+        """
+        terms = query_terms(query)
+        if not terms:
+            return []
+        with self._lock:
+            self._refresh()
+            matches = []
+            for prefix in terms:
+                start = bisect_left(self._terms, prefix)
+                expanded = set()
+                for term in self._terms[start:]:
+                    if not term.startswith(prefix):
+                        break
+                    expanded.update(self.postings(term))
+                if not expanded:
+                    return []
+                matches.append(expanded)
+        matches.sort(key=len)
+        found = matches[0].intersection(*matches[1:])
+        return sorted(found, reverse=True)
+
+    def rebuild(self, documents):
+        """
+        Строит index заново из пар (id, текст).
+
+        documents читается после того, как журнал отложен в сторону: правка,
+        записанная в журнал раньше, уже видна в documents, позже — попадёт
+        в новый журнал. Поэтому в журнал пишут после коммита транзакции.
+        """
+        if self.directory is not None:
+            try:
+                os.remove(self._path(JOURNAL_FILE))
+            except FileNotFoundError:
+                pass
+        postings = {}
+        for doc_id, text in documents:
+            for term in tokenize(text):
+                postings.setdefault(term, []).append(doc_id)
+        with self._lock:
+            if self.directory is None:
+                self._reset()
+                for term, ids in postings.items():
+                    self._lists[term] = array('I', sorted(ids))
+                self._terms = sorted(postings)
+                return
+            self._write({term: sorted(ids) for term, ids in postings.items()})
+            self._reset()
+            self._load()
+
+    def _write(self, postings):
+        directory, blob = [], []
+        offset = 0
+        for term in sorted(postings):
+            ids = postings[term]
+            if not ids:
+                continue
+            typecode, first, data = encode(ids)
+            encoded = term.encode()
+            directory.append(
+                TERM_LENGTH.pack(len(encoded)) + encoded
+                + ENTRY.pack(typecode.encode(), len(ids), first, offset)
+            )
+            blob.append(data)
+            offset += len(data)
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(descriptor, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, VERSION, len(directory)))
+            file.writelines(directory)
+            file.writelines(blob)
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, self._path(INDEX_FILE))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from posts import caching, hashtags
+from posts.models import Post, Tag
+
+
+class Command(BaseCommand):
+    help = 'Раскладывает существующие посты по хештегам и пересчитывает их.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько постов разбирать за раз.',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        posts = Post.objects.order_by('pk').values_list(
+            'pk', 'text', 'pub_date'
+        )
+        last_id = 0
+        processed = links = 0
+        while True:
+            batch = list(posts.filter(pk__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            links += hashtags.backfill(batch)
+            processed += len(batch)
+            last_id = batch[-1][0]
+        hashtags.recount_tags()
+        names = list(Tag.objects.values_list('name', flat=True))
+        caching.bump_tags(*caching.hashtag_tags(names))
+        self.stdout.write(
+            f'Разобрано постов: {processed}, хештегов у них: {links}, '
+            f'всего хештегов: {len(names)}'
+        )
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.images import METADATA_FIELDS, update_metadata
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Заполняет размеры, формат и хеш картинок у существующих постов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=200,
+            help='Сколько постов обновлять одним запросом.',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        posts = Post.objects.exclude(image='').filter(image_hash='').only(
+            'id', 'image', *METADATA_FIELDS
+        ).order_by('pk')
+        last_id = 0
+        updated = 0
+        while True:
+            batch = list(posts.filter(pk__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            changed = [post for post in batch if update_metadata(post)]
+            with transaction.atomic():
+                Post.objects.bulk_update(changed, list(METADATA_FIELDS))
+            updated += len(changed)
+            last_id = batch[-1].pk
+        self.stdout.write(f'Обновлено постов: {updated}')
@@ -0,0 +1,54 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from posts.images import read_blurhash
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Считает BlurHash-заглушки картинок постов на всех ядрах.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Число процессов; по умолчанию — по числу ядер.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=200,
+            help='Сколько постов обновлять одним запросом.',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        posts = Post.objects.exclude(image='').filter(
+            image_blurhash=''
+        ).only('id', 'image', 'image_blurhash').order_by('pk')
+        last_id = 0
+        updated = 0
+        # Дочерние процессы наследуют настроенный Django через fork, но не
+        # должны делить с родителем открытые соединения с базой.
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=options['workers'], mp_context=get_context('fork'),
+            initializer=connections.close_all,
+        ) as pool:
+            while True:
+                batch = list(posts.filter(pk__gt=last_id)[:batch_size])
+                if not batch:
+                    break
+                names = list({post.image.name for post in batch})
+                hashes = dict(zip(names, pool.map(read_blurhash, names)))
+                changed = []
+                for post in batch:
+                    post.image_blurhash = hashes[post.image.name]
+                    if post.image_blurhash:
+                        changed.append(post)
+                with transaction.atomic():
+                    Post.objects.bulk_update(changed, ['image_blurhash'])
+                updated += len(changed)
+                last_id = batch[-1].pk
+        self.stdout.write(f'Заглушек посчитано: {updated}')
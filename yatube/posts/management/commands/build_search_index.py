@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from posts import search
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересобирает поисковый индекс постов: FTS5 или обратный индекс '
+        'в SEARCH_INDEX_DIR, смотря по SEARCH_BACKEND.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=2000,
+            help='Сколько постов читать из базы за раз.',
+        )
+
+    def handle(self, *args, **options):
+        if search.backend() == search.BACKEND_FTS5:
+            search.install(rebuild=True)
+            self.stdout.write('Индекс FTS5 пересобран')
+            return
+        indexed = 0
+
+        def documents():
+            nonlocal indexed
+            for document in Post.objects.order_by('pk').values_list(
+                'pk', 'text'
+            ).iterator(chunk_size=options['batch_size']):
+                indexed += 1
+                yield document
+
+        index = search.post_index()
+        index.rebuild(documents())
+        self.stdout.write(
+            f'Проиндексировано постов: {indexed}, слов: {len(index)}'
+        )
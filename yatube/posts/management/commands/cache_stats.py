@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from posts.caching import stampede_stats
+
+
+class Command(BaseCommand):
+    help = 'Показывает счётчики кеша: попадания, устаревшие отдачи, пересчёты.'
+
+    def handle(self, *args, **options):
+        for event, count in stampede_stats().items():
+            self.stdout.write(f'{event}: {count}')
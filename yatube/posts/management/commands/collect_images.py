@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from posts.images import collect_images, reconcile_images
+
+
+class Command(BaseCommand):
+    help = 'Удаляет файлы картинок, на которые не ссылается ни один пост.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-hours', type=float, default=24,
+            help='Сколько часов файл должен пробыть без ссылок.',
+        )
+        parser.add_argument(
+            '--reconcile', action='store_true',
+            help='Сначала пересчитать ссылки по постам.',
+        )
+
+    def handle(self, *args, **options):
+        if options['reconcile']:
+            fixed = reconcile_images()
+            self.stdout.write(f'Исправлено счётчиков ссылок: {fixed}')
+        deleted = collect_images(timedelta(hours=options['grace_hours']))
+        self.stdout.write(f'Удалено файлов: {deleted}')
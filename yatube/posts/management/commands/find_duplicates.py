@@ -0,0 +1,127 @@
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing import get_context
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from posts import phash
+from posts.images import read_phash
+from posts.models import Post
+
+# Дерево строится в родителе и достаётся процессам через fork.
+_tree = None
+
+
+def search_chunk(values, radius):
+    """Пары соседних хешей для части хешей — в дочернем процессе."""
+    return [
+        (value, other)
+        for value in values
+        for _, other, _ in _tree.search(value, radius)
+        if other > value
+    ]
+
+
+def find_root(parents, value):
+    while parents[value] != value:
+        parents[value] = parents[parents[value]]
+        value = parents[value]
+    return value
+
+
+class Command(BaseCommand):
+    help = 'Ищет группы почти одинаковых картинок постов на всех ядрах.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Число процессов; по умолчанию — по числу ядер.',
+        )
+        parser.add_argument(
+            '--distance', type=int, default=phash.MAX_DISTANCE,
+            help='Наибольшее расстояние Хэмминга между хешами в группе.',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=500,
+            help='Сколько хешей отдавать процессу за раз.',
+        )
+
+    def backfill(self, pool):
+        """Досчитывает хеши постов, сохранённых до их появления."""
+        names = list(
+            Post.objects.exclude(image='').filter(
+                image_phash__isnull=True
+            ).order_by().values_list('image', flat=True).distinct()
+        )
+        hashes = dict(zip(names, pool.map(read_phash, names)))
+        with transaction.atomic():
+            for name, value in hashes.items():
+                if value is not None:
+                    Post.objects.filter(image=name).update(
+                        image_phash=phash.to_db(value)
+                    )
+        return sum(value is not None for value in hashes.values())
+
+    def handle(self, *args, **options):
+        global _tree
+        context = get_context('fork')
+        # Дочерние процессы наследуют настроенный Django через fork, но не
+        # должны делить с родителем открытые соединения с базой.
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=options['workers'], mp_context=context,
+            initializer=connections.close_all,
+        ) as pool:
+            hashed = self.backfill(pool)
+        names = {}
+        for name, value in Post.objects.exclude(image='').filter(
+            image_phash__isnull=False
+        ).order_by().values_list('image', 'image_phash').distinct():
+            names.setdefault(phash.from_db(value), set()).add(name)
+        _tree = phash.BKTree()
+        for value in names:
+            _tree.add(value, value)
+        values = list(names)
+        chunk = options['chunk_size']
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=options['workers'], mp_context=context,
+            initializer=connections.close_all,
+        ) as pool:
+            chunks = pool.map(
+                partial(search_chunk, radius=options['distance']),
+                [values[start:start + chunk]
+                 for start in range(0, len(values), chunk)],
+            )
+            pairs = [pair for pairs in chunks for pair in pairs]
+        parents = {value: value for value in values}
+        for value, other in pairs:
+            parents[find_root(parents, value)] = find_root(parents, other)
+        clusters = {}
+        for value in values:
+            clusters.setdefault(find_root(parents, value), set()).update(
+                names[value]
+            )
+        clusters = [
+            sorted(cluster) for cluster in clusters.values()
+            if len(cluster) > 1
+        ]
+        posts = Counter(
+            Post.objects.filter(
+                image__in=[name for cluster in clusters for name in cluster]
+            ).values_list('image', flat=True)
+        )
+        clusters.sort(key=lambda cluster: -sum(posts[n] for n in cluster))
+        for cluster in clusters:
+            self.stdout.write(
+                f'Группа из {len(cluster)} файлов, постов: '
+                f'{sum(posts[name] for name in cluster)}'
+            )
+            for name in cluster:
+                self.stdout.write(f'  {name} ({posts[name]})')
+        self.stdout.write(
+            f'Досчитано хешей: {hashed}, групп дубликатов: {len(clusters)}'
+        )
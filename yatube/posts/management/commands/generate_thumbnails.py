@@ -0,0 +1,46 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Создаёт недостающие миниатюры картинок постов на всех ядрах.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Число процессов; по умолчанию — по числу ядер.',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=20,
+            help='Сколько картинок отдавать процессу за раз.',
+        )
+
+    def handle(self, *args, **options):
+        names = list(
+            Post.objects.exclude(image='').order_by().values_list(
+                'image', flat=True
+            ).distinct()
+        )
+        # Дочерние процессы наследуют настроенный Django через fork, но не
+        # должны делить с родителем открытые соединения с базой.
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=options['workers'], mp_context=get_context('fork'),
+            initializer=connections.close_all,
+        ) as pool:
+            done = sum(
+                bool(sizes) for sizes in pool.map(
+                    thumbnails.generate_in_process, names,
+                    chunksize=options['chunk_size'],
+                )
+            )
+        self.stdout.write(
+            f'Картинок с миниатюрами: {done}, пропущено: {len(names) - done}'
+        )
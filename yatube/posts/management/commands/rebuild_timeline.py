@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.feeds import rebuild_timeline
+from posts.models import Follow, TimelineEntry
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает материализованные ленты подписок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', action='append', dest='usernames', default=[],
+            help='Пересобрать ленту только этого пользователя.',
+        )
+
+    def handle(self, *args, **options):
+        followers = Follow.objects.order_by('user_id').values_list(
+            'user_id', flat=True
+        ).distinct()
+        if options['usernames']:
+            followers = followers.filter(
+                user__username__in=options['usernames']
+            )
+        else:
+            # Ленты тех, кто уже ни на кого не подписан.
+            TimelineEntry.objects.exclude(
+                user_id__in=Follow.objects.values('user_id')
+            ).delete()
+        rebuilt = 0
+        for user_id in followers.iterator():
+            with transaction.atomic():
+                rebuild_timeline(user_id)
+            rebuilt += 1
+        self.stdout.write(f'Пересобрано лент: {rebuilt}')
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.models import User
+from posts.stats import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Сверяет счётчики профилей с базой и исправляет расхождения.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько пользователей сверять за одну транзакцию.',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        fixed = 0
+        while True:
+            user_ids = list(
+                User.objects.filter(pk__gt=last_id).order_by('pk').values_list(
+                    'pk', flat=True
+                )[:batch_size]
+            )
+            if not user_ids:
+                break
+            with transaction.atomic():
+                fixed += reconcile(user_ids)
+            last_id = user_ids[-1]
+        self.stdout.write(f'Исправлено записей: {fixed}')
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-18 06:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0020_post_image_blurhash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_phash',
+            field=models.BigIntegerField(blank=True, editable=False, null=True, verbose_name='Перцептивный хеш картинки'),
+        ),
+    ]
@@ -1,8 +1,265 @@
-from django.core.paginator import Paginator
+import binascii
+import json
+from datetime import datetime
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 
-from yatube.settings import PAGINATOR_COUNT
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import (
+    EmptyPage, Page, PageNotAnInteger, Paginator
+)
+from django.db.models import Q, QuerySet
+from django.utils.functional import cached_property
 
+KEYSET_MODE = 'keyset'
 
-def paginator_page(request, queryset):
+
+class KeysetPage(Page):
+    """Страница курсорной пагинации: знает только соседей, но не номер."""
+
+    def __init__(self, object_list, paginator, cursor=None,
+                 next_cursor=None, previous_cursor=None):
+        super().__init__(object_list, None, paginator)
+        self.cursor = cursor
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<Page after {self.cursor or "start"}>'
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class KeysetPaginator(Paginator):
+    """
+    Пагинатор по ключу сортировки, например (pub_date, id), вместо OFFSET.
+
+    Соседние страницы выбираются условием по последнему показанному ключу,
+    поэтому запрос к странице 5000 стоит столько же, сколько к первой;
+    COUNT(*) не выполняется.
+    """
+    cursor_based = True
+
+    def __init__(self, object_list, per_page):
+        super().__init__(object_list, per_page)
+        # Ключ — поля сортировки ленты с направлениями, пары
+        # (поле, по убыванию); аннотации тоже годятся. Явная сортировка
+        # должна быть однозначной, к Meta.ordering для однозначности
+        # добавляется id.
+        ordering = object_list.query.order_by
+        if not ordering:
+            ordering = (*object_list.model._meta.ordering, '-id')
+        self.keys = tuple(
+            (key.lstrip('-'), key.startswith('-')) for key in ordering
+        )
+        self.fields = tuple(field for field, _ in self.keys)
+
+    def _ordering(self, reverse=False):
+        return [
+            f'-{field}' if descending != reverse else field
+            for field, descending in self.keys
+        ]
+
+    def get_page(self, after=None, before=None):
+        """Возвращает страницу после/до курсора; битый курсор — начало."""
+        before_values = self.decode_cursor(before)
+        if before_values is not None:
+            return self._page_before(before, before_values)
+        after_values = self.decode_cursor(after)
+        if after_values is not None:
+            return self._page_after(after, after_values)
+        return self._page_after()
+
+    def _page_after(self, cursor=None, values=None):
+        queryset = self.object_list.order_by(*self._ordering())
+        if values is not None:
+            queryset = queryset.filter(self._seek(values))
+        rows = list(queryset[:self.per_page + 1])
+        items = rows[:self.per_page]
+        return KeysetPage(
+            items, self, cursor,
+            next_cursor=(
+                self.encode_cursor(items[-1])
+                if len(rows) > self.per_page else None
+            ),
+            previous_cursor=(
+                self.encode_cursor(items[0])
+                if values is not None and items else None
+            ),
+        )
+
+    def _page_before(self, cursor, values):
+        rows = list(
+            self.object_list.filter(
+                self._seek(values, reverse=True)
+            ).order_by(*self._ordering(reverse=True))[:self.per_page + 1]
+        )
+        if len(rows) <= self.per_page:
+            # Дошли до начала ленты — отдаём полную первую страницу.
+            return self._page_after()
+        items = rows[:self.per_page][::-1]
+        return KeysetPage(
+            items, self, cursor,
+            next_cursor=self.encode_cursor(items[-1]),
+            previous_cursor=self.encode_cursor(items[0]),
+        )
+
+    def _seek(self, values, reverse=False):
+        """
+        Строит (k1 < v1) OR (k1 = v1 AND k2 < v2) OR ... для ключа.
+
+        Для полей по возрастанию, как и при обходе назад, сравнение
+        обратное. Сверху добавлена лишняя по смыслу граница k1 <= v1:
+        по OR-условию SQLite не видит диапазона и сканирует индекс
+        с начала, а по ней ищет в индексе сразу с курсора.
+        """
+        lookups = [
+            'lt' if descending != reverse else 'gt'
+            for _, descending in self.keys
+        ]
+        condition = Q()
+        for position, field in enumerate(self.fields):
+            equal = dict(zip(self.fields[:position], values))
+            condition |= Q(
+                **equal, **{f'{field}__{lookups[position]}': values[position]}
+            )
+        if len(self.keys) > 1:
+            condition &= Q(**{f'{self.fields[0]}__{lookups[0]}e': values[0]})
+        return condition
+
+    def encode_cursor(self, obj):
+        values = [getattr(obj, field) for field in self.fields]
+        values = [
+            value.isoformat() if isinstance(value, datetime) else value
+            for value in values
+        ]
+        return urlsafe_b64encode(
+            json.dumps(values).encode()
+        ).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return None
+        try:
+            values = json.loads(
+                urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            )
+            if len(values) != len(self.keys):
+                return None
+            return [
+                self._field(key).to_python(value)
+                for key, value in zip(self.fields, values)
+            ]
+        except (binascii.Error, ValueError, TypeError, ValidationError):
+            return None
+
+    def _field(self, key):
+        annotation = self.object_list.query.annotations.get(key)
+        if annotation is not None:
+            return annotation.output_field
+        return self.object_list.model._meta.get_field(key)
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Нумерованный пагинатор с приблизительным числом объектов.
+
+    Число берётся из счётчика ленты (см. posts.counts), а не COUNT(*).
+    Страница выбирается с одним лишним объектом, так что по ней видно,
+    врёт ли счётчик; тогда он поправляется точным числом и сохраняется
+    обратно.
+    """
+
+    def __init__(self, object_list, per_page, counter):
+        super().__init__(object_list, per_page)
+        self.counter = counter
+
+    @cached_property
+    def count(self):
+        return self.counter.get()
+
+    def validate_number(self, number):
+        """Верхнюю границу не проверяем: число страниц приблизительное."""
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('Номер страницы не число')
+        if number < 1:
+            raise EmptyPage('Номер страницы меньше 1')
+        return number
+
+    def get_page(self, number):
+        try:
+            return super().get_page(number)
+        except EmptyPage:
+            return self.page(self.num_pages)
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if len(rows) <= self.per_page:
+            if not rows and number > 1:
+                # Страница за концом ленты: дальше отдадим последнюю.
+                self._correct_count(self.object_list.count())
+                raise EmptyPage('Страница пуста')
+            self._correct_count(bottom + len(rows))
+        elif self.count <= bottom + self.per_page:
+            # За страницей есть ещё объекты, а сколько — не видно: в счётчик
+            # идёт только точное число.
+            self._correct_count(self.object_list.count())
+        return self._get_page(rows[:self.per_page], number, self)
+
+    def _correct_count(self, count):
+        if count != self.count:
+            self.__dict__['count'] = count
+            self.__dict__.pop('num_pages', None)
+            self.counter.set(count)
+
+
+def page_window(page, on_each_side=2, on_ends=1):
+    """
+    Номера страниц для виджета: окно вокруг текущей и края ленты.
+
+    None обозначает пропуск. Диапазон страниц не материализуется,
+    так что размер ответа не зависит от числа страниц.
+    """
+    number = page.number
+    num_pages = page.paginator.num_pages
+    left = max(number - on_each_side, 1)
+    right = min(number + on_each_side, num_pages)
+    window = []
+    if left > on_ends + 2:
+        window.extend(range(1, on_ends + 1))
+        window.append(None)
+    else:
+        window.extend(range(1, left))
+    window.extend(range(left, right + 1))
+    if right < num_pages - on_ends - 1:
+        window.append(None)
+        window.extend(range(num_pages - on_ends + 1, num_pages + 1))
+    else:
+        window.extend(range(right + 1, num_pages + 1))
+    return window
+
+
+def paginator_page(request, queryset, counter=None):
+    # Ленты, собранные не из QuerySet (MergedFeed), листаются по номерам.
+    if (settings.PAGINATOR_MODE == KEYSET_MODE
+            and isinstance(queryset, QuerySet)):
+        return KeysetPaginator(queryset, settings.PAGINATOR_COUNT).get_page(
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+        )
+    if counter is not None:
+        return CachedCountPaginator(
+            queryset, settings.PAGINATOR_COUNT, counter
+        ).get_page(request.GET.get('page'))
     return Paginator(
-        queryset, PAGINATOR_COUNT).get_page(request.GET.get('page'))
+        queryset, settings.PAGINATOR_COUNT).get_page(request.GET.get('page'))
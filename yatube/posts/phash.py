@@ -0,0 +1,169 @@
+import os
+import threading
+
+import numpy as np
+from django.db import connections
+from PIL import Image
+
+from .models import Post
+
+# dHash: 64 бита — сравнения соседних пикселей уменьшенной серой копии.
+HASH_SIDE = 8
+# Предел расстояния Хэмминга для «почти одинаковых» картинок.
+MAX_DISTANCE = 4
+# Для проверки кандидата: сторона серых копий и допустимое среднее
+# отличие пикселя (из 255) — подпись к мему хеш может и не заметить.
+VERIFY_SIDE = 64
+VERIFY_TOLERANCE = 3.0
+# Столько постов догружается в индекс за один запрос к базе.
+SYNC_BATCH = 1000
+
+BITS = 2 ** np.arange(HASH_SIDE * HASH_SIDE, dtype=np.uint64)
+
+
+def dhash(image):
+    """Перцептивный хеш картинки Pillow: целое от 0 до 2 ** 64."""
+    gray = image.convert('L').resize(
+        (HASH_SIDE + 1, HASH_SIDE), Image.BOX
+    )
+    pixels = np.asarray(gray, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int(BITS[bits].sum(dtype=np.uint64))
+
+
+def to_db(value):
+    """Хеш для BigIntegerField: старший бит — знак."""
+    return value - 2 ** 64 if value >= 2 ** 63 else value
+
+
+def from_db(value):
+    return value + 2 ** 64 if value < 0 else value
+
+
+def distance(first, second):
+    return bin(first ^ second).count('1')
+
+
+def looks_same(first, second):
+    """Поточечная проверка двух картинок Pillow, похожих по хешу."""
+    def pixels(image):
+        return np.asarray(
+            image.convert('L').resize((VERIFY_SIDE, VERIFY_SIDE), Image.BOX),
+            dtype=np.float64,
+        )
+    return np.abs(pixels(first) - pixels(second)).mean() <= VERIFY_TOLERANCE
+
+
+class BKTree:
+    """
+    Дерево Буркхарда — Келлера по расстоянию Хэмминга.
+
+    Поиск в радиусе r обходит только поддеревья на расстоянии d ± r от
+    узла (неравенство треугольника), а не все хеши подряд.
+    """
+
+    def __init__(self):
+        self.root = None
+
+    def add(self, value, item):
+        if self.root is None:
+            self.root = (value, {item}, {})
+            return
+        node = self.root
+        while True:
+            node_value, items, children = node
+            gap = distance(value, node_value)
+            if gap == 0:
+                items.add(item)
+                return
+            if gap not in children:
+                children[gap] = (value, {item}, {})
+                return
+            node = children[gap]
+
+    def search(self, value, radius):
+        """Список (расстояние, хеш, элемент) для хешей не дальше radius."""
+        found = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node_value, items, children = stack.pop()
+            gap = distance(value, node_value)
+            if gap <= radius:
+                found.extend((gap, node_value, item) for item in items)
+            stack.extend(
+                child for key, child in children.items()
+                if gap - radius <= key <= gap + radius
+            )
+        return sorted(found, key=lambda match: match[0])
+
+
+class ImageIndex:
+    """
+    BK-дерево хешей картинок постов в памяти процесса.
+
+    Досчитывает из базы посты новее last_id перед каждым поиском, так что
+    картинки, загруженные другими процессами, видны сразу. Правки старых
+    постов в других процессах видны после перезапуска: индекс — только
+    подсказка, и кандидата всё равно проверяют.
+
+    Все хеши грузит warm() в фоне при первом поиске в процессе; пока
+    загрузка идёт, поиск не ждёт её и смотрит в то, что уже есть. После
+    fork (воркеры gunicorn, uwsgi) индекс в дочернем процессе строится
+    заново: поток загрузки родителя туда не переходит, а его замок мог
+    остаться захваченным.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.tree = BKTree()
+        self.last_id = 0
+        self.lock = threading.Lock()
+        self.loader = None
+
+    def add(self, value, name):
+        with self.lock:
+            self.tree.add(value, name)
+
+    def sync(self):
+        while True:
+            rows = list(Post.objects.filter(
+                pk__gt=self.last_id, image_phash__isnull=False
+            ).exclude(image='').order_by('pk').values_list(
+                'pk', 'image_phash', 'image'
+            )[:SYNC_BATCH])
+            # Дерево блокируем по пачке: поиск успевает между ними.
+            with self.lock:
+                for pk, value, name in rows:
+                    self.tree.add(from_db(value), name)
+                    self.last_id = max(self.last_id, pk)
+            if len(rows) < SYNC_BATCH:
+                return
+
+    def warm(self):
+        """Загружает хеши в фоновом потоке; повторно — ничего не делает."""
+        with self.lock:
+            if self.loader is not None:
+                return
+            self.loader = threading.Thread(
+                target=self._load, name='phash-index', daemon=True
+            )
+        self.loader.start()
+
+    def _load(self):
+        try:
+            self.sync()
+        finally:
+            connections.close_all()
+
+    def search(self, value, radius=MAX_DISTANCE):
+        self.warm()
+        if not self.loader.is_alive():
+            self.sync()
+        with self.lock:
+            return self.tree.search(value, radius)
+
+
+index = ImageIndex()
+os.register_at_fork(after_in_child=index.reset)
@@ -0,0 +1,143 @@
+import base64
+from functools import lru_cache
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+# Заглушка картинки — BlurHash: несколько первых коэффициентов косинусного
+# преобразования, упакованных в строку из base83 (https://blurha.sh).
+BASE83 = (
+    '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+    '#$%*+,-.:;=?@[]^_{|}~'
+)
+# Число компонент по горизонтали и вертикали: 34 символа на картинку.
+COMPONENTS = (5, 3)
+# Размытая картинка не требует деталей: считаем по уменьшенной копии.
+SOURCE_SIDE = 64
+# Длинная сторона картинки-заглушки; растягивает её браузер.
+PREVIEW_SIDE = 16
+
+
+def _base83(value, length):
+    return ''.join(
+        BASE83[value // 83 ** (length - index - 1) % 83]
+        for index in range(length)
+    )
+
+
+def _from_base83(text):
+    value = 0
+    for char in text:
+        value = value * 83 + BASE83.index(char)
+    return value
+
+
+def _to_linear(srgb):
+    srgb = srgb / 255
+    return np.where(
+        srgb <= 0.04045, srgb / 12.92, ((srgb + 0.055) / 1.055) ** 2.4
+    )
+
+
+def _to_srgb(linear):
+    linear = np.clip(linear, 0, 1)
+    return np.round(np.where(
+        linear <= 0.0031308,
+        linear * 12.92 * 255,
+        (1.055 * linear ** (1 / 2.4) - 0.055) * 255,
+    )).astype(np.uint8)
+
+
+def _sign_pow(value, exponent):
+    return np.sign(value) * np.abs(value) ** exponent
+
+
+def _basis(components, size):
+    # cos(pi * k * x / size) для всех k и x разом: матрица components × size.
+    return np.cos(
+        np.pi * np.arange(components)[:, None] * np.arange(size)[None, :]
+        / size
+    )
+
+
+def encode(image, components=COMPONENTS):
+    """BlurHash картинки Pillow."""
+    image = image.convert('RGB')
+    image.thumbnail((SOURCE_SIDE, SOURCE_SIDE), Image.BOX)
+    pixels = _to_linear(np.asarray(image, dtype=np.float64))
+    height, width = pixels.shape[:2]
+    x_components, y_components = components
+    # factors[j, i] = Σ basis_y[j, y] · basis_x[i, x] · pixels[y, x].
+    factors = np.einsum(
+        'jy,ix,yxc->jic',
+        _basis(y_components, height), _basis(x_components, width), pixels,
+    ) / (width * height)
+    factors[1:] *= 2
+    factors[0, 1:] *= 2
+    factors = factors.reshape(-1, 3)
+    dc, ac = factors[0], factors[1:]
+    size_flag = (x_components - 1) + (y_components - 1) * 9
+    if len(ac):
+        quantised_max = int(np.clip(
+            np.floor(np.abs(ac).max() * 166 - 0.5), 0, 82
+        ))
+        maximum = (quantised_max + 1) / 166
+    else:
+        quantised_max, maximum = 0, 1
+    r, g, b = (int(value) for value in _to_srgb(dc))
+    quantised = np.clip(
+        np.floor(_sign_pow(ac / maximum, 0.5) * 9 + 9.5), 0, 18
+    ).astype(int)
+    return (
+        _base83(size_flag, 1) + _base83(quantised_max, 1)
+        + _base83((r << 16) + (g << 8) + b, 4)
+        + ''.join(
+            _base83(int(red) * 19 * 19 + int(green) * 19 + int(blue), 2)
+            for red, green, blue in quantised
+        )
+    )
+
+
+def decode(blurhash, width, height):
+    """Картинка width × height по BlurHash: массив uint8 RGB."""
+    size_flag = _from_base83(blurhash[0])
+    x_components, y_components = size_flag % 9 + 1, size_flag // 9 + 1
+    maximum = (_from_base83(blurhash[1]) + 1) / 166
+    dc = _from_base83(blurhash[2:6])
+    colors = [_to_linear(np.array(
+        [dc >> 16, (dc >> 8) & 255, dc & 255], dtype=np.float64
+    ))]
+    for start in range(6, 6 + 2 * (x_components * y_components - 1), 2):
+        value = _from_base83(blurhash[start:start + 2])
+        quantised = np.array(
+            [value // (19 * 19), value // 19 % 19, value % 19]
+        )
+        colors.append(_sign_pow((quantised - 9) / 9, 2) * maximum)
+    colors = np.array(colors).reshape(y_components, x_components, 3)
+    pixels = np.einsum(
+        'jy,ix,jic->yxc',
+        _basis(y_components, height), _basis(x_components, width), colors,
+    )
+    return _to_srgb(pixels)
+
+
+@lru_cache(maxsize=1024)
+def data_uri(blurhash, width, height):
+    """
+    Заглушка в виде маленького PNG в data: URI — для встраивания в страницу.
+
+    Пропорции — как у картинки; длинная сторона — PREVIEW_SIDE.
+    """
+    if not blurhash or not width or not height:
+        return None
+    scale = PREVIEW_SIDE / max(width, height)
+    pixels = decode(
+        blurhash,
+        max(1, round(width * scale)), max(1, round(height * scale)),
+    )
+    buffer = BytesIO()
+    Image.fromarray(pixels, 'RGB').save(buffer, 'PNG', optimize=True)
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue()
+    ).decode()
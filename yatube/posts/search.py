@@ -0,0 +1,286 @@
+import binascii
+import json
+import re
+import threading
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models.expressions import RawSQL
+
+from .feeds import feed_posts
+from .inverted_index import InvertedIndex
+from .models import Post
+from .paginator import KeysetPage
+
+# Чем искать (settings.SEARCH_BACKEND): FTS5 в SQLite или свой обратный
+# индекс в файлах (posts.inverted_index) — для баз без FTS5.
+BACKEND_AUTO = 'auto'
+BACKEND_FTS5 = 'fts5'
+BACKEND_INDEX = 'index'
+
+FTS_TABLE = 'posts_post_fts'
+# Индекс внешнего содержимого: текст хранится только в posts_post, а
+# триггеры переносят в индекс каждую вставку, правку и удаление — в том
+# числе из bulk_create и update(), которые обходят сигналы. Миграция
+# 0022 хранит свою копию этого SQL: меняя его, добавьте новую миграцию.
+INSTALL_SQL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "text, content='posts_post', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert "
+    "AFTER INSERT ON posts_post BEGIN "
+    f"INSERT INTO {FTS_TABLE} (rowid, text) VALUES (new.id, new.text); "
+    "END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete "
+    "AFTER DELETE ON posts_post BEGIN "
+    f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, text) "
+    "VALUES ('delete', old.id, old.text); "
+    "END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update "
+    "AFTER UPDATE OF text ON posts_post BEGIN "
+    f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, text) "
+    "VALUES ('delete', old.id, old.text); "
+    f"INSERT INTO {FTS_TABLE} (rowid, text) VALUES (new.id, new.text); "
+    "END",
+]
+REBUILD_SQL = f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('rebuild')"
+UNINSTALL_SQL = [
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_insert',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_delete',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_update',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+# Слова запроса; больше MAX_TERMS не ищем.
+WORD = re.compile(r'\w+')
+MAX_TERMS = 10
+# По стольку id из обратного индекса проверяем в базе фильтры страницы.
+INDEX_CHUNK = 200
+
+_fts5 = {}
+_index = None
+_index_lock = threading.Lock()
+
+
+def supported(using=connection):
+    """Есть ли в базе FTS5: SQLite бывает собран и без него."""
+    if using.vendor != 'sqlite':
+        return False
+    if using.alias not in _fts5:
+        with using.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            _fts5[using.alias] = bool(cursor.fetchone()[0])
+    return _fts5[using.alias]
+
+
+def backend(using=connection):
+    if settings.SEARCH_BACKEND == BACKEND_AUTO:
+        return BACKEND_FTS5 if supported(using) else BACKEND_INDEX
+    return settings.SEARCH_BACKEND
+
+
+def post_index():
+    """Обратный индекс процесса: открывается при первом поиске."""
+    global _index
+    with _index_lock:
+        if (_index is None
+                or _index.directory != settings.SEARCH_INDEX_DIR):
+            _index = InvertedIndex(settings.SEARCH_INDEX_DIR)
+        return _index
+
+
+def reindex_post(pk, old_text, new_text):
+    """
+    Переносит правку текста поста в обратный индекс после коммита.
+
+    У FTS5 для этого триггеры. Журнал индекса пишется только после
+    коммита: так rebuild не потеряет правку (см. InvertedIndex.rebuild).
+    """
+    if old_text == new_text or backend() != BACKEND_INDEX:
+        return
+    transaction.on_commit(
+        lambda: post_index().update(pk, old_text, new_text)
+    )
+
+
+def install(using=connection, rebuild=False):
+    """Создаёт индекс и триггеры, если их нет; rebuild — переиндексирует."""
+    if not supported(using):
+        return
+    with using.cursor() as cursor:
+        for statement in INSTALL_SQL:
+            cursor.execute(statement)
+        if rebuild:
+            cursor.execute(REBUILD_SQL)
+
+
+def uninstall(using=connection):
+    if not supported(using):
+        return
+    with using.cursor() as cursor:
+        for statement in UNINSTALL_SQL:
+            cursor.execute(statement)
+
+
+def match_query(query):
+    """
+    Запрос FTS5 из того, что ввёл пользователь: все слова, как префиксы.
+
+    Слова берутся в кавычки, так что синтаксис FTS5 (NEAR, OR, "-", "*")
+    во вводе ничего не ломает. Пустая строка — искать нечего.
+    """
+    terms = WORD.findall(query.lower())[:MAX_TERMS]
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search_terms(query):
+    return ' '.join(WORD.findall(query)[:MAX_TERMS])
+
+
+def matching_ids(query):
+    """
+    id постов, где есть все слова, для filter(pk__in=...): подзапрос FTS5
+    или список из обратного индекса. None — искать нечего.
+    """
+    if not match_query(query):
+        return None
+    if backend() == BACKEND_INDEX:
+        return post_index().search(search_terms(query))
+    return RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+        [match_query(query)],
+    )
+
+
+def encode_cursor(rank, pk):
+    return urlsafe_b64encode(
+        json.dumps([rank, pk]).encode()
+    ).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        rank, pk = json.loads(
+            urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        )
+        return float(rank), int(pk)
+    except (binascii.Error, ValueError, TypeError):
+        return None
+
+
+class SearchPaginator:
+    """
+    Курсорная пагинация результатов поиска по релевантности.
+
+    Порядок — (bm25, id): у FTS5 меньший bm25 значит «лучше». Соседние
+    страницы выбираются условием по ключу последнего показанного поста,
+    как в KeysetPaginator, без OFFSET. Но bm25 считается и сортируется
+    по всем совпадениям на каждой странице, так что страница стоит
+    столько, сколько всех найденных постов, а не только её строк.
+    У обратного индекса релевантности нет: посты идут от новых к старым,
+    ключ — (-id, id).
+    """
+    cursor_based = True
+
+    def __init__(self, query, per_page, group=None, author=None):
+        self.terms = search_terms(query)
+        self.match = match_query(query)
+        self.per_page = per_page
+        self.group = group
+        self.author = author
+
+    def get_page(self, after=None, before=None):
+        if not self.match:
+            return KeysetPage([], self)
+        before_key = decode_cursor(before)
+        if before_key is not None:
+            rows = self._rows(before_key, backwards=True)
+            if len(rows) <= self.per_page:
+                return self._page_after()
+            rows = rows[:self.per_page][::-1]
+            return KeysetPage(
+                self._posts(rows), self, before,
+                next_cursor=encode_cursor(*rows[-1]),
+                previous_cursor=encode_cursor(*rows[0]),
+            )
+        after_key = decode_cursor(after)
+        return self._page_after(after if after_key else None, after_key)
+
+    def _page_after(self, cursor=None, key=None):
+        rows = self._rows(key)
+        items = rows[:self.per_page]
+        return KeysetPage(
+            self._posts(items), self, cursor,
+            next_cursor=(
+                encode_cursor(*items[-1])
+                if len(rows) > self.per_page else None
+            ),
+            previous_cursor=(
+                encode_cursor(*items[0]) if key is not None and items
+                else None
+            ),
+        )
+
+    def _rows(self, key=None, backwards=False):
+        """(bm25, id) подходящих постов после ключа (или до него)."""
+        if backend() == BACKEND_INDEX:
+            return self._index_rows(key, backwards)
+        conditions = [f'{FTS_TABLE} MATCH %s']
+        params = [self.match]
+        if self.group is not None:
+            conditions.append('post.group_id = %s')
+            params.append(self.group.pk)
+        if self.author is not None:
+            conditions.append('post.author_id = %s')
+            params.append(self.author.pk)
+        if key is not None:
+            sign = '<' if backwards else '>'
+            conditions.append(
+                f'(rank {sign} %s '
+                f'OR (rank = %s AND post.id {sign} %s))'
+            )
+            params += [key[0], key[0], key[1]]
+        order = 'DESC' if backwards else 'ASC'
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rank, post.id FROM {FTS_TABLE} '
+                f'JOIN posts_post AS post ON post.id = {FTS_TABLE}.rowid '
+                f'WHERE {" AND ".join(conditions)} '
+                f'ORDER BY rank {order}, post.id {order} LIMIT %s',
+                params + [self.per_page + 1],
+            )
+            return cursor.fetchall()
+
+    def _index_rows(self, key=None, backwards=False):
+        ids = post_index().search(self.terms)
+        if key is not None:
+            pk = key[1]
+            ids = (
+                [found for found in reversed(ids) if found > pk]
+                if backwards else [found for found in ids if found < pk]
+            )
+        # Фильтры страницы проверяем в базе по кускам, пока не наберём
+        # страницу; заодно отсеются посты, удалённые после записи индекса.
+        posts = Post.objects.order_by()
+        if self.group is not None:
+            posts = posts.filter(group=self.group)
+        if self.author is not None:
+            posts = posts.filter(author=self.author)
+        limit = self.per_page + 1
+        rows = []
+        for start in range(0, len(ids), INDEX_CHUNK):
+            chunk = ids[start:start + INDEX_CHUNK]
+            found = set(
+                posts.filter(pk__in=chunk).values_list('pk', flat=True)
+            )
+            rows += [(-pk, pk) for pk in chunk if pk in found]
+            if len(rows) >= limit:
+                break
+        return rows[:limit]
+
+    def _posts(self, rows):
+        posts = feed_posts().in_bulk([pk for _, pk in rows])
+        return [posts[pk] for _, pk in rows if pk in posts]
@@ -0,0 +1,155 @@
+from django.conf import settings
+from django.db.models.signals import (
+    post_delete, post_save, pre_delete, pre_save
+)
+from django.dispatch import receiver
+
+from users import autocomplete
+
+from . import (
+    caching, counts, feeds, hashtags, images, phash, search, thumbnails
+)
+from .models import Comment, Follow, Group, Post
+from .stats import change_stats
+
+
+def bump_profiles(*user_ids):
+    caching.bump_tags(
+        *(caching.page_tag(caching.TAG_PROFILE, pk) for pk in user_ids)
+    )
+
+
+def bump_comment_pages(comment):
+    # Страница поста и счётчик комментариев в профиле автора комментария.
+    caching.bump_tags(caching.page_tag(caching.TAG_POST, comment.post_id))
+    bump_profiles(comment.author_id)
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, **kwargs):
+    # Группа до правки нужна, чтобы перенести пост между счётчиками,
+    # картинка — чтобы не пересчитывать её сведения и миниатюры зря,
+    # текст — чтобы убрать из поискового индекса пропавшие слова.
+    (instance._previous_group_id, instance._previous_image,
+     instance._previous_text) = (
+        Post.objects.filter(pk=instance.pk).values_list(
+            'group_id', 'image', 'text'
+        ).first()
+        if instance.pk else None
+    ) or (None, '', '')
+    if instance.image.name != instance._previous_image or (
+        instance.image and not instance.image._committed
+    ):
+        images.update_metadata(instance)
+
+
+def image_replaced(post):
+    """Ссылки на файлы, миниатюры и индекс хешей после смены картинки."""
+    if post.image:
+        images.retain_image(post.image.name)
+        thumbnails.schedule(post.image.name)
+        if post.image_phash is not None:
+            phash.index.add(phash.from_db(post.image_phash), post.image.name)
+    if post._previous_image:
+        images.release_image(post._previous_image)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    feeds.invalidate_author_timeline(instance.author_id)
+    caching.bump_tags(*caching.post_tags(instance))
+    if instance._previous_group_id is not None:
+        caching.bump_tags(
+            caching.page_tag(caching.TAG_GROUP, instance._previous_group_id)
+        )
+    if created:
+        change_stats(instance.author_id, posts=1)
+        counts.shift_counts(counts.post_count_keys(instance), 1)
+    elif instance._previous_group_id != instance.group_id:
+        if instance._previous_group_id is not None:
+            counts.shift_counts(
+                [counts.count_key(
+                    counts.FEED_GROUP, instance._previous_group_id
+                )], -1
+            )
+        if instance.group_id is not None:
+            counts.shift_counts(
+                [counts.count_key(counts.FEED_GROUP, instance.group_id)], 1
+            )
+    if created and settings.FOLLOW_FEED_ENGINE == feeds.ENGINE_FANOUT:
+        feeds.fan_out_post(instance)
+    if instance.image.name != instance._previous_image:
+        image_replaced(instance)
+    search.reindex_post(instance.pk, instance._previous_text, instance.text)
+    if created or instance._previous_text != instance.text:
+        # Страницы тегов, с которых пост ушёл; у нынешних — в post_tags.
+        caching.bump_tags(*caching.hashtag_tags(
+            hashtags.update_post_tags(instance, instance._previous_text)
+        ))
+
+
+@receiver(pre_delete, sender=Post)
+def post_deleting(sender, instance, **kwargs):
+    # После удаления связей с тегами уже не найти.
+    instance._tag_ids = hashtags.linked_tag_ids(instance)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    feeds.invalidate_author_timeline(instance.author_id)
+    caching.bump_tags(*caching.post_tags(instance))
+    change_stats(instance.author_id, create=False, posts=-1)
+    counts.shift_counts(counts.post_count_keys(instance), -1)
+    if instance.image:
+        images.release_image(instance.image.name)
+    search.reindex_post(instance.pk, instance.text, '')
+    hashtags.post_removed(instance, instance._tag_ids)
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    # Название группы выводится в карточках постов: на главной, в профилях
+    # их авторов и на страницах самих постов (у них есть тег группы).
+    author_ids = instance.posts.order_by().values_list(
+        'author_id', flat=True
+    ).distinct()
+    caching.bump_tags(
+        caching.TAG_INDEX,
+        caching.page_tag(caching.TAG_GROUP, instance.pk),
+        *(caching.page_tag(caching.TAG_PROFILE, pk) for pk in author_ids)
+    )
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, **kwargs):
+    if created:
+        change_stats(instance.author_id, followers=1)
+        change_stats(instance.user_id, following=1)
+        autocomplete.index.shift_followers(instance.author_id, 1)
+        bump_profiles(instance.author_id, instance.user_id)
+    if created and settings.FOLLOW_FEED_ENGINE == feeds.ENGINE_FANOUT:
+        feeds.backfill_timeline(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    change_stats(instance.author_id, create=False, followers=-1)
+    change_stats(instance.user_id, create=False, following=-1)
+    autocomplete.index.shift_followers(instance.author_id, -1)
+    bump_profiles(instance.author_id, instance.user_id)
+    if settings.FOLLOW_FEED_ENGINE == feeds.ENGINE_FANOUT:
+        feeds.remove_from_timeline(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        change_stats(instance.author_id, comments=1)
+    bump_comment_pages(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    change_stats(instance.author_id, create=False, comments=-1)
+    bump_comment_pages(instance)
@@ -0,0 +1,96 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+
+from .models import Comment, Follow, Post, UserStats
+
+COUNTERS = {
+    'posts': (Post, 'author_id'),
+    'followers': (Follow, 'author_id'),
+    'following': (Follow, 'user_id'),
+    'comments': (Comment, 'author_id'),
+}
+
+
+def exact_counts(user_ids):
+    """Точные значения счётчиков: по одному GROUP BY на счётчик."""
+    counts = {user_id: dict.fromkeys(COUNTERS, 0) for user_id in user_ids}
+    for name, (model, field) in COUNTERS.items():
+        rows = model.objects.filter(
+            **{f'{field}__in': user_ids}
+        ).order_by().values_list(field).annotate(Count('pk'))
+        for user_id, count in rows:
+            counts[user_id][name] = count
+    return counts
+
+
+def shifted(deltas):
+    """
+    Выражения UPDATE для сдвига счётчиков; вычитание не уходит ниже нуля.
+
+    Счётчик мог разойтись с базой (запись создана по точным значениям
+    параллельно с удалением, ручная правка): без Greatest удаление
+    нарушило бы CHECK положительного поля. Расхождения правит reconcile.
+    """
+    return {
+        name: F(name) + delta if delta >= 0 else Greatest(F(name) + delta, 0)
+        for name, delta in deltas.items()
+    }
+
+
+def change_stats(user_id, create=True, **deltas):
+    """
+    Атомарно сдвигает счётчики пользователя UPDATE ... SET x = x + d.
+
+    Если записи ещё нет, она создаётся по точным значениям, в которые
+    текущее изменение уже входит. При удалениях запись не создаётся:
+    пользователь может удаляться каскадом вместе с ней. Вызывается из
+    сигналов, так что в одной транзакции с правкой оказывается, когда
+    её сохраняют внутри transaction.atomic(), как это делают views.
+    """
+    with transaction.atomic():
+        updated = UserStats.objects.filter(user_id=user_id).update(
+            **shifted(deltas)
+        )
+        if updated or not create:
+            return
+        try:
+            with transaction.atomic():
+                UserStats.objects.create(
+                    user_id=user_id, **exact_counts([user_id])[user_id]
+                )
+        except IntegrityError:
+            # Запись успел создать параллельный запрос.
+            UserStats.objects.filter(user_id=user_id).update(
+                **shifted(deltas)
+            )
+
+
+def user_stats(user):
+    """Счётчики пользователя; недостающая запись создаётся на лету."""
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        stats, _ = UserStats.objects.get_or_create(
+            user_id=user.pk, defaults=exact_counts([user.pk])[user.pk]
+        )
+        return stats
+
+
+def reconcile(user_ids):
+    """Сверяет счётчики пачки пользователей с базой; число правок."""
+    counts = exact_counts(user_ids)
+    existing = UserStats.objects.in_bulk(user_ids)
+    changed, missing = [], []
+    for user_id, values in counts.items():
+        stats = existing.get(user_id)
+        if stats is None:
+            missing.append(UserStats(user_id=user_id, **values))
+        elif any(getattr(stats, name) != value
+                 for name, value in values.items()):
+            for name, value in values.items():
+                setattr(stats, name, value)
+            changed.append(stats)
+    UserStats.objects.bulk_update(changed, list(COUNTERS))
+    UserStats.objects.bulk_create(missing, ignore_conflicts=True)
+    return len(changed) + len(missing)
@@ -0,0 +1,99 @@
+import hashlib
+import os
+import tempfile
+
+from django.apps import apps
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+
+CHUNK_SIZE = 64 * 1024
+# Два уровня каталогов по два символа хеша: 65 536 каталогов, в каждом
+# на миллионах картинок — десятки файлов.
+SHARD_LEVELS = 2
+SHARD_WIDTH = 2
+
+
+def content_name(name, content):
+    """
+    Имя файла по содержимому: posts/ab/cd/abcd….jpg для posts/photo.jpg.
+
+    Каталог загрузки и расширение берутся из исходного имени. Хеш,
+    уже посчитанный для загрузки (sha256, см. images.read_metadata),
+    переиспользуется.
+    """
+    hexdigest = getattr(content, 'sha256', None)
+    if hexdigest is None:
+        digest = hashlib.sha256()
+        for chunk in content.chunks(CHUNK_SIZE):
+            digest.update(chunk)
+        content.seek(0)
+        hexdigest = digest.hexdigest()
+    shards = [
+        hexdigest[level * SHARD_WIDTH:(level + 1) * SHARD_WIDTH]
+        for level in range(SHARD_LEVELS)
+    ]
+    directory, filename = os.path.split(name)
+    extension = os.path.splitext(filename)[1].lower()
+    return os.path.join(directory, *shards, hexdigest + extension)
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Хранилище, где имя файла — хеш его содержимого.
+
+    Одинаковые загрузки ложатся в один файл: второй раз он не пишется.
+    Сколько постов ссылается на файл, считает StoredImage; удаляет
+    файлы без ссылок сборщик (команда collect_images), а не сама запись.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        return super().save(content_name(name, content), content, max_length)
+
+    def get_available_name(self, name, max_length=None):
+        # Файл с тем же именем — с тем же содержимым: его и переиспользуем.
+        return name
+
+    def _save(self, name, content):
+        if self.exists(name) and self._claim(name):
+            return name
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        # Пишем рядом и переименовываем: параллельная загрузка того же
+        # файла заменит его таким же, а читатели не увидят половину.
+        descriptor, temporary = tempfile.mkstemp(
+            dir=directory, prefix='.upload-'
+        )
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                for chunk in content.chunks():
+                    file.write(chunk)
+            os.chmod(temporary, self.file_permissions_mode or 0o644)
+            os.replace(temporary, full_path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        return name
+
+    def _claim(self, name):
+        """
+        Бережёт лежащий файл от сборщика; False, если записи о нём нет.
+
+        Файл без ссылок получает новое время освобождения, и collect_images
+        его не тронет. Записи нет — файл мог как раз удаляться сборщиком:
+        надёжнее записать его заново.
+        """
+        stored_images = apps.get_model('posts', 'StoredImage').objects
+        return stored_images.filter(name=name).update(released=Case(
+            When(refs=0, then=Value(timezone.now())),
+            default=F('released'),
+        )) > 0
@@ -0,0 +1,64 @@
+from django import template
+from django.core.cache.utils import make_template_fragment_key
+
+from posts import caching
+
+register = template.Library()
+
+
+class FeedCacheNode(template.Node):
+    def __init__(self, nodelist, timeout, fragment_name, vary_on, version):
+        self.nodelist = nodelist
+        self.timeout = timeout
+        self.fragment_name = fragment_name
+        self.vary_on = vary_on
+        self.version = version
+
+    def render(self, context):
+        timeout = self.timeout.resolve(context)
+        try:
+            timeout = int(timeout)
+        except (ValueError, TypeError):
+            raise template.TemplateSyntaxError(
+                f'"cache" tag got a non-integer timeout value: {timeout!r}'
+            )
+        key = make_template_fragment_key(
+            self.fragment_name,
+            [var.resolve(context) for var in self.vary_on],
+        )
+        version = (
+            self.version.resolve(context) if self.version is not None
+            else None
+        )
+        return caching.fetch(
+            key, lambda: self.nodelist.render(context), timeout, version
+        )
+
+
+@register.tag('cache')
+def do_cache(parser, token):
+    """
+    Как {% cache %} из django, но с защитой от набегов (caching.fetch).
+
+        {% cache timeout name [vary_on ...] [version=...] %}
+
+    С version фрагмент хранится под одним ключом для всех версий: после
+    смены версии его пересчитывает один запрос, прочие отдают старый.
+    """
+    nodelist = parser.parse(('endcache',))
+    parser.delete_first_token()
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(
+            f"'{bits[0]}' tag requires at least 2 arguments."
+        )
+    version = None
+    if bits[-1].startswith('version='):
+        version = parser.compile_filter(bits.pop()[len('version='):])
+    return FeedCacheNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        bits[2],
+        [parser.compile_filter(bit) for bit in bits[3:]],
+        version,
+    )
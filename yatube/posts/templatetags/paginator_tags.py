@@ -0,0 +1,11 @@
+from django import template
+
+from posts import paginator
+
+register = template.Library()
+
+
+@register.filter
+def page_window(page):
+    """Номера страниц вокруг текущей; None — пропуск «…»."""
+    return paginator.page_window(page)
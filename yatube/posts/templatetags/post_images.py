@@ -0,0 +1,11 @@
+from django import template
+
+from posts import thumbnails
+
+register = template.Library()
+
+
+@register.inclusion_tag('posts/includes/card_image.html')
+def card_image(post, lazy=True):
+    """Картинка карточки поста с вариантами разной ширины в srcset."""
+    return {'post': post, 'sizes': thumbnails.CARD_SIZES, 'lazy': lazy}
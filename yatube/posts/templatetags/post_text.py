@@ -0,0 +1,31 @@
+from django import template
+from django.urls import reverse
+from django.utils.html import conditional_escape, format_html
+from django.utils.safestring import mark_safe
+
+from posts import hashtags
+
+register = template.Library()
+
+
+@register.filter(needs_autoescape=True)
+def hashtag_links(text, autoescape=True):
+    """Текст поста, где хештеги — ссылки на их ленты."""
+    escape = conditional_escape if autoescape else str
+    parts = []
+    position = 0
+    for match in hashtags.HASHTAG.finditer(text):
+        name = match.group(1)
+        if len(name) > hashtags.MAX_LENGTH:
+            continue
+        parts += [
+            escape(text[position:match.start()]),
+            format_html(
+                '<a href="{}">#{}</a>',
+                reverse('posts:tag_posts', args=[hashtags.normalize(name)]),
+                name,
+            ),
+        ]
+        position = match.end()
+    parts.append(escape(text[position:]))
+    return mark_safe(''.join(parts))
@@ -0,0 +1,112 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from ..feeds import author_timelines, follow_feed
+from ..models import Follow, Post, TimelineEntry, User
+
+AUTHOR = 'Roman'
+FOLLOWER = 'Pekarev'
+
+
+class TimelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username=AUTHOR)
+        cls.follower = User.objects.create_user(username=FOLLOWER)
+        cls.old_post = Post.objects.create(author=cls.author, text='Старый')
+
+    def test_follow_backfills_timeline(self):
+        Follow.objects.create(user=self.follower, author=self.author)
+        self.assertEqual(list(follow_feed(self.follower)), [self.old_post])
+
+    def test_new_post_fans_out_to_followers(self):
+        Follow.objects.create(user=self.follower, author=self.author)
+        post = Post.objects.create(author=self.author, text='Новый')
+        self.assertEqual(
+            list(follow_feed(self.follower)), [post, self.old_post]
+        )
+        self.assertFalse(follow_feed(self.author).exists())
+
+    def test_unfollow_clears_timeline(self):
+        follow = Follow.objects.create(user=self.follower, author=self.author)
+        follow.delete()
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.follower).exists()
+        )
+
+    @override_settings(TIMELINE_LENGTH=2)
+    def test_timeline_length_is_bounded(self):
+        Follow.objects.create(user=self.follower, author=self.author)
+        posts = [
+            Post.objects.create(author=self.author, text=f'Пост {i}')
+            for i in range(3)
+        ]
+        self.assertEqual(
+            list(follow_feed(self.follower)), posts[:0:-1]
+        )
+
+    def test_rebuild_timeline_command(self):
+        Follow.objects.create(user=self.follower, author=self.author)
+        TimelineEntry.objects.all().delete()
+        call_command('rebuild_timeline', stdout=StringIO())
+        self.assertEqual(list(follow_feed(self.follower)), [self.old_post])
+
+
+@override_settings(FOLLOW_FEED_ENGINE='merge')
+class MergedFeedTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.follower = User.objects.create_user(username=FOLLOWER)
+        cls.authors = [
+            User.objects.create_user(username=f'{AUTHOR}{i}')
+            for i in range(3)
+        ]
+        for author in cls.authors:
+            Follow.objects.create(user=cls.follower, author=author)
+        cls.stranger = User.objects.create_user(username='Stranger')
+
+    def setUp(self):
+        cache.clear()
+        self.posts = [
+            Post.objects.create(author=self.authors[i % 3], text=f'Пост {i}')
+            for i in range(7)
+        ][::-1]
+        Post.objects.create(author=self.stranger, text='Чужой')
+
+    def test_merge_matches_join(self):
+        self.assertEqual(list(follow_feed(self.follower)[:]), self.posts)
+        with override_settings(FOLLOW_FEED_ENGINE='join'):
+            self.assertEqual(list(follow_feed(self.follower)), self.posts)
+
+    def test_page_hydrates_with_one_query(self):
+        feed = follow_feed(self.follower)
+        with self.assertNumQueries(1):
+            self.assertEqual(feed[2:5], self.posts[2:5])
+        self.assertEqual(len(feed), len(self.posts))
+
+    @override_settings(AUTHOR_TIMELINE_LENGTH=2)
+    def test_cold_timelines_load_with_one_query(self):
+        ids = [author.pk for author in self.authors]
+        with self.assertNumQueries(1):
+            timelines = author_timelines(ids)
+        for author in self.authors:
+            with self.subTest(author=author):
+                self.assertEqual(
+                    [pk for _, pk in timelines[author.pk]],
+                    [post.pk for post in self.posts
+                     if post.author_id == author.pk][:2],
+                )
+        with self.assertNumQueries(0):
+            self.assertEqual(author_timelines(ids), timelines)
+
+    def test_new_post_invalidates_author_timeline(self):
+        follow_feed(self.follower)
+        post = Post.objects.create(author=self.authors[0], text='Свежий')
+        self.assertEqual(follow_feed(self.follower)[0], post)
+        post.delete()
+        self.assertEqual(list(follow_feed(self.follower)[:]), self.posts)
@@ -3,11 +3,13 @@ import tempfile
 
 from django import forms
 from django.conf import settings
+from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 
 from ..models import Group, Post, User, Comment
+from ..storage import content_name
 
 IMAGE_GIF_1 = (
     b'\x47\x49\x46\x38\x39\x61\x02\x00'
@@ -124,7 +126,7 @@ class PostCreateFormTests(TestCase):
         self.assertEqual(post.group.id, form_data['group'])
         self.assertEqual(
             post.image.name,
-            f"{UPLOAD_TO}{form_data['image'].name}"
+            content_name(UPLOAD_TO + IMAGE_NAME, ContentFile(IMAGE_GIF_1))
         )
         self.assertRedirects(response, PROFILE_URL)
 
@@ -145,7 +147,7 @@ class PostCreateFormTests(TestCase):
         self.assertEqual(post.author, self.post.author)
         self.assertEqual(
             post.image.name,
-            f"{UPLOAD_TO}{form_data['image'].name}"
+            content_name(UPLOAD_TO + IMAGE_NAME_2, ContentFile(IMAGE_GIF_2))
         )
         self.assertRedirects(response, self.POST_DETAIL_URL)
 
@@ -0,0 +1,117 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from ..hashtags import extract
+from ..models import Post, PostTag, Tag, User
+
+TAG_URL = reverse('posts:tag_posts', args=['котики'])
+
+
+def counts():
+    return dict(Tag.objects.values_list('name', 'posts_count'))
+
+
+def tagged(name):
+    return set(
+        PostTag.objects.filter(tag__name=name).values_list(
+            'post_id', flat=True
+        )
+    )
+
+
+class HashtagTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Roman')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_extract(self):
+        self.assertEqual(
+            extract('#Котики и #ЁЖИКИ, #котики! #2021 a#b &#39; #год_2021'),
+            {'котики', 'ежики', 'год_2021'},
+        )
+
+    def test_tags_follow_post_edits(self):
+        post = Post.objects.create(author=self.author, text='#котики #сон')
+        other = Post.objects.create(author=self.author, text='#Котики')
+        self.assertEqual(counts(), {'котики': 2, 'сон': 1})
+        self.assertEqual(tagged('котики'), {post.pk, other.pk})
+        post.text = 'Без котиков, #сон и #еда'
+        post.save()
+        self.assertEqual(counts(), {'котики': 1, 'сон': 1, 'еда': 1})
+        self.assertEqual(tagged('котики'), {other.pk})
+        other.delete()
+        self.assertEqual(counts(), {'котики': 0, 'сон': 1, 'еда': 1})
+
+    def test_counts_follow_links_not_text(self):
+        # Посты без сигналов: у одного тег в тексте без связи, у другого
+        # связь есть, а в тексте тега нет.
+        Post.objects.bulk_create([
+            Post(author=self.author, text='#котики'),
+            Post(author=self.author, text='Котики'),
+        ])
+        unlinked, linked = Post.objects.order_by('pk')
+        tag = Tag.objects.create(name='котики', posts_count=1)
+        PostTag.objects.create(tag=tag, post=linked, pub_date=linked.pub_date)
+        unlinked.delete()
+        self.assertEqual(counts(), {'котики': 1})
+        linked.text = '#котики'
+        linked.save()
+        self.assertEqual(counts(), {'котики': 1})
+        linked.delete()
+        self.assertEqual(counts(), {'котики': 0})
+
+    def test_tag_page_lists_newest_posts(self):
+        posts = [
+            Post.objects.create(author=self.author, text=f'#Котики {number}')
+            for number in range(12)
+        ]
+        Post.objects.create(author=self.author, text='#собаки')
+        response = self.client.get(
+            reverse('posts:tag_posts', args=['КОТИКИ'])
+        )
+        page = response.context['page_obj']
+        self.assertEqual(response.context['tag'].posts_count, 12)
+        self.assertEqual(
+            [post.pk for post in page],
+            [post.pk for post in posts[::-1][:len(page)]],
+        )
+        self.assertContains(response, f'<a href="{TAG_URL}">#Котики</a>')
+        self.assertEqual(
+            self.client.get(
+                reverse('posts:tag_posts', args=['нет'])
+            ).status_code, 404
+        )
+
+    def test_new_tagged_post_purges_tag_page(self):
+        Post.objects.create(author=self.author, text='#котики')
+        self.client.get(TAG_URL)
+        with self.assertNumQueries(0):
+            self.client.get(TAG_URL)
+        post = Post.objects.create(author=self.author, text='Ещё #котики')
+        self.assertContains(self.client.get(TAG_URL), 'Ещё')
+        post.text = 'Без тегов'
+        post.save()
+        self.assertNotContains(self.client.get(TAG_URL), 'Без тегов')
+
+    def test_backfill(self):
+        # bulk_create обходит сигналы, как посты, написанные до тегов.
+        Post.objects.bulk_create([
+            Post(author=self.author, text='#котики и #сон'),
+            Post(author=self.author, text='#котики'),
+        ])
+        stale = Tag.objects.create(name='старый', posts_count=5)
+        call_command('backfill_hashtags', batch_size=1, stdout=StringIO())
+        self.assertEqual(
+            counts(), {'котики': 2, 'сон': 1, stale.name: 0}
+        )
+        self.assertEqual(
+            tagged('котики'), set(Post.objects.values_list('pk', flat=True))
+        )
@@ -0,0 +1,494 @@
+import base64
+import hashlib
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import (
+    Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+)
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image, ImageDraw
+
+from .. import phash, placeholders, thumbnails
+from ..forms import PostForm
+from ..images import normalize_upload, update_metadata
+from ..models import Post, StoredImage, User
+from ..thumbnails import scaled_size
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+CREATE_URL = reverse('posts:post_create')
+
+
+def image_bytes(size=(40, 30), image_format='PNG'):
+    buffer = BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, image_format)
+    return buffer.getvalue()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImageMetadataTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Roman')
+        cls.authorized = Client()
+        cls.authorized.force_login(cls.user)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_upload_stores_metadata(self):
+        content = image_bytes()
+        self.authorized.post(CREATE_URL, {
+            'text': 'Пост',
+            'image': SimpleUploadedFile('a.png', content, 'image/png'),
+        })
+        post = Post.objects.get()
+        self.assertEqual(
+            (post.image_width, post.image_height, post.image_size,
+             post.image_format, post.image_hash),
+            (40, 30, len(content), 'PNG', hashlib.sha256(content).hexdigest())
+        )
+        # Миниатюры создаёт пул после коммита, которого в TestCase нет.
+        thumbnails.generate(post.image.name)
+        # Карточка знает размеры миниатюры, не открывая файл.
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'width="960" height="339"')
+
+    def test_upload_is_hashed_once(self):
+        content = image_bytes()
+        with mock.patch('hashlib.sha256', wraps=hashlib.sha256) as sha256:
+            self.authorized.post(CREATE_URL, {
+                'text': 'Пост',
+                'image': SimpleUploadedFile('a.png', content, 'image/png'),
+            })
+        post = Post.objects.get()
+        self.assertEqual(sha256.call_count, 1)
+        self.assertIn(post.image_hash, post.image.name)
+
+    def test_unchanged_image_is_not_read_again(self):
+        post = Post.objects.create(
+            author=self.user, text='Пост',
+            image=SimpleUploadedFile('b.png', image_bytes(), 'image/png'),
+        )
+        with mock.patch('posts.images.read_metadata') as read_metadata:
+            post.text = 'Правка'
+            post.save()
+        read_metadata.assert_not_called()
+
+    def test_missing_file_leaves_metadata_empty(self):
+        post = Post.objects.create(
+            author=self.user, text='Пост', image='posts/missing.png'
+        )
+        self.assertIsNone(post.image_width)
+        self.assertEqual(post.image_hash, '')
+
+    def test_backfill_command(self):
+        post = Post.objects.create(
+            author=self.user, text='Пост',
+            image=SimpleUploadedFile('c.jpg', image_bytes((20, 10), 'JPEG'),
+                                     'image/jpeg'),
+        )
+        Post.objects.update(image_width=None, image_hash='')
+        out = StringIO()
+        call_command('backfill_image_metadata', batch_size=1, stdout=out)
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_format), (20, 'JPEG'))
+        self.assertIn('1', out.getvalue())
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ContentAddressedStorageTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Roman')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def create(self, name, content):
+        return Post.objects.create(
+            author=self.user, text='Пост',
+            image=SimpleUploadedFile(name, content, 'image/png'),
+        )
+
+    def refs(self, name):
+        return StoredImage.objects.get(name=name).refs
+
+    def test_same_content_shares_one_sharded_file(self):
+        content = image_bytes()
+        digest = hashlib.sha256(content).hexdigest()
+        first = self.create('a.png', content)
+        second = self.create('b.png', content)
+        self.assertEqual(
+            first.image.name,
+            f'posts/{digest[:2]}/{digest[2:4]}/{digest}.png'
+        )
+        self.assertEqual(second.image.name, first.image.name)
+        self.assertEqual(self.refs(first.image.name), 2)
+
+    def test_edit_and_delete_release_file(self):
+        post = self.create('a.png', image_bytes())
+        old = post.image.name
+        post.image = SimpleUploadedFile(
+            'b.png', image_bytes((10, 10)), 'image/png'
+        )
+        post.save()
+        self.assertEqual(self.refs(old), 0)
+        self.assertIsNotNone(StoredImage.objects.get(name=old).released)
+        self.assertEqual(self.refs(post.image.name), 1)
+        name = post.image.name
+        post.delete()
+        self.assertEqual(self.refs(name), 0)
+
+    def test_collect_images_waits_for_grace_period(self):
+        post = self.create('a.png', image_bytes())
+        kept = self.create('b.png', image_bytes((10, 10)))
+        name = post.image.name
+        post.delete()
+        call_command('collect_images', stdout=StringIO())
+        self.assertTrue(post.image.storage.exists(name))
+        StoredImage.objects.filter(name=name).update(
+            released=timezone.now() - timedelta(days=2)
+        )
+        call_command('collect_images', stdout=StringIO())
+        self.assertFalse(post.image.storage.exists(name))
+        self.assertFalse(StoredImage.objects.filter(name=name).exists())
+        self.assertTrue(kept.image.storage.exists(kept.image.name))
+
+    def test_upload_of_released_file_saves_it_from_collection(self):
+        content = image_bytes()
+        post = self.create('a.png', content)
+        name = post.image.name
+        post.delete()
+        StoredImage.objects.filter(name=name).update(
+            released=timezone.now() - timedelta(days=2)
+        )
+        # Файл уже на диске, но загрузка продлевает его до сохранения поста.
+        self.assertEqual(
+            post.image.storage.save('posts/a.png', ContentFile(content)),
+            name
+        )
+        call_command('collect_images', stdout=StringIO())
+        self.assertTrue(post.image.storage.exists(name))
+        self.assertTrue(StoredImage.objects.filter(name=name).exists())
+
+    def test_file_without_record_is_written_again(self):
+        post = self.create('a.png', image_bytes())
+        path = post.image.path
+        inode = os.stat(path).st_ino
+        # Сборщик удалил строку и вот-вот удалит файл.
+        StoredImage.objects.all().delete()
+        self.create('b.png', image_bytes())
+        self.assertNotEqual(os.stat(path).st_ino, inode)
+
+    def test_reconcile_restores_counts(self):
+        post = self.create('a.png', image_bytes())
+        StoredImage.objects.all().delete()
+        out = StringIO()
+        call_command('collect_images', reconcile=True, stdout=out)
+        self.assertEqual(self.refs(post.image.name), 1)
+        self.assertIn('Исправлено счётчиков ссылок: 1', out.getvalue())
+
+
+class PlaceholderTest(SimpleTestCase):
+    def test_matches_reference_blurhash(self):
+        image = Image.linear_gradient('L').resize((60, 40)).rotate(30)
+        self.assertEqual(
+            placeholders.encode(image), 'MRFY$24nD%t7Rj00Rj-;Rjj[D%?bD%ofof'
+        )
+
+    def test_flat_color_decodes_back(self):
+        blurhash = placeholders.encode(
+            Image.new('RGB', (30, 20), (0, 128, 255))
+        )
+        pixels = placeholders.decode(blurhash, 3, 2)
+        self.assertEqual(pixels.shape, (2, 3, 3))
+        # BlurHash приблизителен и для однотонной картинки.
+        self.assertTrue((abs(pixels.astype(int) - [0, 128, 255]) <= 16).all())
+
+    def test_data_uri_keeps_proportions(self):
+        blurhash = placeholders.encode(Image.new('RGB', (30, 20), 'red'))
+        uri = placeholders.data_uri(blurhash, 960, 480)
+        self.assertTrue(uri.startswith('data:image/png;base64,'))
+        with Image.open(BytesIO(base64.b64decode(uri.split(',')[1]))) as image:
+            self.assertEqual(image.size, (16, 8))
+        self.assertIsNone(placeholders.data_uri('', 960, 480))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class PlaceholderBackfillTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_upload_inlines_placeholder(self):
+        post = Post.objects.create(
+            author=User.objects.create_user(username='Roman'), text='Пост',
+            image=SimpleUploadedFile('a.png', image_bytes(), 'image/png'),
+        )
+        self.assertEqual(len(post.image_blurhash), 34)
+        thumbnails.generate(post.image.name)
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(
+            response, 'background: center / cover url(data:image/png;base64,'
+        )
+
+    def test_backfill_in_process_pool(self):
+        post = Post.objects.create(
+            author=User.objects.create_user(username='Roman'), text='Пост',
+            image=SimpleUploadedFile('b.png', image_bytes(), 'image/png'),
+        )
+        blurhash = post.image_blurhash
+        Post.objects.update(image_blurhash='')
+        out = StringIO()
+        call_command('backfill_placeholders', workers=2, stdout=out)
+        post.refresh_from_db()
+        self.assertEqual(post.image_blurhash, blurhash)
+        self.assertIn('Заглушек посчитано: 1', out.getvalue())
+
+
+def pattern(size=(400, 300), image_format='PNG', rotate=0):
+    """Картинка с крупными деталями: её хеш переживает уменьшение."""
+    image = Image.linear_gradient('L').resize((400, 300)).convert('RGB')
+    ImageDraw.Draw(image).ellipse((50, 50, 200, 250), fill='blue')
+    image = image.rotate(rotate).resize(size, Image.LANCZOS)
+    buffer = BytesIO()
+    image.save(buffer, image_format)
+    return buffer.getvalue()
+
+
+class PerceptualHashTest(SimpleTestCase):
+    def test_hash_survives_resize(self):
+        def dhash(content):
+            return phash.dhash(Image.open(BytesIO(content)))
+
+        original = dhash(pattern())
+        self.assertLessEqual(
+            phash.distance(original, dhash(pattern((200, 150), 'JPEG'))), 2
+        )
+        self.assertGreater(
+            phash.distance(original, dhash(pattern(rotate=90))),
+            phash.MAX_DISTANCE
+        )
+
+    def test_db_value_round_trip(self):
+        for value in (0, 2 ** 63 - 1, 2 ** 63, 2 ** 64 - 1):
+            self.assertEqual(phash.from_db(phash.to_db(value)), value)
+            self.assertLess(abs(phash.to_db(value)), 2 ** 63 + 1)
+
+    def test_bk_tree_matches_linear_scan(self):
+        generator = np.random.default_rng(0)
+        values = [
+            int(value) for value in generator.integers(
+                0, 2 ** 63, 500, dtype=np.int64
+            )
+        ]
+        tree = phash.BKTree()
+        for value in values:
+            tree.add(value, value)
+        query = values[0] ^ 0b1011
+        expected = sorted(
+            value for value in values
+            if phash.distance(query, value) <= 10
+        )
+        self.assertEqual(
+            sorted(item for _, _, item in tree.search(query, 10)), expected
+        )
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class DuplicateImageTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Roman')
+        cls.authorized = Client()
+        cls.authorized.force_login(cls.user)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def upload(self, content, name='meme.png'):
+        self.authorized.post(CREATE_URL, {
+            'text': 'Мем',
+            'image': SimpleUploadedFile(name, content, 'image/png'),
+        })
+        return Post.objects.latest('pk')
+
+    def test_near_duplicate_upload_reuses_stored_image(self):
+        first = self.upload(pattern())
+        second = self.upload(pattern((200, 150)), 'copy.png')
+        self.assertEqual(second.image.name, first.image.name)
+        other = self.upload(pattern(rotate=90), 'other.png')
+        self.assertNotEqual(other.image.name, first.image.name)
+
+    def test_smaller_stored_image_is_not_reused(self):
+        small = self.upload(pattern((200, 150)))
+        large = self.upload(pattern(), 'large.png')
+        self.assertNotEqual(large.image.name, small.image.name)
+
+    def test_find_duplicates_command(self):
+        for size in [(400, 300), (300, 225)]:
+            Post.objects.create(
+                author=self.user, text='Мем',
+                image=SimpleUploadedFile('a.png', pattern(size), 'image/png'),
+            )
+        Post.objects.create(
+            author=self.user, text='Другое',
+            image=SimpleUploadedFile('b.png', pattern(rotate=90), 'image/png'),
+        )
+        Post.objects.update(image_phash=None)
+        out = StringIO()
+        call_command('find_duplicates', workers=2, stdout=out)
+        self.assertIn(
+            'Досчитано хешей: 3, групп дубликатов: 1', out.getvalue()
+        )
+
+
+class ImageIndexWarmUpTest(TransactionTestCase):
+    def test_warm_loads_hashes_in_background_batches(self):
+        user = User.objects.create_user(username='Roman')
+        Post.objects.bulk_create(
+            Post(author=user, text='Пост', image=f'posts/{value}.png',
+                 image_phash=phash.to_db(value))
+            for value in range(5)
+        )
+        index = phash.ImageIndex()
+        with mock.patch.object(phash, 'SYNC_BATCH', 2):
+            index.warm()
+            index.warm()
+            index.loader.join()
+        self.assertEqual(
+            index.last_id, Post.objects.latest('pk').pk
+        )
+        self.assertEqual(
+            sorted(name for _, _, name in index.tree.search(0, 64)),
+            [f'posts/{value}.png' for value in range(5)]
+        )
+
+    def test_index_is_rebuilt_in_forked_process(self):
+        user = User.objects.create_user(username='Roman')
+        Post.objects.bulk_create([Post(
+            author=user, text='Пост', image='posts/a.png',
+            image_phash=phash.to_db(1),
+        )])
+        index = phash.ImageIndex()
+        index.warm()
+        index.loader.join()
+        # Так индекс сбрасывает os.register_at_fork в дочернем процессе.
+        index.reset()
+        self.assertIsNone(index.loader)
+        self.assertEqual(index.tree.search(1, 0), [])
+        # Первый поиск в процессе запускает загрузку.
+        index.search(1, 0)
+        index.loader.join()
+        self.assertEqual(
+            [name for _, _, name in index.search(1, 0)], ['posts/a.png']
+        )
+
+
+def noisy_photo(size, orientation=1):
+    """Снимок «с телефона»: шум плохо сжимается, в EXIF — поворот."""
+    image = Image.frombytes('RGB', size, bytes(
+        (i * 7919) % 251 for i in range(size[0] * size[1] * 3)
+    ))
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    exif[0x010F] = 'Phone'
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', quality=100, exif=exif.tobytes())
+    return SimpleUploadedFile('photo.jpeg', buffer.getvalue(), 'image/jpeg')
+
+
+@override_settings(IMAGE_MAX_SIDE=100, IMAGE_BYTES_BUDGET=4 * 1024)
+class NormalizeUploadTest(SimpleTestCase):
+    def test_photo_is_rotated_capped_and_stripped(self):
+        upload = noisy_photo((300, 200), orientation=6)
+        normalized = normalize_upload(upload)
+        with Image.open(normalized) as image:
+            # Поворот на 90° по EXIF, длинная сторона — не больше 100.
+            self.assertEqual(image.size, (67, 100))
+            self.assertEqual(image.format, 'JPEG')
+            self.assertNotIn('exif', image.info)
+        self.assertEqual(normalized.name, 'photo.jpg')
+        self.assertLessEqual(normalized.size, 4 * 1024)
+        self.assertEqual(normalized.original_size, upload.size)
+        self.assertTrue(os.path.exists(normalized.temporary_file_path()))
+
+    def test_gif_is_kept(self):
+        upload = SimpleUploadedFile(
+            'a.gif', image_bytes(image_format='GIF'), 'image/gif'
+        )
+        self.assertIs(normalize_upload(upload), upload)
+
+    def test_transparent_png_stays_png(self):
+        buffer = BytesIO()
+        Image.new('RGBA', (300, 30), (255, 0, 0, 0)).save(buffer, 'PNG')
+        normalized = normalize_upload(
+            SimpleUploadedFile('a.png', buffer.getvalue(), 'image/png')
+        )
+        with Image.open(normalized) as image:
+            self.assertEqual((image.format, image.size), ('PNG', (100, 10)))
+
+    def test_truncated_photo_is_rejected(self):
+        photo = noisy_photo((300, 200))
+        content = photo.read()
+        form = PostForm({'text': 'Пост'}, {'image': SimpleUploadedFile(
+            'photo.jpeg', content[:len(content) // 2], 'image/jpeg'
+        )})
+        self.assertFalse(form.is_valid())
+        self.assertEqual(
+            form.errors.as_data()['image'][0].code, 'invalid_image'
+        )
+
+    def test_saved_bytes_recorded_on_post(self):
+        user = User(username='Roman')
+        normalized = normalize_upload(noisy_photo((300, 200)))
+        post = Post(author=user, image=normalized)
+        update_metadata(post)
+        self.assertEqual(post.image_size, normalized.size)
+        self.assertGreater(post.image_original_size, post.image_size)
+
+
+class ScaledSizeTest(SimpleTestCase):
+    def test_matches_sorl_geometry(self):
+        crop = ('100x50', {'crop': 'center', 'upscale': True})
+        fit = ('100x50', {})
+        for size, width, height, expected in [
+            (crop, 400, 100, (100, 50)),
+            (crop, 20, 20, (100, 50)),
+            (fit, 400, 100, (100, 25)),
+            (fit, 20, 20, (20, 20)),
+            (fit, None, None, None),
+        ]:
+            with self.subTest(size=size, width=width, height=height):
+                self.assertEqual(scaled_size(width, height, size), expected)
@@ -0,0 +1,164 @@
+import os
+import shutil
+import tempfile
+from array import array
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.test import (
+    SimpleTestCase, TestCase, TransactionTestCase, override_settings
+)
+from django.urls import reverse
+
+from .. import search
+from ..inverted_index import InvertedIndex, decode, encode, tokenize
+from ..models import Group, Post, User
+
+TEMP_INDEX_DIR = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SEARCH_URL = reverse('posts:search')
+DOCUMENTS = [
+    (1, 'Кошки любят молоко'),
+    (2, 'Собака и кошка'),
+    (300, 'Ёжик в тумане'),
+    (70000, 'КОШКА на крыше'),
+]
+
+
+class InvertedIndexTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.index = InvertedIndex(self.directory)
+        self.index.rebuild(DOCUMENTS)
+
+    def test_tokenize(self):
+        self.assertEqual(
+            tokenize('Ёжик и ЕЖИК, но не ёлка!'), {'ежик', 'елка'}
+        )
+
+    def test_postings_are_delta_encoded_narrowly(self):
+        for ids, typecode in [([70000, 70200, 70255], 'B'), ([1, 70000], 'I'),
+                              ([70000, 70001, 130000], 'H'), ([5], 'B')]:
+            with self.subTest(ids=ids):
+                encoded = encode(ids)
+                self.assertEqual(encoded[0], typecode)
+                self.assertEqual(decode(*encoded), array('I', ids))
+
+    def test_words_are_prefixes_and_intersect(self):
+        cases = {
+            'кош': [70000, 2, 1],
+            'Кошк мол': [1],
+            'еж': [300],
+            'кошка собака': [2],
+            'лошадь': [],
+            '': [],
+        }
+        for query, ids in cases.items():
+            with self.subTest(query=query):
+                self.assertEqual(self.index.search(query), ids)
+
+    def test_updates_reach_other_processes_through_journal(self):
+        other = InvertedIndex(self.directory)
+        self.index.add(5, 'Кошкин дом')
+        self.index.update(1, 'Кошки любят молоко', 'Молоко')
+        other.remove(2, 'Собака и кошка')
+        self.assertEqual(other.search('кош'), [70000, 5])
+        self.assertEqual(self.index.search('кош'), [70000, 5])
+        self.assertEqual(InvertedIndex(self.directory).search('кош'),
+                         [70000, 5])
+
+    def test_own_write_does_not_skip_lines_of_other_process(self):
+        other = InvertedIndex(self.directory)
+        self.index.add(4, 'Кот')
+        self.index.search('кош')
+        other.add(5, 'Кошкин дом')
+        # Строка другого процесса легла между чтением журнала и записью.
+        self.index._append_journal({'id': 6, 'add': ['кошка'], 'remove': []})
+        self.assertEqual(self.index.search('кошк'), [70000, 6, 5, 2, 1])
+
+    def test_broken_journal_line_is_skipped(self):
+        with open(os.path.join(self.directory, 'journal'), 'ab') as journal:
+            journal.write(b'{"id": 5, "add": ["\xd0\n[1, 2]\n')
+        self.index.add(6, 'Кошкин дом')
+        with self.assertLogs('posts.inverted_index', 'WARNING'):
+            other = InvertedIndex(self.directory)
+        self.assertEqual(other.search('кошкин'), [6])
+
+    def test_rebuild_is_picked_up_by_open_index(self):
+        other = InvertedIndex(self.directory)
+        self.index.add(5, 'Кошкин дом')
+        self.index.rebuild([(7, 'Кошка')])
+        self.assertEqual(other.search('кош'), [7])
+
+
+@override_settings(SEARCH_BACKEND=search.BACKEND_INDEX,
+                   SEARCH_INDEX_DIR=TEMP_INDEX_DIR)
+class IndexBackendSearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Roman')
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.posts = Post.objects.bulk_create(
+            Post(author=cls.author, text=f'Кошка номер {number}',
+                 group=cls.group if number % 2 else None)
+            for number in range(25)
+        )
+        call_command('build_search_index', stdout=StringIO())
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_INDEX_DIR, ignore_errors=True)
+        super().tearDownClass()
+
+    def test_pages_go_from_newest_with_filters(self):
+        ids = sorted(
+            (post.id for post in Post.objects.filter(group=self.group)),
+            reverse=True,
+        )
+        response = self.client.get(
+            SEARCH_URL, {'q': 'кошк', 'group': 'test-slug'}
+        )
+        page = response.context['page_obj']
+        self.assertEqual([post.id for post in page], ids[:len(page)])
+        response = self.client.get(SEARCH_URL, {
+            'q': 'кошк', 'group': 'test-slug',
+            'after': page.next_cursor,
+        })
+        self.assertEqual(
+            [post.id for post in response.context['page_obj']],
+            ids[len(page):],
+        )
+
+    def test_deleted_posts_are_skipped(self):
+        Post.objects.filter(text='Кошка номер 24').delete()
+        self.assertNotIn(
+            'Кошка номер 24',
+            [post.text for post in search.SearchPaginator('кошка', 20)
+             .get_page()],
+        )
+
+
+class IndexSignalsTest(TransactionTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def test_saved_and_deleted_posts_are_indexed(self):
+        with self.settings(SEARCH_BACKEND=search.BACKEND_INDEX,
+                           SEARCH_INDEX_DIR=self.directory):
+            post = Post.objects.create(
+                author=User.objects.create_user(username='Roman'),
+                text='Кошка на крыше',
+            )
+            self.assertEqual(search.post_index().search('крыш'), [post.id])
+            post.text = 'Кошка в доме'
+            post.save()
+            self.assertEqual(search.post_index().search('крыш'), [])
+            self.assertEqual(search.post_index().search('дом'), [post.id])
+            post.delete()
+            self.assertEqual(search.post_index().search('кошка'), [])
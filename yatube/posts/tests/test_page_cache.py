@@ -0,0 +1,172 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.template import Context, Template
+from django.test import Client, SimpleTestCase, TestCase
+from django.urls import reverse
+
+from .. import caching
+from ..models import Comment, Follow, Group, Post, User
+
+AUTHOR = 'Roman'
+READER = 'Pekarev'
+GROUP_SLUG = 'test-slug'
+
+INDEX_URL = reverse('posts:index')
+GROUP_LIST_URL = reverse('posts:posts_slug', args=[GROUP_SLUG])
+PROFILE_URL = reverse('posts:profile', args=[AUTHOR])
+READER_PROFILE_URL = reverse('posts:profile', args=[READER])
+
+
+class AnonymousPageCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username=AUTHOR)
+        cls.reader = User.objects.create_user(username=READER)
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug=GROUP_SLUG,
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, group=cls.group, text='Пост'
+        )
+        cls.POST_DETAIL_URL = reverse(
+            'posts:post_detail', args=[cls.post.id]
+        )
+        cls.authorized = Client()
+        cls.authorized.force_login(cls.reader)
+
+    def setUp(self):
+        cache.clear()
+
+    def assert_cached(self, *urls):
+        for url in urls:
+            with self.subTest(url=url):
+                with self.assertNumQueries(0):
+                    self.client.get(url)
+
+    def assert_not_cached(self, *urls):
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertTrue(self.client.get(url).templates)
+
+    def warm(self, *urls):
+        for url in urls:
+            self.client.get(url)
+
+    def test_guest_pages_are_cached(self):
+        urls = [INDEX_URL, GROUP_LIST_URL, PROFILE_URL, self.POST_DETAIL_URL]
+        self.warm(*urls)
+        self.assert_cached(*urls)
+        response = self.client.get(INDEX_URL)
+        self.assertIn('Cookie', response['Vary'])
+
+    def test_query_string_is_part_of_key(self):
+        self.warm(INDEX_URL)
+        self.assert_not_cached(INDEX_URL + '?page=1')
+
+    def test_authorized_users_never_get_shared_entry(self):
+        self.warm(INDEX_URL, self.POST_DETAIL_URL)
+        for url in [INDEX_URL, self.POST_DETAIL_URL]:
+            with self.subTest(url=url):
+                response = self.authorized.get(url)
+                self.assertTrue(response.templates)
+                self.assertTrue(response.context['user'].is_authenticated)
+
+    def test_new_post_purges_its_feeds_only(self):
+        urls = [INDEX_URL, GROUP_LIST_URL, PROFILE_URL, READER_PROFILE_URL]
+        self.warm(*urls)
+        Post.objects.create(author=self.author, group=self.group, text='Ещё')
+        self.assert_not_cached(INDEX_URL, GROUP_LIST_URL, PROFILE_URL)
+        self.assert_cached(READER_PROFILE_URL)
+
+    def test_comment_purges_post_and_commenter_profile(self):
+        urls = [INDEX_URL, PROFILE_URL, READER_PROFILE_URL,
+                self.POST_DETAIL_URL]
+        self.warm(*urls)
+        Comment.objects.create(post=self.post, author=self.reader, text='Ого')
+        self.assert_not_cached(self.POST_DETAIL_URL, READER_PROFILE_URL)
+        self.assert_cached(INDEX_URL, PROFILE_URL)
+
+    def test_follow_purges_both_profiles(self):
+        urls = [INDEX_URL, PROFILE_URL, READER_PROFILE_URL]
+        self.warm(*urls)
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assert_not_cached(PROFILE_URL, READER_PROFILE_URL)
+        self.assert_cached(INDEX_URL)
+
+    def test_group_change_purges_pages_with_its_title(self):
+        urls = [INDEX_URL, GROUP_LIST_URL, PROFILE_URL, READER_PROFILE_URL,
+                self.POST_DETAIL_URL]
+        self.warm(*urls)
+        self.group.title = 'Новое название'
+        self.group.save()
+        self.assert_not_cached(
+            INDEX_URL, GROUP_LIST_URL, PROFILE_URL, self.POST_DETAIL_URL
+        )
+        self.assert_cached(READER_PROFILE_URL)
+
+
+class StampedeTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return f'Значение {self.calls}'
+
+    def test_fresh_entry_is_computed_once(self):
+        for _ in range(3):
+            caching.fetch('key', self.compute, 60, version=1)
+        self.assertEqual(self.calls, 1)
+
+    def test_stale_entry_served_while_other_worker_recomputes(self):
+        caching.fetch('key', self.compute, 60, version=1)
+        cache.add(caching.LOCK_KEY.format('key'), 1)
+        self.assertEqual(
+            caching.fetch('key', self.compute, 60, version=2), 'Значение 1'
+        )
+        cache.delete(caching.LOCK_KEY.format('key'))
+        self.assertEqual(
+            caching.fetch('key', self.compute, 60, version=2), 'Значение 2'
+        )
+
+    def test_recompute_starts_early_near_expiry(self):
+        caching.fetch('key', self.compute, 60)
+        with mock.patch('posts.caching.random.random', return_value=0.5):
+            caching.fetch('key', self.compute, 60)
+            self.assertEqual(self.calls, 1)
+            with mock.patch('posts.caching.time.time',
+                            return_value=caching.time.time() + 60):
+                caching.fetch('key', self.compute, 60)
+        self.assertEqual(self.calls, 2)
+
+    def test_counters(self):
+        before = caching.stampede_stats()
+        caching.fetch('key', self.compute, 60, version=1)
+        caching.fetch('key', self.compute, 60, version=1)
+        cache.add(caching.LOCK_KEY.format('key'), 1)
+        caching.fetch('key', self.compute, 60, version=2)
+        after = caching.stampede_stats()
+        self.assertEqual(
+            {event: after[event] - before.get(event, 0) for event in after},
+            {caching.HITS: 1, caching.STALE: 1, caching.RECOMPUTES: 1},
+        )
+
+    def test_cache_tag_keeps_one_entry_across_versions(self):
+        template = Template(
+            '{% load feed_cache %}'
+            '{% cache 60 fragment page version=version %}{{ text }}'
+            '{% endcache %}'
+        )
+
+        def render(**context):
+            return template.render(Context(context))
+
+        self.assertEqual(render(page=1, version=1, text='старый'), 'старый')
+        self.assertEqual(render(page=1, version=1, text='новый'), 'старый')
+        self.assertEqual(render(page=2, version=1, text='новый'), 'новый')
+        self.assertEqual(render(page=1, version=2, text='новый'), 'новый')
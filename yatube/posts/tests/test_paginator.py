@@ -0,0 +1,184 @@
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.template.loader import render_to_string
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from yatube.settings import PAGINATOR_COUNT
+from ..models import Group, Post, User
+from ..counts import FEED_INDEX, FeedCounter, count_key
+from ..paginator import KeysetPage, KeysetPaginator, page_window
+
+USERNAME = 'Roman'
+GROUP_SLUG = 'test-slug'
+OTHER_PAGES = 4
+
+INDEX_URL = reverse('posts:index')
+GROUP_LIST_URL = reverse('posts:posts_slug', args=[GROUP_SLUG])
+PROFILE_URL = reverse('posts:profile', args=[USERNAME])
+
+
+@override_settings(PAGINATOR_MODE='keyset')
+class KeysetPaginatorTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username=USERNAME)
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug=GROUP_SLUG,
+            description='Тестовое описание',
+        )
+        Post.objects.bulk_create(
+            Post(text=f'Post {i}', author=cls.user, group=cls.group)
+            for i in range(2 * PAGINATOR_COUNT + OTHER_PAGES)
+        )
+        cls.posts = list(Post.objects.order_by('-pub_date', '-id'))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_pages_follow_cursors(self):
+        """Ссылки «вперёд» проходят ленту без пропусков и повторов."""
+        for url in [INDEX_URL, GROUP_LIST_URL, PROFILE_URL]:
+            with self.subTest(url=url):
+                seen = []
+                page = self.client.get(url).context['page_obj']
+                self.assertIsInstance(page, KeysetPage)
+                self.assertFalse(page.has_previous())
+                seen.extend(page)
+                while page.has_next():
+                    page = self.client.get(
+                        url, {'after': page.next_cursor}
+                    ).context['page_obj']
+                    seen.extend(page)
+                self.assertEqual(seen, self.posts)
+                self.assertEqual(len(page), OTHER_PAGES)
+
+    def test_previous_cursor_returns_previous_page(self):
+        paginator = KeysetPaginator(Post.objects.all(), PAGINATOR_COUNT)
+        first = paginator.get_page()
+        second = paginator.get_page(after=first.next_cursor)
+        third = paginator.get_page(after=second.next_cursor)
+        self.assertEqual(
+            list(paginator.get_page(before=third.previous_cursor)),
+            list(second)
+        )
+        self.assertEqual(
+            list(paginator.get_page(before=second.previous_cursor)),
+            list(first)
+        )
+
+    def test_ascending_keys_keep_direction(self):
+        """Сортировка по возрастанию листается в ту же сторону."""
+        queryset = Post.objects.order_by('pub_date', '-id')
+        paginator = KeysetPaginator(queryset, PAGINATOR_COUNT)
+        seen = []
+        page = paginator.get_page()
+        seen.extend(page)
+        while page.has_next():
+            previous = page
+            page = paginator.get_page(after=page.next_cursor)
+            self.assertEqual(
+                list(paginator.get_page(before=page.previous_cursor)),
+                list(previous)
+            )
+            seen.extend(page)
+        self.assertEqual(seen, list(queryset))
+
+    def test_page_does_not_count(self):
+        paginator = KeysetPaginator(Post.objects.all(), PAGINATOR_COUNT)
+        cursor = paginator.get_page().next_cursor
+        with self.assertNumQueries(1):
+            page = paginator.get_page(after=cursor)
+            self.assertEqual(len(page), PAGINATOR_COUNT)
+
+    def test_broken_cursor_returns_first_page(self):
+        response = self.client.get(INDEX_URL, {'after': 'not-a-cursor'})
+        self.assertEqual(
+            list(response.context['page_obj']),
+            self.posts[:PAGINATOR_COUNT]
+        )
+
+    def test_widget_renders_cursor_links(self):
+        client = Client()
+        page = client.get(INDEX_URL).context['page_obj']
+        response = client.get(INDEX_URL, {'after': page.next_cursor})
+        content = response.content.decode()
+        self.assertIn(f'?after={response.context["page_obj"].next_cursor}',
+                      content)
+        self.assertIn('?before=', content)
+        self.assertNotIn('?page=', content)
+
+
+class CachedCountTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username=USERNAME)
+
+    def setUp(self):
+        cache.clear()
+        self.posts = [
+            Post.objects.create(author=self.user, text=f'Post {i}')
+            for i in range(PAGINATOR_COUNT + OTHER_PAGES)
+        ]
+
+    def num_pages(self, page=1):
+        return self.client.get(
+            INDEX_URL, {'page': page}
+        ).context['page_obj'].paginator.num_pages
+
+    def test_count_follows_creates_and_deletes(self):
+        self.num_pages()
+        key = count_key(FEED_INDEX)
+        self.assertEqual(cache.get(key), len(self.posts))
+        Post.objects.create(author=self.user, text='Ещё')
+        self.assertEqual(cache.get(key), len(self.posts) + 1)
+        self.posts[0].delete()
+        self.assertEqual(cache.get(key), len(self.posts))
+
+    def test_stale_count_is_corrected_by_page(self):
+        cache.set(count_key(FEED_INDEX), 1)
+        self.assertEqual(self.num_pages(), 2)
+        self.assertEqual(cache.get(count_key(FEED_INDEX)), len(self.posts))
+        cache.set(count_key(FEED_INDEX), 1000)
+        response = self.client.get(INDEX_URL, {'page': 5})
+        self.assertEqual(response.context['page_obj'].number, 2)
+        self.assertEqual(len(response.context['page_obj']), OTHER_PAGES)
+        self.assertEqual(cache.get(count_key(FEED_INDEX)), len(self.posts))
+
+    @override_settings(PAGINATOR_EXACT_COUNTS=[FEED_INDEX])
+    def test_exact_count_setting(self):
+        cache.set(count_key(FEED_INDEX), 1000)
+        counter = FeedCounter(FEED_INDEX, Post.objects.all())
+        self.assertEqual(counter.get(), len(self.posts))
+
+
+class PageWindowTest(TestCase):
+    def page(self, number, num_pages):
+        return Paginator(range(num_pages), 1).page(number)
+
+    def test_window(self):
+        cases = [
+            [1, 5, [1, 2, 3, 4, 5]],
+            [1, 100, [1, 2, 3, None, 100]],
+            [50, 100, [1, None, 48, 49, 50, 51, 52, None, 100]],
+            [4, 100, [1, 2, 3, 4, 5, 6, None, 100]],
+            [100, 100, [1, None, 98, 99, 100]],
+        ]
+        for number, num_pages, window in cases:
+            with self.subTest(number=number, num_pages=num_pages):
+                self.assertEqual(
+                    page_window(self.page(number, num_pages)), window
+                )
+
+    def test_widget_size_does_not_grow_with_pages(self):
+        sizes = [
+            len(render_to_string(
+                'posts/includes/paginator.html',
+                {'page_obj': self.page(num_pages // 2, num_pages)}
+            ))
+            for num_pages in [100, 10 ** 7]
+        ]
+        self.assertLess(sizes[1] - sizes[0], 100)
@@ -0,0 +1,101 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from yatube.settings import PAGINATOR_COUNT
+from .. import caching
+from ..models import Comment, Follow, Group, Post, User
+
+USERNAME = 'Roman'
+READER = 'Pekarev'
+GROUP_SLUG = 'test-slug'
+
+INDEX_URL = reverse('posts:index')
+GROUP_LIST_URL = reverse('posts:posts_slug', args=[GROUP_SLUG])
+PROFILE_URL = reverse('posts:profile', args=[USERNAME])
+FOLLOW_INDEX_URL = reverse('posts:follow_index')
+
+# Запросов на страницу при любом числе постов на ней и пустом кеше:
+# сессия и пользователь + COUNT + страница + запросы самой страницы
+# (группа, автор со счётчиками, проверка подписки, список подписок).
+QUERY_BUDGET = [
+    [INDEX_URL, 4],
+    [GROUP_LIST_URL, 5],
+    [PROFILE_URL, 6],
+    [FOLLOW_INDEX_URL, 5],
+]
+
+
+class FeedQueryBudgetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username=USERNAME)
+        cls.reader = User.objects.create_user(username=READER)
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug=GROUP_SLUG,
+            description='Тестовое описание',
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.client_reader = Client()
+        cls.client_reader.force_login(cls.reader)
+
+    def setUp(self):
+        cache.clear()
+
+    def assert_budget(self, posts_count):
+        for i in range(posts_count):
+            Post.objects.create(
+                author=self.author, group=self.group, text=f'Пост {i}'
+            )
+        for url, budget in QUERY_BUDGET:
+            with self.subTest(url=url, posts=posts_count):
+                cache.clear()
+                with self.assertNumQueries(budget):
+                    response = self.client_reader.get(url)
+                self.assertEqual(
+                    len(response.context['page_obj']), posts_count
+                )
+
+    def test_single_post_page(self):
+        self.assert_budget(1)
+
+    def test_full_page(self):
+        self.assert_budget(PAGINATOR_COUNT)
+
+    def test_cached_count_skips_count_query(self):
+        Post.objects.create(author=self.author, text='Пост')
+        self.client.get(INDEX_URL)
+        # Фрагмент устарел, а счётчик ленты остался в кеше.
+        caching.bump_feed_version(caching.FEED_INDEX)
+        with self.assertNumQueries(1):
+            self.client.get(INDEX_URL)
+
+    def test_cached_index_fragment_skips_queries(self):
+        Post.objects.create(author=self.author, text='Пост')
+        self.client.get(INDEX_URL)
+        with self.assertNumQueries(0):
+            self.client.get(INDEX_URL)
+
+    def test_post_detail(self):
+        post = Post.objects.create(
+            author=self.author, group=self.group, text='Пост'
+        )
+        url = reverse('posts:post_detail', args=[post.id])
+        for comments_count in [1, 3 * settings.COMMENTS_PAGINATOR_COUNT]:
+            Comment.objects.bulk_create(
+                Comment(post=post, author=author, text='Комментарий')
+                for author in [self.author, self.reader] * comments_count
+            )
+            # Комментарии созданы без сигналов: сбрасываем страницу гостя.
+            cache.clear()
+            with self.subTest(comments=comments_count):
+                # Пост с автором и группой + страница комментариев.
+                with self.assertNumQueries(2):
+                    response = self.client.get(url)
+                self.assertLessEqual(
+                    len(response.context['comments']),
+                    settings.COMMENTS_PAGINATOR_COUNT
+                )
@@ -0,0 +1,103 @@
+import re
+from unittest import skipUnless
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post, User
+
+USERNAME = 'Roman'
+READER = 'Pekarev'
+GROUP_SLUG = 'test-slug'
+
+INDEX_URL = reverse('posts:index')
+GROUP_LIST_URL = reverse('posts:posts_slug', args=[GROUP_SLUG])
+PROFILE_URL = reverse('posts:profile', args=[USERNAME])
+FOLLOW_INDEX_URL = reverse('posts:follow_index')
+TAG_URL = reverse('posts:tag_posts', args=['тег'])
+
+# Полный проход таблицы без индекса или сортировка во временном B-дереве.
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?\w+(?!.* USING .*INDEX)')
+TEMP_SORT = re.compile(r'USE TEMP B-TREE')
+# Страница по курсору ищет в индексе с курсора, а не проходит его с начала.
+POST_SCAN = re.compile(r'^SCAN (TABLE )?posts_post\b')
+PUB_DATE_RANGE = re.compile(r'^SEARCH .* USING .*INDEX .*\bpub_date[<>]')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN из SQLite')
+class QueryPlanTest(TestCase):
+    """Запросы лент идут по индексам: без полных проходов и сортировок."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username=USERNAME)
+        cls.reader = User.objects.create_user(username=READER)
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug=GROUP_SLUG,
+            description='Тестовое описание',
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.post = Post.objects.create(
+            author=cls.author, group=cls.group, text='Пост #тег'
+        )
+        Comment.objects.create(post=cls.post, author=cls.reader, text='Ого')
+        cls.reader_client = Client()
+        cls.reader_client.force_login(cls.reader)
+
+    def setUp(self):
+        cache.clear()
+
+    def assert_indexed(self, url, data=None):
+        """Проверяет планы SELECT страницы и возвращает их шаги."""
+        steps = []
+        with CaptureQueriesContext(connection) as queries:
+            self.reader_client.get(url, data)
+        for query in queries.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT') or 'COUNT(' in sql:
+                # COUNT(*) по всей ленте считается только при промахе
+                # кеша счётчиков.
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plan = [row[-1] for row in cursor.fetchall()]
+            steps.extend(plan)
+            with self.subTest(url=url, sql=sql):
+                for step in plan:
+                    self.assertIsNone(FULL_SCAN.search(step), plan)
+                    self.assertIsNone(TEMP_SORT.search(step), plan)
+        return steps
+
+    def test_feeds(self):
+        post_detail = reverse('posts:post_detail', args=[self.post.id])
+        for url in [INDEX_URL, GROUP_LIST_URL, PROFILE_URL, FOLLOW_INDEX_URL,
+                    TAG_URL, post_detail]:
+            self.assert_indexed(url)
+
+    def test_follow_feed_engines(self):
+        # Движок 'join' сортирует посты всех авторов при каждом запросе —
+        # ради этого и существуют 'fanout' и 'merge'.
+        for engine in ['fanout', 'merge']:
+            with override_settings(FOLLOW_FEED_ENGINE=engine):
+                self.assert_indexed(FOLLOW_INDEX_URL)
+
+    @override_settings(PAGINATOR_MODE='keyset')
+    def test_keyset_pages(self):
+        for url in [INDEX_URL, GROUP_LIST_URL, PROFILE_URL, FOLLOW_INDEX_URL]:
+            page = self.reader_client.get(url).context['page_obj']
+            steps = self.assert_indexed(
+                url, {'after': page.paginator.encode_cursor(page[0])}
+            )
+            with self.subTest(url=url):
+                self.assertFalse(
+                    [step for step in steps if POST_SCAN.search(step)], steps
+                )
+                self.assertTrue(
+                    [step for step in steps if PUB_DATE_RANGE.search(step)],
+                    steps
+                )
@@ -17,7 +17,8 @@ CASES = [
     ['/follow/', 'follow_index', []],
     [f'/profile/{USERNAME}/follow/', 'profile_follow', [USERNAME]],
     [f'/profile/{USERNAME}/unfollow/', 'profile_unfollow', [USERNAME]],
-    [f'/posts/{ID}/comment/', 'add_comment', [ID]]
+    [f'/posts/{ID}/comment/', 'add_comment', [ID]],
+    [f'/posts/{ID}/comments/', 'post_comments', [ID]],
 ]
 
 
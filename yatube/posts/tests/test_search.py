@@ -0,0 +1,129 @@
+from django.db import connection
+from django.db.migrations.recorder import MigrationRecorder
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from ..apps import SEARCH_MIGRATION, install_search
+from ..models import Group, Post, User
+from ..search import (
+    FTS_TABLE, SearchPaginator, match_query, supported, uninstall
+)
+
+AUTHOR = 'Roman'
+OTHER = 'Pekarev'
+GROUP_SLUG = 'test-slug'
+SEARCH_URL = reverse('posts:search')
+
+
+def result_ids(query, per_page=10, **filters):
+    return [
+        post.id for post in SearchPaginator(
+            query, per_page, **filters
+        ).get_page()
+    ]
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username=AUTHOR)
+        cls.other = User.objects.create_user(username=OTHER)
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug=GROUP_SLUG,
+            description='Тестовое описание',
+        )
+        cls.cats = Post.objects.create(
+            author=cls.author, group=cls.group,
+            text='Кошки любят молоко. Кошки спят.',
+        )
+        cls.dog = Post.objects.create(
+            author=cls.other, text='Собака и кошка дружат'
+        )
+        cls.weather = Post.objects.create(
+            author=cls.author, text='Про погоду'
+        )
+
+    def test_words_match_as_prefixes_and_all_required(self):
+        self.assertEqual(
+            set(result_ids('кош')), {self.cats.id, self.dog.id}
+        )
+        self.assertEqual(result_ids('молоко КОШ'), [self.cats.id])
+        self.assertEqual(result_ids('слон'), [])
+
+    def test_more_relevant_post_first(self):
+        self.assertEqual(result_ids('кошки')[0], self.cats.id)
+
+    def test_filters_by_group_and_author(self):
+        self.assertEqual(result_ids('кош', group=self.group), [self.cats.id])
+        self.assertEqual(result_ids('кош', author=self.other), [self.dog.id])
+
+    def test_index_follows_edit_delete_and_bulk_create(self):
+        post = Post.objects.get(pk=self.weather.pk)
+        post.text = 'Про кошку'
+        post.save()
+        self.assertIn(post.id, result_ids('кош'))
+        post.delete()
+        self.assertNotIn(post.id, result_ids('кош'))
+        Post.objects.bulk_create([Post(author=self.author, text='Кошатник')])
+        Post.objects.filter(pk=self.dog.pk).update(text='Собака')
+        self.assertEqual(
+            set(result_ids('кош')),
+            {self.cats.id, Post.objects.get(text='Кошатник').id}
+        )
+
+    def test_query_syntax_is_not_interpreted(self):
+        self.assertEqual(match_query('кот* OR "-пёс'), '"кот"* "or"* "пёс"*')
+        self.assertEqual(result_ids('"(*'), [])
+
+    def test_cursor_pages_cover_results_once(self):
+        Post.objects.bulk_create(
+            Post(author=self.author, text=f'Кошка номер {i}')
+            for i in range(7)
+        )
+        paginator = SearchPaginator('кош', 3)
+        page = paginator.get_page()
+        seen = []
+        pages = []
+        while True:
+            pages.append(page)
+            seen += [post.id for post in page]
+            if not page.has_next():
+                break
+            page = paginator.get_page(after=page.next_cursor)
+        self.assertEqual(len(seen), 9)
+        self.assertEqual(len(set(seen)), 9)
+        previous = paginator.get_page(before=pages[2].previous_cursor)
+        self.assertEqual(list(previous), list(pages[1]))
+
+    @override_settings(PAGINATOR_COUNT=1)
+    def test_search_page(self):
+        response = self.client.get(SEARCH_URL, {'q': 'кош'})
+        self.assertEqual(len(response.context['page_obj']), 1)
+        self.assertContains(response, '?q=%D0%BA%D0%BE%D1%88&after=')
+        response = self.client.get(
+            SEARCH_URL, {'q': 'кош', 'group': 'missing'}
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_admin_search_uses_index(self):
+        admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'молок'}
+        )
+        self.assertEqual(
+            [post.id for post in response.context['cl'].result_list],
+            [self.cats.id]
+        )
+
+    def test_post_migrate_installs_only_with_search_migration(self):
+        if not supported():
+            self.skipTest('Нужен SQLite с FTS5')
+        uninstall()
+        MigrationRecorder(connection).record_unapplied(*SEARCH_MIGRATION)
+        install_search(using=connection.alias)
+        self.assertNotIn(FTS_TABLE, connection.introspection.table_names())
+        MigrationRecorder(connection).record_applied(*SEARCH_MIGRATION)
+        install_search(using=connection.alias)
+        self.assertIn(FTS_TABLE, connection.introspection.table_names())
@@ -0,0 +1,62 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from ..models import Comment, Follow, Post, User, UserStats
+
+AUTHOR = 'Roman'
+READER = 'Pekarev'
+
+PROFILE_URL = reverse('posts:profile', args=[AUTHOR])
+
+
+class UserStatsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username=AUTHOR)
+        cls.reader = User.objects.create_user(username=READER)
+
+    def stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_counters_follow_creates_and_deletes(self):
+        post = Post.objects.create(author=self.author, text='Пост')
+        Post.objects.create(author=self.author, text='Ещё пост')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        Comment.objects.create(post=post, author=self.reader, text='Ого')
+        author, reader = self.stats(self.author), self.stats(self.reader)
+        self.assertEqual(
+            (author.posts, author.followers, author.following), (2, 1, 0)
+        )
+        self.assertEqual((reader.following, reader.comments), (1, 1))
+
+        post.delete()
+        follow.delete()
+        author, reader = self.stats(self.author), self.stats(self.reader)
+        self.assertEqual((author.posts, author.followers), (1, 0))
+        self.assertEqual((reader.following, reader.comments), (0, 0))
+
+    def test_profile_reads_counters_without_count_queries(self):
+        Post.objects.create(author=self.author, text='Пост')
+        response = self.client.get(PROFILE_URL)
+        self.assertEqual(response.context['stats'].posts, 1)
+        self.assertContains(response, 'Всего постов: 1')
+
+    def test_reconcile_repairs_drift(self):
+        Post.objects.create(author=self.author, text='Пост')
+        UserStats.objects.filter(user=self.author).update(posts=42)
+        UserStats.objects.filter(user=self.reader).delete()
+        out = StringIO()
+        call_command('reconcile_stats', batch_size=1, stdout=out)
+        self.assertEqual(self.stats(self.author).posts, 1)
+        self.assertEqual(self.stats(self.reader).posts, 0)
+        self.assertIn('2', out.getvalue())
+
+    def test_drifted_counter_stops_at_zero(self):
+        post = Post.objects.create(author=self.author, text='Пост')
+        UserStats.objects.filter(user=self.author).update(posts=0)
+        post.delete()
+        self.assertEqual(self.stats(self.author).posts, 0)
@@ -0,0 +1,195 @@
+import os
+import shutil
+import tempfile
+from itertools import count
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+from sorl.thumbnail import get_thumbnail
+
+from .. import thumbnails
+from ..models import Post, User
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+# Одинаковые картинки ложатся в один файл: каждой — свой цвет.
+COLORS = count()
+
+
+def make_image(name):
+    buffer = BytesIO()
+    Image.new('RGB', (40, 30), (next(COLORS) * 16 % 256, 0, 0)).save(
+        buffer, 'JPEG'
+    )
+    return SimpleUploadedFile(name, buffer.getvalue(), 'image/jpeg')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Roman')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        # Хранилище ключей sorl живёт в кеше.
+        cache.clear()
+
+    def thumbnail_files(self):
+        # Миниатюры sorl складывает в MEDIA_ROOT/cache/.
+        return sum(
+            len(files) for _, _, files in os.walk(
+                os.path.join(TEMP_MEDIA_ROOT, 'cache')
+            )
+        )
+
+    def test_new_image_is_scheduled_once(self):
+        with mock.patch('posts.thumbnails.schedule') as schedule:
+            post = Post.objects.create(
+                author=self.user, text='Пост', image=make_image('a.jpg')
+            )
+            post.text = 'Правка без картинки'
+            post.save()
+            Post.objects.create(author=self.user, text='Без картинки')
+        schedule.assert_called_once_with(post.image.name)
+
+    def test_generate_creates_every_size(self):
+        before = self.thumbnail_files()
+        post = Post.objects.create(
+            author=self.user, text='Пост', image=make_image('b.jpg')
+        )
+        self.assertEqual(thumbnails.generate(post.image.name),
+                         len(thumbnails.SIZES))
+        self.assertEqual(self.thumbnail_files() - before,
+                         len(thumbnails.SIZES))
+
+    def test_generate_skips_missing_file(self):
+        self.assertEqual(thumbnails.generate('posts/missing.jpg'), 0)
+
+    def test_command_generates_in_parallel(self):
+        before = self.thumbnail_files()
+        posts = [
+            Post.objects.create(
+                author=self.user, text='Пост', image=make_image(f'c{i}.jpg')
+            )
+            for i in range(3)
+        ]
+        Post.objects.create(author=self.user, text='Пост',
+                            image='posts/missing.jpg')
+        out = StringIO()
+        call_command('generate_thumbnails', workers=2, stdout=out)
+        self.assertIn('Картинок с миниатюрами: 3, пропущено: 1',
+                      out.getvalue())
+        self.assertEqual(self.thumbnail_files() - before,
+                         len(posts) * len(thumbnails.SIZES))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ResolveThumbnailsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Roman')
+        cls.posts = [
+            Post.objects.create(
+                author=cls.user, text='Пост', image=make_image(f'd{i}.jpg')
+            )
+            for i in range(3)
+        ]
+        cls.names = [post.image.name for post in cls.posts]
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        thumbnails._memo.clear()
+        for name in self.names:
+            thumbnails.generate(name)
+        cache.clear()
+
+    def test_page_resolved_with_one_query(self):
+        # Хранилище ключей в кеше пусто: одна выборка из базы на страницу.
+        with self.assertNumQueries(1):
+            urls = thumbnails.resolve(self.names)
+        self.assertEqual(set(urls), set(self.names))
+        thumbnails._memo.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(thumbnails.resolve(self.names), urls)
+
+    def test_urls_match_sorl(self):
+        geometry, options = thumbnails.CARD
+        urls = thumbnails.resolve(self.names)
+        for name in self.names:
+            self.assertEqual(
+                urls[name], get_thumbnail(name, geometry, **options).url
+            )
+
+    def test_thumbnail_name_matches_sorl(self):
+        # thumbnail_name повторяет закрытые методы sorl: после обновления
+        # sorl-thumbnail этот тест покажет, что имена разошлись.
+        for geometry, options in thumbnails.SIZES:
+            with self.subTest(geometry=geometry, options=options):
+                self.assertEqual(
+                    thumbnails.thumbnail_name(
+                        self.names[0], geometry, options
+                    ),
+                    get_thumbnail(self.names[0], geometry, **options).name,
+                )
+
+    def test_hot_posts_come_from_memo(self):
+        thumbnails.resolve(self.names)
+        with mock.patch.object(thumbnails, '_stored_names') as stored:
+            thumbnails.resolve(self.names)
+        stored.assert_not_called()
+
+    def test_cards_rendered_from_resolved_urls(self):
+        posts = thumbnails.attach_cards(
+            list(Post.objects.filter(pk__in=[p.pk for p in self.posts]))
+        )
+        response = self.client.get(reverse('posts:index'))
+        for post in posts:
+            self.assertContains(response, f'src="{post.card_url}"')
+
+    def test_card_variants_keep_card_proportions(self):
+        self.assertEqual(
+            thumbnails.card_variant(320, 'WEBP'),
+            ('320x113', {'crop': 'center', 'upscale': True, 'format': 'WEBP'})
+        )
+        self.assertIn(thumbnails.CARD, thumbnails.CARD_VARIANTS[None])
+
+    def test_ready_variants_go_to_srcset(self):
+        post, = thumbnails.attach_cards(
+            [Post.objects.get(pk=self.posts[0].pk)]
+        )
+        for width in thumbnails.CARD_WIDTHS:
+            self.assertIn(f' {width}w', post.card_srcset)
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, f'srcset="{post.card_srcset}"')
+        self.assertContains(response, 'loading="lazy"')
+
+    def test_missing_card_scheduled_original_shown(self):
+        post = Post.objects.create(
+            author=self.user, text='Пост', image=make_image('e.jpg')
+        )
+        with mock.patch.object(thumbnails, 'schedule') as schedule, \
+                mock.patch.object(thumbnails, 'generate') as generate:
+            thumbnails.attach_cards([post])
+            thumbnails.attach_cards([post])
+        schedule.assert_called_once_with(post.image.name)
+        generate.assert_not_called()
+        self.assertEqual(post.card_url, post.image.url)
+        self.assertIsNone(post.card_srcset)
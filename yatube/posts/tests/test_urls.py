@@ -1,5 +1,6 @@
 from http import HTTPStatus
 
+from django.core.cache import cache
 from django.test import TestCase, Client
 from django.urls import reverse
 
@@ -64,6 +65,9 @@ class PostURLTests(TestCase):
         cls.author.force_login(cls.user)
         cls.authorized_client_new.force_login(cls.new_user)
 
+    def setUp(self):
+        cache.clear()
+
     def test_url_at_desired_location_for_any_user(self):
         """Проверка доступности адресов страниц для пользователя"""
         urls_names = [
@@ -8,7 +8,7 @@ from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
 
 from yatube.settings import PAGINATOR_COUNT
-from posts.models import Group, Post, User, Follow
+from posts.models import Comment, Group, Post, User, Follow
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
@@ -86,6 +86,9 @@ class PostsPagesTest(TestCase):
         super().tearDownClass()
         shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
 
+    def setUp(self):
+        cache.clear()
+
     def test_show_correct_context(self):
         Follow.objects.create(user=self.follower, author=self.user)
         urls = [
@@ -124,13 +127,32 @@ class PostsPagesTest(TestCase):
     def test_cache_index_page(self):
         """Тест работы кеша"""
         response_1 = self.authorized.get(INDEX_URL).content
-        Post.objects.all().delete()
+        # Правка в обход сигналов не сдвигает версию ленты — отдаётся кеш.
+        Post.objects.update(text='Текст без сигналов')
         response_2 = self.authorized.get(INDEX_URL).content
         self.assertEqual(response_1, response_2)
         cache.clear()
         response_3 = self.authorized.get(INDEX_URL).content
         self.assertNotEqual(response_1, response_3)
 
+    def test_cache_index_page_invalidated_by_writes(self):
+        """Удаление и публикация поста сразу видны на главной."""
+        self.authorized.get(INDEX_URL)
+        Post.objects.get(pk=self.post.pk).delete()
+        self.assertNotContains(self.authorized.get(INDEX_URL), POST_TEXT)
+        Post.objects.create(author=self.user, text='Новый пост')
+        self.assertContains(self.authorized.get(INDEX_URL), 'Новый пост')
+
+    def test_cache_index_page_keyed_by_page(self):
+        """Разные страницы ленты кешируются отдельно."""
+        Post.objects.bulk_create(
+            Post(author=self.user, text=f'Пост {i}')
+            for i in range(PAGINATOR_COUNT)
+        )
+        first = self.guest.get(INDEX_URL).content
+        second = self.guest.get(INDEX_URL + NEXT_PAGE).content
+        self.assertNotEqual(first, second)
+
     def test_post_is_not_in_group_and_feed(self):
         """
         Пост не отображается в другой группе и не появляется в ленте тех,
@@ -200,3 +222,33 @@ class PaginatorViewsTest(TestCase):
                 self.assertEqual(
                     len(response.context['page_obj']), page_count
                 )
+
+
+class CommentsPaginationTest(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.user = User.objects.create_user(username=USERNAME)
+        cls.post = Post.objects.create(author=cls.user, text=POST_TEXT)
+        Comment.objects.bulk_create(
+            Comment(post=cls.post, author=cls.user, text=f'Комментарий {i}')
+            for i in range(settings.COMMENTS_PAGINATOR_COUNT + OTHER_PAGES)
+        )
+        cls.POST_DETAIL_URL = reverse('posts:post_detail', args=[cls.post.id])
+        cls.COMMENTS_URL = reverse('posts:post_comments', args=[cls.post.id])
+
+    def test_load_more_returns_next_comments(self):
+        """«Показать ещё» отдаёт следующие комментарии без повторов."""
+        first = self.client.get(self.POST_DETAIL_URL).context['comments']
+        self.assertEqual(len(first), settings.COMMENTS_PAGINATOR_COUNT)
+        response = self.client.get(
+            self.COMMENTS_URL, {'after': first.next_cursor}
+        )
+        self.assertTemplateUsed(response, 'posts/includes/comment_list.html')
+        rest = response.context['comments']
+        self.assertEqual(len(rest), OTHER_PAGES)
+        self.assertFalse(rest.has_next())
+        self.assertEqual(
+            list(first) + list(rest),
+            list(self.post.comments.order_by('-created', '-id'))
+        )
@@ -0,0 +1,346 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.dispatch import receiver
+from django.test.signals import setting_changed
+from PIL import features
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import (
+    EMPTY_VALUE, KVStore as CachedDBKVStore
+)
+from sorl.thumbnail.models import KVStore
+
+from . import placeholders
+
+logger = logging.getLogger(__name__)
+
+# Размеры миниатюр, которые выводят шаблоны. Геометрия и опции задают имя
+# файла миниатюры в sorl: поменяли их — миниатюры создадутся заново.
+CARD = ('960x339', {'crop': 'center', 'upscale': True})
+# Ширины карточки для srcset: телефону хватает трети от 960. WebP — если
+# Pillow собран с ним; иначе только в формате исходника.
+CARD_WIDTHS = (320, 640, 960)
+CARD_FORMATS = (None, 'WEBP') if features.check('webp') else (None,)
+# Ширина карточки в вёрстке — для атрибута sizes.
+CARD_SIZES = '(max-width: 960px) 100vw, 960px'
+
+
+def card_variant(width, image_format=None):
+    """Размер карточки шириной width с теми же пропорциями, что у CARD."""
+    geometry, options = CARD
+    card_width, card_height = (int(value) for value in geometry.split('x'))
+    options = dict(options)
+    if image_format:
+        options['format'] = image_format
+    return (f'{width}x{round(card_height * width / card_width)}', options)
+
+
+CARD_VARIANTS = {
+    image_format: [card_variant(width, image_format) for width in CARD_WIDTHS]
+    for image_format in CARD_FORMATS
+}
+SIZES = [CARD] + [
+    size for variants in CARD_VARIANTS.values() for size in variants
+    if size != CARD
+]
+
+# Адреса миниатюр самых частых картинок: имя миниатюры однозначно задано
+# исходником и размером, так что запомненный адрес не устаревает.
+MEMO_SIZE = 1024
+# Через сколько секунд картинку, поставленную в очередь, можно поставить
+# снова: вдруг задача потерялась вместе с откатом транзакции.
+PENDING_TIMEOUT = 60
+
+_executor = None
+_memo = OrderedDict()
+_memo_lock = threading.Lock()
+_pending = {}
+_pending_lock = threading.Lock()
+
+
+def generate(name, measured=False, sizes=None):
+    """
+    Создаёт миниатюры картинки из хранилища: всех размеров или sizes.
+
+    Уже готовые sorl находит в своём хранилище ключей и не пересчитывает.
+    measured — картинка уже разобрана при сохранении (есть image_hash),
+    и проверять, что файл на месте, незачем. Возвращает число размеров,
+    для которых миниатюра есть.
+    """
+    if not name:
+        return 0
+    try:
+        if not measured and not default_storage.exists(name):
+            return 0
+    except SuspiciousFileOperation:
+        # Путь за пределами MEDIA_ROOT: так картинку не показывал и sorl.
+        return 0
+    done = 0
+    for geometry, options in sizes or SIZES:
+        try:
+            get_thumbnail(name, geometry, **options)
+        except Exception:
+            logger.exception('Миниатюра %s для %s не создана', geometry, name)
+        else:
+            done += 1
+    return done
+
+
+def generate_in_process(name):
+    """generate для пулов: закрывает соединения потока с базой ключей sorl."""
+    try:
+        return generate(name)
+    finally:
+        with _pending_lock:
+            _pending.pop(name, None)
+        connections.close_all()
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            thread_name_prefix='thumbnails',
+        )
+    return _executor
+
+
+def shutdown():
+    """Останавливает пул, дождавшись начатых задач; новый создастся сам."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+
+@receiver(setting_changed)
+def thumbnail_settings_changed(setting, **kwargs):
+    # Тесты подменяют MEDIA_ROOT, а потом удаляют его: задачи, начатые
+    # со старым каталогом, должны закончиться до смены настройки.
+    if setting in ('MEDIA_ROOT', 'THUMBNAIL_WORKERS'):
+        shutdown()
+
+
+def schedule(name):
+    """
+    Ставит миниатюры картинки в очередь пула после коммита транзакции.
+
+    Resize в Pillow отпускает GIL, так что потоков хватает; при
+    THUMBNAIL_WORKERS = 0 миниатюры создаются сразу, в этом же потоке.
+    """
+    if not settings.THUMBNAIL_WORKERS:
+        transaction.on_commit(lambda: generate(name))
+        return
+    transaction.on_commit(
+        lambda: executor().submit(generate_in_process, name)
+    )
+
+
+def schedule_missing(names):
+    """Ставит в очередь картинки, у которых не хватает миниатюр, — по разу."""
+    now = time.time()
+    with _pending_lock:
+        names = [
+            name for name in names
+            if _pending.get(name, 0) + PENDING_TIMEOUT <= now
+        ]
+        _pending.update(dict.fromkeys(names, now))
+    for name in names:
+        schedule(name)
+
+
+def thumbnail_name(name, geometry, options):
+    """
+    Имя миниатюры — как его вычисляет sorl, но без обращения к файлам.
+
+    Повторяет закрытые _get_format и _get_thumbnail_filename бэкенда
+    sorl-thumbnail 12.7 (версия закреплена в requirements.txt). Разойдись
+    имена после обновления — каждая выборка промахивалась бы, так что
+    совпадение с get_thumbnail проверяет test_thumbnail_name_matches_sorl.
+    """
+    backend = default.backend
+    options = dict(options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(ImageFile(name)))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    return backend._get_thumbnail_filename(
+        ImageFile(name), geometry, options
+    )
+
+
+def _remember(source, url):
+    with _memo_lock:
+        _memo[source] = url
+        _memo.move_to_end(source)
+        while len(_memo) > MEMO_SIZE:
+            _memo.popitem(last=False)
+
+
+def _recall(source):
+    with _memo_lock:
+        url = _memo.get(source)
+        if url is not None:
+            _memo.move_to_end(source)
+        return url
+
+
+def _stored_names(names):
+    """Какие миниатюры уже есть в хранилище ключей sorl: два запроса на все."""
+    keys = {
+        add_prefix(ImageFile(name, default.storage).key): name
+        for name in names
+    }
+    kvstore = default.kvstore
+    found = {
+        key for key, value in kvstore.cache.get_many(keys).items()
+        if value is not EMPTY_VALUE
+    }
+    missing = [key for key in keys if key not in found]
+    if missing:
+        rows = dict(
+            KVStore.objects.filter(key__in=missing).values_list(
+                'key', 'value'
+            )
+        )
+        kvstore.cache.set_many(rows, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        found.update(rows)
+    return {keys[key] for key in found}
+
+
+def memo_key(name, size):
+    geometry, options = size
+    return name, geometry, options.get('format')
+
+
+def resolve_sizes(images, sizes, measured=(), create=True):
+    """
+    Адреса миниатюр для пачки картинок в нескольких размерах сразу.
+
+    Возвращает по словарю {имя исходника: url или None} на каждый размер.
+    Вместо похода в хранилище ключей на каждый {% thumbnail %} — память
+    процесса, затем один get_many к кешу и один запрос к базе на
+    оставшиеся. Чего нет и там, при create создаётся как раньше, через
+    get_thumbnail (для картинок из measured файл заранее не проверяется),
+    а без create — остаётся None: такие создаст фоновый пул.
+    """
+    names = set(filter(None, images))
+    found = [{} for _ in sizes]
+    pending = {}
+    for index, size in enumerate(sizes):
+        geometry, options = size
+        for name in names:
+            url = _recall(memo_key(name, size))
+            if url is not None:
+                found[index][name] = url
+            else:
+                pending[index, name] = thumbnail_name(name, geometry, options)
+    if not pending:
+        return found
+    stored = (
+        _stored_names(pending.values())
+        if isinstance(default.kvstore, CachedDBKVStore) else set()
+    )
+    for (index, name), thumbnail in pending.items():
+        geometry, options = sizes[index]
+        if thumbnail in stored:
+            url = default.storage.url(thumbnail)
+        elif create and generate(name, name in measured, [sizes[index]]):
+            url = get_thumbnail(name, geometry, **options).url
+        else:
+            found[index][name] = None
+            continue
+        _remember(memo_key(name, sizes[index]), url)
+        found[index][name] = url
+    return found
+
+
+def resolve(images, size=CARD, measured=()):
+    """Адреса миниатюр одного размера: {имя исходника: url или None}."""
+    return resolve_sizes(images, [size], measured)[0]
+
+
+def srcset(urls, sizes, name):
+    """Значение srcset из готовых миниатюр; одной ширины для выбора мало."""
+    candidates = [
+        f'{found[name]} {size[0].split("x")[0]}w'
+        for found, size in zip(urls, sizes) if found.get(name)
+    ]
+    return ', '.join(candidates) if len(candidates) > 1 else None
+
+
+def scaled_size(width, height, size=CARD):
+    """
+    Размеры миниатюры по размерам исходника — так же, как их считает sorl.
+
+    Нужны атрибутам width/height у <img>: браузер резервирует место под
+    картинку до её загрузки, а файл исходника открывать не приходится.
+    """
+    if not width or not height:
+        return None
+    geometry, options = size
+    x, y = (int(value) for value in geometry.split('x'))
+    factors = (x / width, y / height)
+    factor = max(factors) if options.get('crop') else min(factors)
+    if factor < 1 or options.get('upscale'):
+        width, height = round(width * factor), round(height * factor)
+    if options.get('crop'):
+        width, height = min(width, x), min(height, y)
+    return width, height
+
+
+def attach_cards(posts):
+    """
+    Проставляет постам card_url — адрес миниатюры для карточки — и её
+    размеры card_width и card_height, если они известны.
+
+    card_placeholder — размытая заглушка из BlurHash, видна до загрузки.
+    card_srcset и card_webp_srcset — варианты карточки разной ширины для
+    srcset. Недостающие миниатюры, включая саму карточку, создаёт только
+    фоновый пул: запрос не ждёт Pillow, а пул не соревнуется с ним за
+    тот же файл. Пока карточки нет, card_url — адрес исходной картинки.
+    """
+    names = [post.image.name for post in posts]
+    measured = {post.image.name for post in posts if post.image_hash}
+    found = resolve_sizes(names, SIZES, measured, create=False)
+    cards = found[SIZES.index(CARD)]
+    missing = {
+        name for urls in found for name, url in urls.items() if url is None
+    }
+    if missing:
+        schedule_missing(missing)
+    srcsets = {
+        image_format: [found[SIZES.index(size)] for size in sizes]
+        for image_format, sizes in CARD_VARIANTS.items()
+    }
+    for post in posts:
+        name = post.image.name
+        post.card_url = cards.get(name) or (post.image.url if name else None)
+        post.card_width, post.card_height = scaled_size(
+            post.image_width, post.image_height
+        ) or (None, None)
+        post.card_placeholder = placeholders.data_uri(
+            post.image_blurhash, post.image_width, post.image_height
+        )
+        post.card_srcset, post.card_webp_srcset = (
+            srcset(srcsets[image_format], CARD_VARIANTS[image_format], name)
+            if image_format in srcsets else None
+            for image_format in (None, 'WEBP')
+        )
+    return posts
@@ -15,6 +15,11 @@ urlpatterns = [
         views.group_posts,
         name='posts_slug'
     ),
+    path(
+        'tags/<str:name>/',
+        views.tag_posts,
+        name='tag_posts'
+    ),
     path(
         'profile/<str:username>/',
         views.profile,
@@ -25,6 +30,11 @@ urlpatterns = [
         views.post_detail,
         name='post_detail'
     ),
+    path(
+        'posts/<int:post_id>/comments/',
+        views.post_comments,
+        name='post_comments'
+    ),
     path(
         'create/',
         views.post_create,
@@ -40,6 +50,7 @@ urlpatterns = [
         views.add_comment,
         name='add_comment'
     ),
+    path('search/', views.search, name='search'),
     path('follow/', views.follow_index, name='follow_index'),
     path(
         'profile/<str:username>/follow/',
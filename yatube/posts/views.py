@@ -1,27 +1,75 @@
+from urllib.parse import urlencode
+
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
+from django.db.models import QuerySet
+from django.utils.functional import SimpleLazyObject
 from django.shortcuts import get_object_or_404, redirect, render
 
+from . import caching, counts, hashtags, thumbnails
+from .feeds import feed_posts, follow_feed, tag_feed
 from .forms import PostForm, CommentForm
-from .models import Group, Post, User, Follow
-from .paginator import paginator_page
+from .models import Group, Post, Tag, User, Follow
+from .paginator import KeysetPaginator, paginator_page
+from .search import SearchPaginator
+from .stats import user_stats
 
 
+@caching.cache_anonymous_page
 def index(request):
+    caching.tag_page(request, caching.TAG_INDEX)
+    posts = Post.objects.all()
     return render(request, 'posts/index.html', {
-        'page_obj': paginator_page(request, Post.objects.all()),
+        # Страница считается, только если фрагмент ленты не нашёлся в кеше.
+        'page_obj': SimpleLazyObject(lambda: thumbnails.attach_cards(
+            paginator_page(
+                request, feed_posts(posts),
+                counts.FeedCounter(counts.FEED_INDEX, posts)
+            )
+        )),
+        'feed_version': caching.feed_version(caching.FEED_INDEX),
+        'page_key': caching.page_key(request),
+        'cache_timeout': settings.FEED_CACHE_TIMEOUT,
     })
 
 
+@caching.cache_anonymous_page
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
+    caching.tag_page(request, caching.page_tag(caching.TAG_GROUP, group.pk))
     return render(request, 'posts/group_list.html', {
         'group': group,
-        'page_obj': paginator_page(request, group.posts.all())
+        'page_obj': thumbnails.attach_cards(paginator_page(
+            request, feed_posts(group.posts.all()),
+            counts.FeedCounter(counts.FEED_GROUP, group.posts.all(), group.pk)
+        ))
+    })
+
+
+@caching.cache_anonymous_page
+def tag_posts(request, name):
+    tag = get_object_or_404(Tag, name=hashtags.normalize(name))
+    caching.tag_page(
+        request, caching.page_tag(caching.TAG_HASHTAG, tag.name)
+    )
+    return render(request, 'posts/tag_list.html', {
+        'tag': tag,
+        'page_obj': thumbnails.attach_cards(paginator_page(
+            request, tag_feed(tag),
+            counts.TagCounter(tag, tag.post_tags.all())
+        ))
     })
 
 
+@caching.cache_anonymous_page
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username
+    )
+    caching.tag_page(
+        request, caching.page_tag(caching.TAG_PROFILE, author.pk)
+    )
     follow = (
         request.user.is_authenticated
         and request.user.username != username
@@ -30,18 +78,77 @@ def profile(request, username):
             user=request.user).exists())
     return render(request, 'posts/profile.html', {
         'author': author,
-        'page_obj': paginator_page(request, author.posts.all()),
+        'stats': user_stats(author),
+        'page_obj': thumbnails.attach_cards(paginator_page(
+            request, feed_posts(author.posts.all()),
+            counts.FeedCounter(
+                counts.FEED_PROFILE, author.posts.all(), author.pk
+            )
+        )),
         'following': follow
     })
 
 
+def search(request):
+    """Поиск по тексту постов по релевантности, в группе или у автора."""
+    query = request.GET.get('q', '').strip()
+    group = author = None
+    if request.GET.get('group'):
+        group = get_object_or_404(Group, slug=request.GET['group'])
+    if request.GET.get('author'):
+        author = get_object_or_404(User, username=request.GET['author'])
+    return render(request, 'posts/search.html', {
+        'query': query,
+        'group': group,
+        'author': author,
+        'page_obj': thumbnails.attach_cards(SearchPaginator(
+            query, settings.PAGINATOR_COUNT, group, author
+        ).get_page(
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+        )),
+        # Параметры поиска, которые сохраняют ссылки пагинатора.
+        'page_query': urlencode({
+            key: request.GET[key] for key in ('q', 'group', 'author')
+            if request.GET.get(key)
+        }),
+    })
+
+
+def comments_page(request, post):
+    """Страница комментариев поста от новых к старым, с авторами."""
+    return KeysetPaginator(
+        post.comments.select_related('author').only(
+            'id', 'post', 'text', 'created', 'author', 'author__username'
+        ),
+        settings.COMMENTS_PAGINATOR_COUNT,
+    ).get_page(after=request.GET.get('after'))
+
+
+@caching.cache_anonymous_page
 def post_detail(request, post_id):
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), id=post_id
+    )
+    caching.tag_page(request, *caching.post_tags(post, profile=False))
+    thumbnails.attach_cards([post])
     return render(request, 'posts/post_detail.html', {
-        'post': get_object_or_404(Post, id=post_id),
+        'post': post,
+        'author_stats': user_stats(post.author),
+        'comments': comments_page(request, post),
         'form': CommentForm(request.POST or None),
     })
 
 
+def post_comments(request, post_id):
+    """Фрагмент со следующей страницей комментариев для «Показать ещё»."""
+    post = get_object_or_404(Post.objects.only('id'), id=post_id)
+    return render(request, 'posts/includes/comment_list.html', {
+        'post': post,
+        'comments': comments_page(request, post),
+    })
+
+
 @login_required
 def post_create(request):
     form = PostForm(
@@ -54,7 +161,9 @@ def post_create(request):
         })
     post = form.save(commit=False)
     post.author = request.user
-    post.save()
+    # Пост и счётчики профиля (сигналы) сохраняются вместе или никак.
+    with transaction.atomic():
+        post.save()
     return redirect('posts:profile', post.author)
 
 
@@ -69,7 +178,8 @@ def post_edit(request, post_id):
         instance=post,
     )
     if form.is_valid():
-        form.save()
+        with transaction.atomic():
+            form.save()
         return redirect('posts:post_detail', post_id)
     return render(request, 'posts/create_post.html', {
         'form': form, 'is_edit': True, 'post': post
@@ -84,36 +194,44 @@ def add_comment(request, post_id):
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
-        comment.save()
+        with transaction.atomic():
+            comment.save()
     return redirect('posts:post_detail', post_id=post_id)
 
 
 @login_required
 def follow_index(request):
-    post_follow = Post.objects.filter(
-        author__following__user=request.user
+    posts = follow_feed(request.user)
+    counter = (
+        counts.FollowFeedCounter(request.user, posts)
+        if isinstance(posts, QuerySet) else None
     )
     return render(
         request, 'posts/follow.html',
-        {'page_obj': paginator_page(request, post_follow)})
+        {'page_obj': thumbnails.attach_cards(
+            paginator_page(request, posts, counter)
+        )})
 
 
 @login_required
 def profile_follow(request, username):
     if username != request.user.username:
         author = get_object_or_404(User, username=username)
-        Follow.objects.get_or_create(
-            user=request.user,
-            author=author
-        )
+        with transaction.atomic():
+            Follow.objects.get_or_create(
+                user=request.user,
+                author=author
+            )
     return redirect('posts:profile', username=username)
 
 
 @login_required
 def profile_unfollow(request, username):
-    get_object_or_404(
+    follow = get_object_or_404(
         Follow,
         author__username=username,
         user=request.user
-    ).delete()
+    )
+    with transaction.atomic():
+        follow.delete()
     return redirect('posts:profile', username=username)
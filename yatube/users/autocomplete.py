@@ -0,0 +1,278 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+from heapq import heappop, heappush, nsmallest
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.db import connections
+
+User = get_user_model()
+
+# Подсказки имён пользователей по началу имени, от самых читаемых.
+#
+# Основа индекса (Snapshot) — имена, отсортированные без учёта регистра,
+# одной строкой байт с массивом смещений: миллион имён так занимает
+# десятки мегабайт, а не сотни, как список строк. Имена с одним началом
+# лежат подряд, отрезок находится двоичным поиском, а самые читаемые на
+# нём — кучей по максимумам подотрезков из дерева отрезков над числом
+# подписчиков: O(limit · log n), сколько бы имён ни подошло.
+# Новые пользователи попадают в небольшой отсортированный хвост, а основа
+# пересобирается из базы в фоне раз в REBUILD_INTERVAL секунд.
+REBUILD_INTERVAL = 60 * 10
+# Как часто подбирать из базы пользователей, созданных другими процессами.
+SYNC_INTERVAL = 1
+# Хвост длиннее — пора пересобрать основу, не дожидаясь срока.
+TAIL_LIMIT = 10000
+LIMIT = 10
+FIELDS = ('pk', 'username', 'stats__followers')
+# Больше любого символа в именах: конец отрезка имён с началом prefix.
+LAST_CHAR = '\U0010ffff'
+
+
+def fold(name):
+    return name.casefold()
+
+
+class _Column:
+    """Последовательность для bisect: i-й элемент вычисляет функция."""
+
+    def __init__(self, size, item):
+        self.size = size
+        self.item = item
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        return self.item(index)
+
+
+class Snapshot:
+    """
+    Основа индекса из (id, имя, подписчики); меняются только подписчики.
+    """
+
+    def __init__(self, users=()):
+        users = sorted(users, key=lambda user: (fold(user[1]), user[1]))
+        encoded = [username.encode() for _, username, _ in users]
+        self.size = len(users)
+        self.blob = b''.join(encoded)
+        self.offsets = array('I', accumulate(map(len, encoded), initial=0))
+        self.ids = array('I', (pk for pk, _, _ in users))
+        # У пользователя без записи статистики подписчиков None.
+        self.followers = array('I', (count or 0 for _, _, count in users))
+        self.max_id = max(self.ids, default=0)
+        # Позиции, упорядоченные по id: поиск позиции пользователя по id
+        # без словаря на миллион ключей.
+        self.by_id = array(
+            'I', sorted(range(self.size), key=self.ids.__getitem__)
+        )
+        self.keys = _Column(self.size, lambda index: fold(self.name(index)))
+        self._build_tree()
+
+    def name(self, index):
+        return self.blob[
+            self.offsets[index]:self.offsets[index + 1]
+        ].decode()
+
+    def _better(self, first, second):
+        # Больше подписчиков, при равенстве — раньше по алфавиту.
+        followers = self.followers
+        if (followers[first], -first) >= (followers[second], -second):
+            return first
+        return second
+
+    def _build_tree(self):
+        # Дерево отрезков снизу вверх: в узле — позиция максимума.
+        size = self.size
+        tree = self.tree = array('I', bytes(4 * size)) + array(
+            'I', range(size)
+        )
+        for node in range(size - 1, 0, -1):
+            tree[node] = self._better(tree[2 * node], tree[2 * node + 1])
+
+    def _best(self, low, high):
+        """Позиция самого читаемого на отрезке [low, high)."""
+        best = None
+        low += self.size
+        high += self.size
+        while low < high:
+            if low & 1:
+                best = self.tree[low] if best is None else self._better(
+                    best, self.tree[low]
+                )
+                low += 1
+            if high & 1:
+                high -= 1
+                best = self.tree[high] if best is None else self._better(
+                    best, self.tree[high]
+                )
+            low >>= 1
+            high >>= 1
+        return best
+
+    def top(self, prefix, limit):
+        """До limit позиций с началом prefix, от самых читаемых."""
+        low = bisect_left(self.keys, prefix)
+        high = bisect_left(self.keys, prefix + LAST_CHAR, low)
+        heap = []
+
+        def push(low, high):
+            if low < high:
+                best = self._best(low, high)
+                heappush(heap, (-self.followers[best], best, low, high))
+
+        push(low, high)
+        found = []
+        while heap and len(found) < limit:
+            _, best, low, high = heappop(heap)
+            found.append(best)
+            push(low, best)
+            push(best + 1, high)
+        return found
+
+    def position(self, user_id):
+        ids = _Column(self.size, lambda index: self.ids[self.by_id[index]])
+        index = bisect_left(ids, user_id)
+        if index < self.size and ids[index] == user_id:
+            return self.by_id[index]
+        return None
+
+    def set_followers(self, index, count):
+        self.followers[index] = max(count, 0)
+        node = (index + self.size) >> 1
+        while node:
+            self.tree[node] = self._better(
+                self.tree[2 * node], self.tree[2 * node + 1]
+            )
+            node >>= 1
+
+
+class UsernameIndex:
+    """Индекс имён процесса: основа, хвост новых и синхронизация с базой."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Первую основу строит один поток, остальные её ждут.
+        self._first_build = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._snapshot = None
+            # [ключ, имя, id, подписчики] по возрастанию ключа.
+            self._tail = []
+            self._tail_ids = set()
+            self._synced_id = 0
+            self._synced_at = 0
+            self._built_at = 0
+            self._rebuilding = False
+
+    @staticmethod
+    def _load():
+        return Snapshot(
+            User.objects.order_by().values_list(*FIELDS).iterator()
+        )
+
+    def _swap(self, snapshot):
+        with self._lock:
+            self._snapshot = snapshot
+            self._tail = [
+                entry for entry in self._tail if entry[2] > snapshot.max_id
+            ]
+            self._tail_ids = {entry[2] for entry in self._tail}
+            self._synced_id = max(self._synced_id, snapshot.max_id)
+            self._built_at = time.monotonic()
+            self._rebuilding = False
+
+    def _rebuild_in_background(self):
+        try:
+            self._swap(self._load())
+        except Exception:
+            with self._lock:
+                self._rebuilding = False
+            raise
+        finally:
+            connections.close_all()
+
+    def _refresh(self):
+        if self._snapshot is None:
+            # Первые запросы ждут основу: подсказывать пока нечего.
+            with self._first_build:
+                if self._snapshot is None:
+                    self._swap(self._load())
+            return
+        now = time.monotonic()
+        with self._lock:
+            stale = not self._rebuilding and (
+                now - self._built_at > REBUILD_INTERVAL
+                or len(self._tail) > TAIL_LIMIT
+            )
+            if stale:
+                self._rebuilding = True
+        if stale:
+            threading.Thread(
+                target=self._rebuild_in_background, daemon=True
+            ).start()
+        if now - self._synced_at > SYNC_INTERVAL:
+            self._synced_at = now
+            for user in User.objects.filter(
+                pk__gt=self._synced_id
+            ).order_by('pk').values_list(*FIELDS):
+                self.add(*user)
+
+    def add(self, user_id, username, followers=0):
+        """Добавляет пользователя; уже известного — пропускает."""
+        with self._lock:
+            snapshot = self._snapshot
+            if user_id in self._tail_ids or (
+                snapshot is not None and user_id <= snapshot.max_id
+                and snapshot.position(user_id) is not None
+            ):
+                return
+            insort(self._tail, [fold(username), username, user_id,
+                                followers or 0])
+            self._tail_ids.add(user_id)
+            self._synced_id = max(self._synced_id, user_id)
+
+    def shift_followers(self, user_id, delta):
+        with self._lock:
+            for entry in self._tail:
+                if entry[2] == user_id:
+                    entry[3] = max(entry[3] + delta, 0)
+                    return
+            snapshot = self._snapshot
+            index = snapshot and snapshot.position(user_id)
+            if index is not None:
+                snapshot.set_followers(
+                    index, snapshot.followers[index] + delta
+                )
+
+    def search(self, prefix, limit=LIMIT):
+        """До limit пар (имя, подписчики) с началом prefix."""
+        prefix = fold(prefix)
+        if not prefix:
+            return []
+        self._refresh()
+        with self._lock:
+            snapshot = self._snapshot
+            found = [
+                (-snapshot.followers[index], fold(snapshot.name(index)),
+                 snapshot.name(index))
+                for index in snapshot.top(prefix, limit)
+            ]
+            low = bisect_left(self._tail, [prefix])
+            high = bisect_left(self._tail, [prefix + LAST_CHAR], low)
+            found += [
+                (-followers, key, username)
+                for key, username, _, followers in self._tail[low:high]
+            ]
+        return [
+            (username, -followers)
+            for followers, _, username in nsmallest(limit, found)
+        ]
+
+
+index = UsernameIndex()
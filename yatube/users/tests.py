@@ -0,0 +1,112 @@
+import threading
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from posts.models import Follow
+
+from . import autocomplete
+from .autocomplete import Snapshot
+
+User = get_user_model()
+
+AUTOCOMPLETE_URL = reverse('users:autocomplete')
+
+
+class SnapshotTest(SimpleTestCase):
+    def test_top_by_followers_within_prefix(self):
+        snapshot = Snapshot([
+            (1, 'Roman', 3), (2, 'romashka', 7), (3, 'Rosa', 1),
+            (4, 'robert', 3), (5, 'Pekarev', 100), (6, 'rom', None),
+        ])
+        cases = {
+            'rom': ['romashka', 'Roman', 'rom'],
+            'RO': ['romashka', 'robert', 'Roman'],
+            'p': ['Pekarev'],
+            'x': [],
+        }
+        for prefix, names in cases.items():
+            with self.subTest(prefix=prefix):
+                self.assertEqual(
+                    [snapshot.name(index) for index in snapshot.top(
+                        autocomplete.fold(prefix), 3
+                    )],
+                    names,
+                )
+        snapshot.set_followers(snapshot.position(6), 10)
+        self.assertEqual(snapshot.name(snapshot.top('ro', 1)[0]), 'rom')
+
+
+class UsernameIndexTest(SimpleTestCase):
+    def test_first_snapshot_is_built_once(self):
+        index = autocomplete.UsernameIndex()
+        builds = []
+
+        def load():
+            builds.append(1)
+            time.sleep(0.05)
+            return Snapshot([(1, 'Roman', 0)])
+
+        threads = [
+            threading.Thread(target=index.search, args=['rom'])
+            for _ in range(4)
+        ]
+        with mock.patch.object(index, '_load', load), \
+                mock.patch.object(autocomplete, 'SYNC_INTERVAL', float('inf')):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(index.search('rom'), [('Roman', 0)])
+        self.assertEqual(len(builds), 1)
+
+
+class AutocompleteTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        autocomplete.index.clear()
+
+    def suggest(self, prefix):
+        response = self.client.get(AUTOCOMPLETE_URL, {'q': prefix})
+        return [
+            (user['username'], user['followers'])
+            for user in response.json()['results']
+        ]
+
+    def test_ranked_by_followers_and_follows_are_tracked(self):
+        roman = User.objects.create_user(username='Roman')
+        romashka = User.objects.create_user(username='romashka')
+        reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=reader, author=romashka)
+        self.assertEqual(
+            self.suggest('ROM'), [('romashka', 1), ('Roman', 0)]
+        )
+        Follow.objects.create(user=reader, author=roman)
+        Follow.objects.create(user=romashka, author=roman)
+        Follow.objects.filter(author=romashka).delete()
+        self.assertEqual(
+            self.suggest('rom'), [('Roman', 2), ('romashka', 0)]
+        )
+        self.assertEqual(self.suggest(''), [])
+        response = self.client.get(AUTOCOMPLETE_URL, {'q': 'Rom'})
+        self.assertEqual(
+            response.json()['results'][0]['url'],
+            reverse('posts:profile', args=['Roman']),
+        )
+
+    def test_new_users_are_found(self):
+        User.objects.create_user(username='Roman')
+        self.suggest('r')
+        self.client.post(reverse('users:signup'), {
+            'username': 'Romeo',
+            'password1': 'Veryl0ngPassw0rd',
+            'password2': 'Veryl0ngPassw0rd',
+        })
+        self.assertEqual(
+            [username for username, _ in self.suggest('ro')],
+            ['Roman', 'Romeo'],
+        )
@@ -23,6 +23,11 @@ urlpatterns = [
         views.SignUp.as_view(),
         name='signup'
     ),
+    path(
+        'autocomplete/',
+        views.suggest_usernames,
+        name='autocomplete'
+    ),
     path(
         'login/',
         LoginView.as_view(
@@ -1,6 +1,8 @@
+from django.http import JsonResponse
+from django.urls import reverse, reverse_lazy
 from django.views.generic import CreateView
-from django.urls import reverse_lazy
 
+from . import autocomplete
 from .forms import CreationForm
 
 
@@ -9,3 +11,24 @@ class SignUp(CreateView):
     # После успешной регистрации перенаправляем пользователя на главную.
     success_url = reverse_lazy('posts:index')
     template_name = 'users/signup.html'
+
+    def form_valid(self, form):
+        response = super().form_valid(form)
+        # Имя сразу попадает в подсказки этого процесса, остальные
+        # подберут его из базы.
+        autocomplete.index.add(self.object.pk, self.object.username)
+        return response
+
+
+def suggest_usernames(request):
+    """Подсказки имён по началу, от самых читаемых: JSON для поля ввода."""
+    return JsonResponse({'results': [
+        {
+            'username': username,
+            'followers': followers,
+            'url': reverse('posts:profile', args=[username]),
+        }
+        for username, followers in autocomplete.index.search(
+            request.GET.get('q', '').strip()
+        )
+    ]})
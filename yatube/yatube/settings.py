@@ -12,12 +12,23 @@ SECRET_KEY = '4fr7zddy!wgw-usj7k4tx(jq6!fb2fim15=f5=fstja7!s^ra@'
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
+# Один файл на все процессы: версии лент, счётчики и фрагменты общие,
+# а сброс кеша виден всем воркерам. Перед файлом — LRU процесса.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            'LOCAL_MAX_ENTRIES': 1000,
+            'LOCAL_TIMEOUT': 1,
+        },
     }
 }
 
+# Тесты держат кеш во временном файле, см. core.test_runner.
+TEST_RUNNER = 'core.test_runner.TestRunner'
+
 ALLOWED_HOSTS = [
     'localhost',
     '127.0.0.1',
@@ -26,6 +37,29 @@ ALLOWED_HOSTS = [
 ]
 
 PAGINATOR_COUNT = 10
+COMMENTS_PAGINATOR_COUNT = 20
+# 'pages' — нумерованные страницы (?page=N), 'keyset' — курсоры по
+# (pub_date, id) без COUNT(*) и OFFSET (?after=... / ?before=...).
+PAGINATOR_MODE = 'pages'
+# Ленты ('index', 'group', 'profile', 'follow'), для которых пагинатор
+# считает точный COUNT(*); True — для всех. Остальные берут число постов
+# из кеша, который сдвигается при публикации и удалении.
+PAGINATOR_EXACT_COUNTS = ()
+FEED_COUNT_TIMEOUT = 60 * 60 * 24
+# Фрагменты лент кешируются по версии ленты, которая сдвигается при каждом
+# изменении постов, поэтому срок жизни может быть долгим.
+FEED_CACHE_TIMEOUT = 60 * 60 * 24
+# Страницы для гостей сбрасываются сигналами, см. posts.caching.
+PAGE_CACHE_TIMEOUT = 60 * 60
+
+# Движок ленты подписок: 'join' — JOIN по Follow при каждом запросе,
+# 'fanout' — материализованная лента (запись при публикации),
+# 'merge' — слияние кешированных лент авторов при чтении.
+FOLLOW_FEED_ENGINE = 'fanout'
+# Сколько последних постов хранится в материализованной ленте подписок.
+TIMELINE_LENGTH = 1000
+# Сколько последних постов автора держится в кеше для движка 'merge'.
+AUTHOR_TIMELINE_LENGTH = 200
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
@@ -141,3 +175,19 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Поиск по постам: 'fts5' — индекс SQLite, 'index' — свой обратный индекс
+# в SEARCH_INDEX_DIR (для баз без FTS5), 'auto' — FTS5, если он есть.
+SEARCH_BACKEND = 'auto'
+SEARCH_INDEX_DIR = os.path.join(BASE_DIR, 'search_index')
+
+# Потоки, создающие миниатюры загруженных картинок; 0 — сразу в запросе.
+THUMBNAIL_WORKERS = 4
+
+# Загрузки крупнее этого пишутся во временный файл, а не держатся в памяти.
+FILE_UPLOAD_MAX_MEMORY_SIZE = 256 * 1024
+# Обработка загруженных картинок, см. posts.images.normalize_upload.
+IMAGE_MAX_SIDE = 2048
+IMAGE_BYTES_BUDGET = 400 * 1024
+IMAGE_MIN_QUALITY = 50
+IMAGE_MAX_QUALITY = 85